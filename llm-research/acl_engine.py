@@ -0,0 +1,162 @@
+#Set algebra ACL engine
+# instead of checking every (user, resource, action) against every rule, each rule
+# filters the users that pass its subCond and the resources that pass its resCond on their own,
+# then joins the two lists through its constraints and only emits its own actions.
+# The result is exactly the set of triples where Rule.evaluate returns True.
+
+from attribute_values import SET_TYPES
+from rule import compile_condition, compile_constraint
+
+
+def matching_entities(conds, entities):
+    """
+    Filter users or resources on a list of subject/resource conditions.
+
+    Args:
+        conds (list): (attr, op, value) tuples, rule.sub_cond or rule.res_cond
+        entities (dict): id -> User or id -> Resource
+
+    Returns:
+        list: (id, entity) pairs that pass every condition
+    """
+    checks = [compile_condition(attr, op, value) for attr, op, value in conds]
+    if not checks:
+        return list(entities.items())
+
+    matched = []
+    for eid, entity in entities.items():
+        attributes = entity.attributes
+        if all(check(attributes) for check in checks):
+            matched.append((eid, entity))
+    return matched
+
+
+def hash_key(value):
+    # sets are compared by content with "=", so they are hashed as frozensets
+    if isinstance(value, set):
+        return frozenset(value)
+    return value
+
+
+def join_equal(users, resources, left_attr, right_attr):
+    # hash join for "user_attr = resource_attr"
+    table = {}
+    for rid, resource in resources:
+        res_val = resource.attributes.get(right_attr)
+        if res_val is not None:
+            table.setdefault(hash_key(res_val), []).append((rid, resource))
+
+    for uid, user in users:
+        user_val = user.attributes.get(left_attr)
+        if user_val is None:
+            continue
+        for rid, resource in table.get(hash_key(user_val), ()):
+            yield uid, user, rid, resource
+
+
+def join_user_contains(users, resources, left_attr, right_attr):
+    # "user_attr ] resource_attr": the resource value must be an element of the user's set
+    table = {}
+    for rid, resource in resources:
+        res_val = resource.attributes.get(right_attr)
+        # a set valued resource attribute is never an element of a set of strings
+        if res_val is not None and not isinstance(res_val, SET_TYPES):
+            table.setdefault(res_val, []).append((rid, resource))
+
+    for uid, user in users:
+        user_val = user.attributes.get(left_attr)
+        if not isinstance(user_val, SET_TYPES):
+            continue
+        for element in user_val:
+            for rid, resource in table.get(element, ()):
+                yield uid, user, rid, resource
+
+
+def join_resource_contains(users, resources, left_attr, right_attr):
+    # "user_attr [ resource_attr": the user value must be an element of the resource's set
+    inverted = {}
+    for rid, resource in resources:
+        res_val = resource.attributes.get(right_attr)
+        if isinstance(res_val, SET_TYPES):
+            for element in res_val:
+                inverted.setdefault(element, []).append((rid, resource))
+
+    for uid, user in users:
+        user_val = user.attributes.get(left_attr)
+        if user_val is None or isinstance(user_val, SET_TYPES):
+            continue
+        for rid, resource in inverted.get(user_val, ()):
+            yield uid, user, rid, resource
+
+
+def join_all(users, resources):
+    # no usable constraint, every pair goes through
+    for uid, user in users:
+        for rid, resource in resources:
+            yield uid, user, rid, resource
+
+
+JOINS = {
+    "=": join_equal,
+    "]": join_user_contains,
+    "[": join_resource_contains,
+}
+
+
+def rule_pairs(rule, user_mgr, res_mgr):
+    """
+    Every (uid, rid) pair the rule grants its actions on.
+
+    Args:
+        rule (Rule): rule to evaluate
+        user_mgr (UserManager): holds the users
+        res_mgr (ResourceManager): holds the resources
+
+    Returns:
+        list: (uid, rid) tuples
+    """
+    if not rule.acts:
+        return []
+
+    users = matching_entities(rule.sub_cond, user_mgr.users)
+    if not users:
+        return []
+    resources = matching_entities(rule.res_cond, res_mgr.resources)
+    if not resources:
+        return []
+
+    # join on the first constraint, the others are checked on the joined pairs
+    if rule.cons and rule.cons[0][1] in JOINS:
+        left_attr, op, right_attr = rule.cons[0]
+        joined = JOINS[op](users, resources, left_attr, right_attr)
+        rest = rule.cons[1:]
+    else:
+        joined = join_all(users, resources)
+        rest = rule.cons
+
+    checks = [compile_constraint(left, op, right) for left, op, right in rest]
+    pairs = []
+    for uid, user, rid, resource in joined:
+        user_attrs = user.attributes
+        res_attrs = resource.attributes
+        if all(check(user_attrs, res_attrs) for check in checks):
+            pairs.append((uid, rid))
+    return pairs
+
+
+def rule_permissions(rule, user_mgr, res_mgr):
+    """
+    Every (uid, rid, action) triple granted by one rule.
+
+    Args:
+        rule (Rule): rule to evaluate
+        user_mgr (UserManager): holds the users
+        res_mgr (ResourceManager): holds the resources
+
+    Returns:
+        generator: (uid, rid, action) tuples
+    """
+    pairs = rule_pairs(rule, user_mgr, res_mgr)
+    for action in rule.acts:
+        for uid, rid in pairs:
+            yield uid, rid, action
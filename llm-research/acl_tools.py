@@ -1,95 +1,214 @@
+import instrumentation
+from acl_writer import DEFAULT_MEMORY_LIMIT, line_order, open_text, write_sorted_acl
+from sharding import evaluate_policy, stream_permissions
+
 #function to traverse a file (ACL files) and store lines in a set to compare
+# (.gz ACL files are read as well)
 def file_to_set(file_name):
     
     lines =  set()
 
-    with open (file_name, "r", encoding="utf-8") as f:
+    with open_text(file_name) as f:
         for line in f:
             lines.add(line.strip())
     return lines
 
-def compare_acl (acl1, acl2):
+class ACL:
+    """
+    In memory ACL, a set of "<uid>, <rid>, <action>" lines.
+    Built from a policy (build_acl) or loaded from an ACL file, written to disk only when asked.
 
-    acl1 = file_to_set(acl1)
-    acl2 = file_to_set(acl2)
+    Args:
+        lines (iterable): ACL lines
+    """
 
-    common = acl1 & acl2
-    only_in_acl1  = acl1 - acl2
-    only_in_acl2  = acl2 - acl1
+    def __init__(self, lines=()):
+        self.lines = set(lines)
 
-    lines = []
-    lines.append(f"Commong lines / Lines that are correct: {len(common)}")
-    lines.extend(sorted(common))
-    lines.append("")
-    lines.append(f"Only in ground truth ACL (under permissions): {len(only_in_acl1)}")
-    lines.extend(sorted(only_in_acl1))
-    lines.append("")
-    lines.append(f"Only in LLM ACL (over permissions): {len(only_in_acl2)}")
-    lines.extend(sorted(only_in_acl2))
-    lines.append("")
-    lines.append(f"Total different lines: {len(only_in_acl1 ^ only_in_acl2)}")
+    @classmethod
+    def from_file(cls, file_name):
+        return cls(file_to_set(file_name))
 
-    #if there is a 100% match then lists that have unique ACL line will return true
-    complete_match = False
-    if((len(acl1) == 0 and len(only_in_acl2) == 0) and (len(acl1) == len(acl2))):
-        complete_match = True
+    @classmethod
+    def from_permissions(cls, permissions):
+        """
+        Args:
+            permissions (iterable): (uid, rid, action) tuples
+        """
+        return cls(f"{uid}, {rid}, {action}" for uid, rid, action in permissions)
 
-    return lines, complete_match
+    def __len__(self):
+        return len(self.lines)
 
+    def __contains__(self, line):
+        return line in self.lines
 
-#Snipets of code taken from core.myabac generate_heatmap_data
+    def __iter__(self):
+        return iter(self.lines)
 
-def generate_acl(user_mgr, res_mgr, rule_mgr, output_file):
+    def write(self, file_name):
+        # sorted like acl_writer writes, so the same ACL always gives the same file
+        with open_text(file_name, "w") as f:
+            for line in sorted(self.lines, key=line_order):
+                f.write(line +"\n")
 
-    #Arguements should be the return data structures of core.myabac parse_abac_file
+    def compare(self, other):
+        """
+        Compare this (ground truth) ACL with another (LLM) ACL.
+
+        Returns:
+            ACLComparison: the differences
+        """
+        return ACLComparison(self.lines, other.lines)
+
+
+class ACLComparison:
+    """
+    Result of comparing a ground truth ACL with an LLM ACL.
+
+    common: lines in both
+    under: lines only in the ground truth ACL (under permissions)
+    over: lines only in the LLM ACL (over permissions)
+    """
+
+    def __init__(self, gt_lines, llm_lines):
+        self.common = gt_lines & llm_lines
+        self.under = gt_lines - llm_lines
+        self.over = llm_lines - gt_lines
+        self.gt_size = len(gt_lines)
+        self.llm_size = len(llm_lines)
+
+    @property
+    def complete_match(self):
+        #if there is a 100% match then no line is unique to either ACL
+        return not self.under and not self.over
+
+    def counts(self):
+        """
+        Returns:
+            dict: sizes of both ACLs and of every part of the comparison
+        """
+        return {
+            "gt": self.gt_size,
+            "llm": self.llm_size,
+            "correct": len(self.common),
+            "under": len(self.under),
+            "over": len(self.over),
+            "different": len(self.under) + len(self.over),
+        }
+
+    def report_lines(self):
+        """
+        Returns:
+            list: text report of the comparison, as written to the session comparison file
+        """
+        lines = []
+        lines.append(f"Commong lines / Lines that are correct: {len(self.common)}")
+        lines.extend(sorted(self.common))
+        lines.append("")
+        lines.append(f"Only in ground truth ACL (under permissions): {len(self.under)}")
+        lines.extend(sorted(self.under))
+        lines.append("")
+        lines.append(f"Only in LLM ACL (over permissions): {len(self.over)}")
+        lines.extend(sorted(self.over))
+        lines.append("")
+        lines.append(f"Total different lines: {len(self.under) + len(self.over)}")
+        return lines
+
+
+def as_acl(acl):
+    # ACL files are loaded, ACL objects are used as they are
+    if isinstance(acl, ACL):
+        return acl
+    return ACL.from_file(acl)
+
+
+def compare_acl (acl1, acl2):
+    """
+    Compare the ground truth ACL (acl1) with the LLM ACL (acl2).
+
+    Args:
+        acl1 (ACL or str): ground truth ACL or the path of its file
+        acl2 (ACL or str): LLM ACL or the path of its file
+
+    Returns:
+        list, bool, dict: report lines, True on a complete match, counts (see ACLComparison.counts)
     """
-    Perform rule analysis and produce a heatmap  
+    comparison = as_acl(acl1).compare(as_acl(acl2))
+
+    return comparison.report_lines(), comparison.complete_match, comparison.counts()
+
+
+def build_acl(user_mgr, res_mgr, rule_mgr, evaluation=None, workers=1, rule_cache=None, data_key=None):
+    """
+    Generate the ACL of a policy in memory.
 
     Arguments:
         user_mgr (UserManager): Manages users and their attributes.
         res_mgr (ResourceManager): Manages resources and their attributes.
         rule_mgr (RuleManager): Manages rules for authorization.
+        evaluation (PolicyEvaluation or PermissionTensor): already evaluated policy, built here if not given
+        workers (int): worker processes to build the evaluation with (see sharding)
+        rule_cache (RulePermissionCache): optional, reuse the permissions of rules evaluated in earlier iterations
+        data_key: identifies the users/resources (e.g. sha256 of the attribute data file), needed with a rule_cache
 
     Returns:
-        None
-        Creates a .txt file with the ACL of the corresponding file
+        ACL: every permission granted by the policy
     """
-    all_actions = set()
-    seen  = set()
-    #access all the actions in rule.mngr
-    for rule in rule_mgr.rules:
-        all_actions.update(rule.acts)
+    # Each rule only grants its own acts to the users and resources that pass its conditions,
+    # the evaluation filters both sides per rule and joins them through the constraints
+    # instead of checking every uid x rid x action against every rule
+    with instrumentation.phase("build_acl"):
+        if rule_cache is not None:
+            permissions = rule_cache.permissions(user_mgr, res_mgr, rule_mgr, data_key)
+        else:
+            if evaluation is None:
+                evaluation = evaluate_policy(user_mgr, res_mgr, rule_mgr, workers)
+            permissions = evaluation.permissions()
 
-    # print (all_actions)
-    i = 0
-    # Prepare attribute mappings and rule coverage
-    for rule_idx, rule in enumerate(rule_mgr.rules):
-        rule_attributes = rule.get_attributes()
+        return ACL.from_permissions(permissions)
 
-        # Evaluate rule over all users and resources
-        # Nested loops
-        # check every uid in user_mngr
-        #   against every rid in rid_manager
-        #       against every action in rule_mngr ()
-        for uid, user in user_mgr.users.items():
-            for rid, resource in res_mgr.resources.items():
-                for action in all_actions:
-                    if rule.evaluate(user, resource, action) :
-                        temp_string = (f"{uid}, {rid}, {action}")
 
-                        if temp_string not in seen:
-                            seen.add(temp_string)
-                            i += 1
-                            # print(f"{i}. {temp_string} ")
+#Snipets of code taken from core.myabac generate_heatmap_data
+
+def generate_acl(user_mgr, res_mgr, rule_mgr, output_file, evaluation=None, workers=1, rule_cache=None,
+                 memory_limit=DEFAULT_MEMORY_LIMIT, data_key=None):
 
-    with open(output_file, "w", encoding="utf-8") as f:
-        for line in seen:
-            f.write(line +"\n")
 
+    #Arguements should be the return data structures of core.myabac parse_abac_file
+    """
+    Generate the ACL of a policy and write it to a file.
+    The permissions are streamed into the file (see acl_writer) instead of being collected as an ACL
+    in memory: the file is sorted, without duplicates, and gzipped when its name ends in .gz.
+    Without an evaluation the rules are joined one at a time and their grants go straight to the
+    writer, so memory_limit bounds what is kept (plus the pairs of the rule being written).
 
-    print(f"permission Count {i}")
+    Arguments:
+        user_mgr (UserManager): Manages users and their attributes.
+        res_mgr (ResourceManager): Manages resources and their attributes.
+        rule_mgr (RuleManager): Manages rules for authorization.
+        evaluation (PolicyEvaluation or PermissionTensor): already evaluated policy, its permissions are written
+        workers (int): worker processes joining the rules (see sharding.stream_permissions)
+        rule_cache (RulePermissionCache): optional, reuse the permissions of rules evaluated in earlier iterations
+        data_key: identifies the users/resources (e.g. sha256 of the attribute data file), needed with a rule_cache
+        memory_limit (int): bytes of permissions kept in memory before sorted runs are spilled to disk
 
-    return
+    Returns:
+        int: number of permissions written
+        Creates a .txt file with the ACL of the corresponding file
+    """
+    with instrumentation.phase("generate_acl"):
+        if rule_cache is not None:
+            # the per rule sets are cached anyway, their union is left to the writer
+            permissions = (permission for rule in rule_mgr.rules
+                           for permission in rule_cache.rule_permissions(rule, user_mgr, res_mgr, data_key))
+        elif evaluation is not None:
+            permissions = evaluation.permissions()
+        else:
+            permissions = stream_permissions(user_mgr, res_mgr, rule_mgr, workers)
 
+        count = write_sorted_acl(permissions, output_file, user_mgr, res_mgr, rule_mgr, memory_limit)
 
+    print(f"permission Count {count}")
 
+    return count
@@ -0,0 +1,257 @@
+#Streaming ACL writer
+# Permissions are not kept as "<uid>, <rid>, <action>" strings: every (user, resource, action) is
+# encoded as one integer from the positions of the ids in their sorted lists, so sorting the codes
+# sorts the permissions by user, then resource, then action. Codes are collected in a fixed size
+# buffer (8 bytes each), which is sorted, deduplicated and spilled to a run file on disk when full.
+# On close the runs are merged into the ACL file, sorted and without duplicates, so the same policy
+# always gives the same file. Files ending in .gz are written (and read, see open_text) gzipped.
+
+import gzip
+import heapq
+import os
+import shutil
+import tempfile
+from array import array
+
+import numpy as np
+
+# bytes of codes kept in memory before a sorted run is spilled to disk
+DEFAULT_MEMORY_LIMIT = 64 << 20
+# codes read from every run file at a time during the merge
+MERGE_BLOCK = 1 << 16
+# run files merged at once, more runs are first merged into bigger ones
+MAX_MERGE_RUNS = 64
+# smallest run, tinier ones cost more in files than they save in memory
+MIN_RUN_CODES = 1024
+
+
+def line_order(line):
+    """
+    Sort key of ACL lines: user, then resource, then action, the order ACLWriter writes in. Plain
+    string order differs for ids with characters sorting before "," (e.g. "a+" and "a").
+    """
+    return line.split(", ")
+
+
+def open_text(file_name, mode="r"):
+    """
+    Open a text file, gzipped when the name ends in .gz.
+    """
+    if file_name.endswith(".gz"):
+        return gzip.open(file_name, mode + "t", encoding="utf-8")
+    return open(file_name, mode, encoding="utf-8")
+
+
+class ACLWriter:
+    """
+    Writes a sorted, deduplicated ACL file from permissions given in any order.
+
+    Args:
+        output_file (str): ACL file, gzipped when it ends in .gz (or compress is True)
+        user_ids (iterable): every uid a permission can name
+        resource_ids (iterable): every rid a permission can name
+        actions (iterable): every action a permission can name
+        memory_limit (int): bytes of buffered permissions before a run is spilled to disk
+        compress (bool): gzip the output, by default only for .gz files
+        tmp_dir (str): where the run files go, the system temp folder by default
+    """
+
+    def __init__(self, output_file, user_ids, resource_ids, actions, memory_limit=DEFAULT_MEMORY_LIMIT,
+                 compress=None, tmp_dir=None):
+        self.output_file = output_file
+        self.compress = output_file.endswith(".gz") if compress is None else compress
+        self.user_ids = sorted(set(user_ids))
+        self.resource_ids = sorted(set(resource_ids))
+        self.actions = sorted(set(actions))
+
+        self.user_pos = {uid: pos for pos, uid in enumerate(self.user_ids)}
+        self.resource_pos = {rid: pos for pos, rid in enumerate(self.resource_ids)}
+        self.action_pos = {action: pos for pos, action in enumerate(self.actions)}
+        self.num_resources = len(self.resource_ids)
+        self.num_actions = len(self.actions)
+        if len(self.user_ids) * self.num_resources * self.num_actions >= 1 << 64:
+            raise ValueError("too many users x resources x actions to encode a permission in 64 bits")
+
+        self.max_buffered = max(MIN_RUN_CODES, memory_limit // 8)
+        self.buffer = array("Q")
+        self.tmp_dir = tmp_dir
+        self.run_dir = None
+        self.runs = []
+        self.run_number = 0
+        # permissions written, known once the writer is closed
+        self.count = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+        return False
+
+    def add(self, uid, rid, action):
+        code = (self.user_pos[uid] * self.num_resources + self.resource_pos[rid]) * self.num_actions
+        self.buffer.append(code + self.action_pos[action])
+        if len(self.buffer) >= self.max_buffered:
+            self.spill()
+
+    def add_many(self, permissions):
+        """
+        Args:
+            permissions (iterable): (uid, rid, action) tuples, duplicates are fine
+        """
+        # add() inlined, this loop runs once per permission
+        user_pos, resource_pos, action_pos = self.user_pos, self.resource_pos, self.action_pos
+        num_resources, num_actions, max_buffered = self.num_resources, self.num_actions, self.max_buffered
+        buffer = self.buffer
+        for uid, rid, action in permissions:
+            buffer.append((user_pos[uid] * num_resources + resource_pos[rid]) * num_actions + action_pos[action])
+            if len(buffer) >= max_buffered:
+                self.spill()
+                buffer = self.buffer
+
+    def sorted_buffer(self):
+        codes = np.unique(np.array(self.buffer, dtype=np.uint64))
+        self.buffer = array("Q")
+        return codes
+
+    def new_run_file(self):
+        if self.run_dir is None:
+            self.run_dir = tempfile.mkdtemp(prefix="acl-runs-", dir=self.tmp_dir)
+        self.run_number += 1
+        return os.path.join(self.run_dir, f"run-{self.run_number}.bin")
+
+    def spill(self):
+        """
+        Write the buffered codes to a new run file, sorted and deduplicated.
+        """
+        if not self.buffer:
+            return
+        run_file = self.new_run_file()
+        self.sorted_buffer().tofile(run_file)
+        self.runs.append(run_file)
+
+    def read_run(self, run_file):
+        with open(run_file, "rb") as f:
+            while True:
+                block = np.fromfile(f, dtype=np.uint64, count=MERGE_BLOCK)
+                if not block.size:
+                    return
+                yield from block.tolist()
+
+    def merge_runs(self, run_files):
+        """
+        Merge run files into one, sorted and deduplicated.
+        """
+        run_file = self.new_run_file()
+        with open(run_file, "wb") as f:
+            block = array("Q")
+            last = None
+            for code in heapq.merge(*(self.read_run(name) for name in run_files)):
+                if code != last:
+                    block.append(code)
+                    last = code
+                    if len(block) >= MERGE_BLOCK:
+                        block.tofile(f)
+                        block = array("Q")
+            block.tofile(f)
+        for name in run_files:
+            os.remove(name)
+        return run_file
+
+    def merged_blocks(self):
+        """
+        Yield every code once, in order, as blocks (numpy arrays) of at most MERGE_BLOCK codes.
+        """
+        # a single in memory run needs no merge
+        if not self.runs:
+            codes = self.sorted_buffer()
+            for start in range(0, len(codes), MERGE_BLOCK):
+                yield codes[start:start + MERGE_BLOCK]
+            return
+
+        self.spill()
+        while len(self.runs) > MAX_MERGE_RUNS:
+            self.runs = self.runs[MAX_MERGE_RUNS:] + [self.merge_runs(self.runs[:MAX_MERGE_RUNS])]
+
+        block = array("Q")
+        last = None
+        for code in heapq.merge(*(self.read_run(run_file) for run_file in self.runs)):
+            # runs are deduplicated on their own, the same code can still be in several
+            if code != last:
+                block.append(code)
+                last = code
+                if len(block) >= MERGE_BLOCK:
+                    yield np.array(block, dtype=np.uint64)
+                    block = array("Q")
+        if block:
+            yield np.array(block, dtype=np.uint64)
+
+    def close(self):
+        """
+        Merge everything into the output file.
+
+        Returns:
+            int: number of permissions written
+        """
+        if self.count is not None:
+            return self.count
+
+        user_ids, resource_ids, actions = self.user_ids, self.resource_ids, self.actions
+        per_user = np.uint64(self.num_resources * self.num_actions)
+        num_actions = np.uint64(self.num_actions)
+        num_resources = np.uint64(self.num_resources)
+        count = 0
+        try:
+            opener = gzip.open if self.compress else open
+            with opener(self.output_file, "wt", encoding="utf-8") as f:
+                for codes in self.merged_blocks():
+                    # decode a whole block at once, only the lines are built one by one
+                    users = (codes // per_user).tolist()
+                    resources = (codes // num_actions % num_resources).tolist()
+                    acts = (codes % num_actions).tolist()
+                    f.writelines([f"{user_ids[user]}, {resource_ids[resource]}, {actions[action]}\n"
+                                  for user, resource, action in zip(users, resources, acts)])
+                    count += len(users)
+        finally:
+            self.discard()
+        self.count = count
+        return count
+
+    def discard(self):
+        """
+        Drop the buffer and the run files.
+        """
+        self.buffer = array("Q")
+        if self.run_dir is not None:
+            shutil.rmtree(self.run_dir, ignore_errors=True)
+            self.run_dir = None
+        self.runs = []
+
+
+def write_sorted_acl(permissions, output_file, user_mgr, res_mgr, rule_mgr, memory_limit=DEFAULT_MEMORY_LIMIT,
+                     compress=None):
+    """
+    Stream the permissions of a policy into a sorted, deduplicated ACL file.
+
+    Args:
+        permissions (iterable): (uid, rid, action) tuples
+        output_file (str): ACL file, gzipped when it ends in .gz
+        user_mgr (UserManager): users of the policy
+        res_mgr (ResourceManager): resources of the policy
+        rule_mgr (RuleManager): rules of the policy, their actions are the ones that can be granted
+        memory_limit (int): bytes of buffered permissions before a run is spilled to disk
+        compress (bool): gzip the output, by default only for .gz files
+
+    Returns:
+        int: number of permissions written
+    """
+    actions = set()
+    for rule in rule_mgr.rules:
+        actions.update(rule.acts)
+
+    with ACLWriter(output_file, user_mgr.users, res_mgr.resources, actions, memory_limit, compress) as writer:
+        writer.add_many(permissions)
+    return writer.count
@@ -1,17 +1,19 @@
 ##API CALL ON GEMINI-2.0-flash
-import json
-import requests
-from helper_functions import read_entire_file, iterate_api_requests
+from api_functions.llm_client import GEMINI_MODEL, shared_client
+from helper_functions import iterate_api_requests
 
-def gemini_api(gt_acl_file, attribute_data_file, attribute_data_description_file, max_num_it):
+def gemini_api(gt_acl_file, attribute_data_file, attribute_data_description_file, max_num_it, workspace=None, response_cache=None, candidates=1):
 
     #Parameters
         # gt_acl_file: the acl file to feed to the LLM
         # llm_abac_policy_file: file with all user and resource information
         # attribute_despolicy_description_fileription_file the description of the attributes listed above.
+        # workspace: SessionWorkspace the session files go to (llm-research/session if None)
+        # response_cache: ResponseCache answering prompts already sent to the model (optional)
+        # candidates: rule sets requested in parallel per iteration, the best one is kept
 
     #generate the prompt, calls a helper function to combine all the text files into one.
-    iterate_api_requests(gt_acl_file, attribute_data_file, attribute_data_description_file,  gemini_api_call, max_num_it)
+    iterate_api_requests(gt_acl_file, attribute_data_file, attribute_data_description_file,  gemini_api_call, max_num_it, workspace, response_cache, GEMINI_MODEL, candidates)
     return
    
 def gemini_api_call(request_text):
@@ -20,8 +22,9 @@ def gemini_api_call(request_text):
     
     print("CALLLING GEMINI API..")
 
+    # the client (connection pool + key) is made once and shared by every session
     try:
-        gemini_key = read_entire_file(key_file)
+        client = shared_client(key_file)
 
     except FileNotFoundError as e:
         print(f"Error reading file: {e}")
@@ -31,43 +34,11 @@ def gemini_api_call(request_text):
         return
     
 
-    # send to Gemini 
-    url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
-    headers = {"Content-Type": "application/json", "X-goog-api-key": gemini_key}
-    data = {
-        "contents": [
-            {
-                "parts": [
-                    {"text": request_text}
-                ]
-            }
-        ]
-    }
-
-    try:
-        resp = requests.post(url, headers=headers, json=data)
-        resp.raise_for_status()
-    except requests.exceptions.Timeout:
-        print("HTTP error: request timed out")
-        return
-    except requests.exceptions.RequestException as e:
-        print(f"HTTP error: {e}")
-        return
-
-    try:
-        payload = resp.json()
-    except json.JSONDecodeError:
-        print("Response was not valid JSON.")
+    # send to Gemini, 429/5xx answers and timeouts are retried with backoff
+    payload_text = client.generate(request_text)
+    if payload_text is None:
         return
 
-
-    payload_text = (
-        payload.get("candidates", [{}])[0]
-            .get("content", {})
-            .get("parts", [{}])[0]
-            .get("text", "")
-    )
-
     cleaned_payload_text = payload_text.replace('`', "")
     return cleaned_payload_text
 
@@ -0,0 +1,210 @@
+#Reusable LLM client
+# One requests.Session per client and thread keeps the connections to the API open between calls
+# (requests.Session is not thread safe, the sessions of an organization run in several threads),
+# every request has a connect/read timeout and 429/5xx answers (and timeouts / dropped connections)
+# are retried with exponential backoff. The async methods run the blocking call in a worker thread,
+# so many sessions can wait on the API at the same time.
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+import weakref
+
+import requests
+from requests.adapters import HTTPAdapter
+
+GEMINI_MODEL = "gemini-2.0-flash"
+GEMINI_URL = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent"
+
+# answers worth retrying: rate limited or server side errors
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class LLMClient:
+    """
+    JSON over HTTP POST client with a connection pool, timeouts and retries.
+
+    Args:
+        url (str): endpoint
+        headers (dict): headers sent with every request
+        timeout (tuple): (connect, read) timeout in seconds
+        max_retries (int): retries after the first attempt
+        backoff (float): delay before the first retry, doubled on every retry
+        max_backoff (float): longest delay between two attempts
+        pool_size (int): connections kept open per thread
+    """
+
+    def __init__(self, url, headers=None, timeout=(10, 120), max_retries=5, backoff=1.0, max_backoff=60.0, pool_size=10):
+        self.url = url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.headers = dict(headers or {})
+        self.pool_size = pool_size
+
+        # thread -> requests.Session, the sessions still alive are also in sessions for close()
+        # (weak, the session of a finished thread goes away with it)
+        self.local = threading.local()
+        self.sessions = weakref.WeakSet()
+        self.sessions_lock = threading.Lock()
+
+    @property
+    def session(self):
+        """
+        requests.Session of the calling thread, made on its first request.
+        """
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update(self.headers)
+            adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            self.local.session = session
+            with self.sessions_lock:
+                self.sessions.add(session)
+        return session
+
+    def retry_delay(self, attempt, resp=None):
+        # the server may say how long to wait (Retry-After in seconds)
+        if resp is not None:
+            retry_after = resp.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                return min(float(retry_after), self.max_backoff)
+        delay = min(self.backoff * (2 ** attempt), self.max_backoff)
+        # jitter so concurrent sessions don't retry in lockstep
+        return delay * random.uniform(0.5, 1.0)
+
+    def post(self, data):
+        """
+        Send data as JSON, retrying on 429/5xx, timeouts and connection errors.
+
+        Args:
+            data (dict): request body
+
+        Returns:
+            dict: decoded JSON answer, None if the request failed for good
+        """
+        for attempt in range(self.max_retries + 1):
+            last_try = attempt == self.max_retries
+            try:
+                resp = self.session.post(self.url, json=data, timeout=self.timeout)
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                print(f"HTTP error: {e}")
+                if last_try:
+                    return None
+                time.sleep(self.retry_delay(attempt))
+                continue
+            except requests.exceptions.RequestException as e:
+                print(f"HTTP error: {e}")
+                return None
+
+            if resp.status_code in RETRY_STATUS and not last_try:
+                delay = self.retry_delay(attempt, resp)
+                print(f"HTTP {resp.status_code}, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            try:
+                resp.raise_for_status()
+            except requests.exceptions.HTTPError as e:
+                print(f"HTTP error: {e}")
+                return None
+
+            try:
+                return resp.json()
+            except json.JSONDecodeError:
+                print("Response was not valid JSON.")
+                return None
+
+        return None
+
+    async def apost(self, data):
+        """
+        Async version of post.
+        """
+        return await asyncio.to_thread(self.post, data)
+
+    def close(self):
+        with self.sessions_lock:
+            sessions, self.sessions = list(self.sessions), weakref.WeakSet()
+            self.local = threading.local()
+        for session in sessions:
+            session.close()
+
+
+class GeminiClient(LLMClient):
+    """
+    LLMClient for the Gemini generateContent API.
+
+    Args:
+        api_key (str): Gemini key, read once by the caller (see from_key_file)
+        url (str): endpoint, the GEMINI_API_URL environment variable overrides the default
+                   (e.g. to point at api_functions/stub_server.py)
+        **kwargs: see LLMClient
+    """
+
+    def __init__(self, api_key, url=None, **kwargs):
+        url = url or os.environ.get("GEMINI_API_URL", GEMINI_URL)
+        headers = {"Content-Type": "application/json", "X-goog-api-key": api_key}
+        super().__init__(url, headers, **kwargs)
+
+    @classmethod
+    def from_key_file(cls, key_file="keys/geminiKey.txt", **kwargs):
+        with open(key_file, "r", encoding="utf-8") as f:
+            return cls(f.read().strip(), **kwargs)
+
+    @staticmethod
+    def request_body(request_text):
+        return {
+            "contents": [
+                {
+                    "parts": [
+                        {"text": request_text}
+                    ]
+                }
+            ]
+        }
+
+    @staticmethod
+    def response_text(payload):
+        return (
+            payload.get("candidates", [{}])[0]
+                .get("content", {})
+                .get("parts", [{}])[0]
+                .get("text", "")
+        )
+
+    def generate(self, request_text):
+        """
+        Args:
+            request_text (str): complete prompt
+
+        Returns:
+            str: text of the first candidate, None if the request failed
+        """
+        payload = self.post(self.request_body(request_text))
+        if payload is None:
+            return None
+        return self.response_text(payload)
+
+    async def agenerate(self, request_text):
+        return await asyncio.to_thread(self.generate, request_text)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def shared_client(key_file="keys/geminiKey.txt"):
+    """
+    GeminiClient shared by every session of the process (key read once, one connection pool per thread).
+    """
+    with _clients_lock:
+        client = _clients.get(key_file)
+        if client is None:
+            client = _clients[key_file] = GeminiClient.from_key_file(key_file)
+        return client
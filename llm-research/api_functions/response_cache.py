@@ -0,0 +1,193 @@
+#Content addressed cache of LLM responses
+# Responses are stored on disk under the sha256 of (model, parameters, complete prompt), so re-running
+# an experiment with the same prompts doesn't call the API again. Entries are JSON files in
+# <cache_dir>/<first 2 hex digits>/<key>.json; when the cache grows past max_bytes the least recently
+# used entries (file mtime) are deleted. In replay only mode a missing entry is a failed call.
+#
+# Sessions saved in the tracebook can be imported: the complete-prompt.cache and session-llm-response.cache
+# files of a session hold every iteration's prompt and response, separated by ITERATION dividers.
+import hashlib
+import json
+import os
+import re
+import threading
+
+DEFAULT_CACHE_DIR = "llm-research/response-cache"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# divider written by helper_functions.write_to_logs before every iteration
+ITERATION_DIVIDER = re.compile(r"\n=+\nITERATION : (\d+)\n=+\n")
+
+
+def response_key(prompt, model, params=None):
+    """
+    Returns:
+        str: hex sha256 of the model, its parameters and the prompt
+    """
+    header = json.dumps({"model": model, "params": params or {}}, sort_keys=True)
+    digest = hashlib.sha256(header.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(prompt.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def split_iterations(text):
+    """
+    Split a session .cache file into its iterations.
+
+    Returns:
+        dict: iteration number -> file content of that iteration
+    """
+    parts = ITERATION_DIVIDER.split(text)
+    # parts: [text before the first divider, num, content, num, content, ...]
+    return {int(parts[pos]): parts[pos + 1] for pos in range(1, len(parts) - 1, 2)}
+
+
+class ResponseCache:
+    """
+    Args:
+        cache_dir (str): folder of the entries
+        max_bytes (int): size the cache is trimmed to
+        replay_only (bool): never call the API, a prompt that is not cached gets no response
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, replay_only=False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.replay_only = replay_only
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.total_bytes = sum(size for _path, size, _mtime in self.entries())
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def entries(self):
+        # (path, size, mtime) of every stored entry
+        for root, _dirs, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    yield path, stat.st_size, stat.st_mtime
+
+    def get(self, prompt, model, params=None):
+        """
+        Returns:
+            str: cached response, None when the prompt was never answered
+        """
+        path = self.entry_path(response_key(prompt, model, params))
+        with self.lock:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    response = json.load(f)["response"]
+            except (FileNotFoundError, ValueError, KeyError):
+                self.misses += 1
+                return None
+            self.hits += 1
+            # recently used entries are evicted last
+            os.utime(path)
+            return response
+
+    def put(self, prompt, model, params, response):
+        """
+        Store a response, then trim the cache to max_bytes.
+        """
+        key = response_key(prompt, model, params)
+        path = self.entry_path(key)
+        data = json.dumps({"model": model, "params": params or {}, "response": response}).encode("utf-8")
+
+        with self.lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if os.path.exists(path):
+                self.total_bytes -= os.path.getsize(path)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self.total_bytes += len(data)
+
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        # delete least recently used entries until the cache fits, caller holds the lock
+        for path, size, _mtime in sorted(self.entries(), key=lambda entry: entry[2]):
+            if self.total_bytes <= self.max_bytes:
+                break
+            os.remove(path)
+            self.total_bytes -= size
+
+    def wrap(self, api_call, model, params=None):
+        """
+        Put the cache in front of an api call function.
+
+        Args:
+            api_call (function): request text -> response text (None on failure)
+            model (str): model the api call uses
+            params (dict): generation parameters sent with the request
+
+        Returns:
+            function: request text -> response text, same contract as api_call
+        """
+        def cached_call(request_text):
+            response = self.get(request_text, model, params)
+            if response is not None:
+                print("LLM response taken from the response cache")
+                return response
+            if self.replay_only:
+                print("replay only: prompt not in the response cache")
+                return None
+
+            response = api_call(request_text)
+            # failed calls are not cached, they are tried again next time
+            if response is not None:
+                self.put(request_text, model, params, response)
+            return response
+
+        return cached_call
+
+    def import_session(self, prompt_cache_file, response_cache_file, model, params=None):
+        """
+        Store the prompt/response pairs of one tracebook session.
+
+        Returns:
+            int: number of imported iterations
+        """
+        with open(prompt_cache_file, "r", encoding="utf-8") as f:
+            prompts = split_iterations(f.read())
+        with open(response_cache_file, "r", encoding="utf-8") as f:
+            responses = split_iterations(f.read())
+
+        count = 0
+        for num, prompt in prompts.items():
+            response = responses.get(num)
+            if response is None:
+                continue
+            # the prompt is sent stripped (helper_functions.read_entire_file)
+            self.put(prompt.strip(), model, params, response)
+            count += 1
+        return count
+
+    def import_tracebook(self, tracebook_dir, model, params=None):
+        """
+        Prime the cache with every session saved under a tracebook folder.
+
+        Args:
+            tracebook_dir (str): e.g. "tracebook" or "tracebook/university"
+            model (str): model the sessions were run with
+
+        Returns:
+            int: number of imported iterations
+        """
+        count = 0
+        for root, _dirs, files in os.walk(tracebook_dir):
+            prompt_files = [name for name in files if name.endswith("complete-prompt.cache")]
+            for prompt_name in prompt_files:
+                response_name = prompt_name[:-len("complete-prompt.cache")] + "session-llm-response.cache"
+                if response_name in files:
+                    count += self.import_session(os.path.join(root, prompt_name), os.path.join(root, response_name), model, params)
+        return count
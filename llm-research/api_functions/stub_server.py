@@ -0,0 +1,125 @@
+#Local stand-in for the Gemini API
+# Answers POST requests with a Gemini shaped JSON body, so the pipeline and LLMClient can be run
+# without a key or network access. It can also delay answers and fail the first requests (429/5xx)
+# to exercise timeouts and retries.
+#
+# python llm-research/api_functions/stub_server.py [port] [rules file]
+# then run with GEMINI_API_URL=http://127.0.0.1:<port>/ (any key file content works)
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubState:
+    """
+    Behaviour of the stub server, shared by its request handlers.
+
+    Args:
+        response (str or callable): answer text, or a function of the prompt text returning it
+        fail_first (int): number of requests answered with fail_status before answering normally
+        fail_status (int): status of the failed answers
+        delay (float): seconds to wait before answering
+        retry_after (str): Retry-After header of the failed answers, none when not given
+    """
+
+    def __init__(self, response="", fail_first=0, fail_status=503, delay=0.0, retry_after=None):
+        self.response = response
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.delay = delay
+        self.retry_after = retry_after
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def answer_text(self, prompt):
+        if callable(self.response):
+            return self.response(prompt)
+        return self.response
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        state = self.server.state
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+
+        with state.lock:
+            state.requests += 1
+            failing = state.requests <= state.fail_first
+
+        if state.delay:
+            time.sleep(state.delay)
+
+        if failing:
+            headers = {"Retry-After": state.retry_after} if state.retry_after is not None else {}
+            self.send_json(state.fail_status, {"error": {"code": state.fail_status, "message": "stub failure"}}, headers)
+            return
+
+        try:
+            prompt = json.loads(body)["contents"][0]["parts"][0]["text"]
+        except (ValueError, KeyError, IndexError):
+            self.send_json(400, {"error": {"code": 400, "message": "bad request body"}})
+            return
+
+        text = state.answer_text(prompt)
+        self.send_json(200, {"candidates": [{"content": {"parts": [{"text": text}]}}]})
+
+    def send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # the client gave up (timeout)
+            pass
+
+    def log_message(self, format, *args):
+        # keep the pipeline output readable
+        pass
+
+
+def start_stub_server(port=0, **kwargs):
+    """
+    Start a stub server in a background thread.
+
+    Args:
+        port (int): port to listen on, 0 picks a free one
+        **kwargs: see StubState
+
+    Returns:
+        tuple: (server, url), stop it with server.shutdown()
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    server.daemon_threads = True
+    server.state = StubState(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
+    response = ""
+    if len(sys.argv) > 2:
+        with open(sys.argv[2], "r", encoding="utf-8") as f:
+            response = f.read()
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    server.state = StubState(response)
+    print(f"stub LLM server on http://127.0.0.1:{port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+#Compact attribute values shared by users and resources
+# attribute names and string values are interned so every occurrence of e.g. "position" or
+# "student" is the same object, set values are stored as frozensets (shared between entities
+# holding the same set when a table is passed in).
+
+import sys
+
+# set values may be either, checks on attribute values must accept both
+SET_TYPES = (set, frozenset)
+
+
+def compact_value(value, shared=None):
+    """
+    Interned / immutable form of an attribute value.
+
+    Args:
+        value (str or set): parsed value
+        shared (dict): optional table used to reuse equal frozensets
+
+    Returns:
+        str or frozenset: the value to store
+    """
+    if isinstance(value, SET_TYPES):
+        value = frozenset(sys.intern(element) for element in value)
+        if shared is not None:
+            value = shared.setdefault(value, value)
+        return value
+    if isinstance(value, str):
+        return sys.intern(value)
+    return value
@@ -0,0 +1,203 @@
+#Benchmarks on synthetic policies
+# Times parse_abac_file, process_request, generate_acl, generate_heatmap_data and generate_bar_data
+# on policies from synthetic_policy and records the peak memory of each (tracemalloc). Results can be
+# saved as JSON baselines, later runs are compared with them and fail when an operation got slower
+# (or uses more memory) than the threshold allows.
+#
+# python llm-research/benchmark.py [--preset NAME|all] [--scale X] [--repeat N] [--requests N]
+#                                  [--threshold 0.25] [--baseline-dir DIR] [--save] [--output FILE]
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from acl_tools import generate_acl
+from myabac import parse_abac_file, process_request, generate_heatmap_data, generate_bar_data, pop_option, pop_flag
+from synthetic_policy import PRESETS, preset_spec, random_requests, write_policy
+
+BASELINE_DIR = "llm-research/benchmarks"
+
+# differences below these are noise, never a regression
+MIN_SECONDS = 0.005
+MIN_BYTES = 64 * 1024
+
+
+def measure(func, repeat):
+    """
+    Best wall time of repeat runs and the peak traced memory of one more run.
+
+    Returns:
+        dict: seconds, peak_bytes
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    # tracing slows everything down, so memory is measured on its own run
+    tracemalloc.start()
+    try:
+        func()
+        _current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": best, "peak_bytes": peak}
+
+
+def benchmark_policy(name, spec, repeat=3, requests=2000, seed=0):
+    """
+    Run every benchmark on one generated policy.
+
+    Args:
+        name (str): name of the run (used for the baseline file)
+        spec (dict): generate_policy arguments
+        repeat (int): timed runs per operation, the best one is kept
+        requests (int): requests evaluated by the process_request benchmark
+
+    Returns:
+        dict: name, spec, python, results (operation -> seconds, peak_bytes)
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        policy_file = write_policy(os.path.join(tmp, f"{name}.abac"), seed=seed, **spec)
+        acl_file = os.path.join(tmp, f"{name}-ACL.txt")
+        request_list = random_requests(requests, spec["users"], spec["resources"], spec["actions"], seed)
+
+        user_mgr, res_mgr, rule_mgr = parse_abac_file(policy_file, snapshot=False)
+
+        def run_requests():
+            for request in request_list:
+                process_request(request, user_mgr, res_mgr, rule_mgr)
+
+        operations = {
+            "parse_abac_file": lambda: parse_abac_file(policy_file, snapshot=False),
+            "process_request": run_requests,
+            "generate_acl": lambda: generate_acl(user_mgr, res_mgr, rule_mgr, acl_file),
+            "generate_heatmap_data": lambda: generate_heatmap_data(user_mgr, res_mgr, rule_mgr),
+            "generate_bar_data": lambda: generate_bar_data(user_mgr, res_mgr, rule_mgr),
+        }
+
+        results = {}
+        for op, func in operations.items():
+            # the functions print progress / counts, keep the report readable
+            with contextlib.redirect_stdout(io.StringIO()):
+                results[op] = measure(func, repeat)
+        results["process_request"]["requests"] = requests
+
+    return {"name": name, "spec": spec, "python": platform.python_version(), "results": results}
+
+
+def baseline_file(name, baseline_dir=BASELINE_DIR):
+    return os.path.join(baseline_dir, f"{name}.json")
+
+
+def save_baseline(run, baseline_dir=BASELINE_DIR):
+    os.makedirs(baseline_dir, exist_ok=True)
+    path = baseline_file(run["name"], baseline_dir)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(run, f, indent=2, sort_keys=True)
+        f.write("\n")
+    return path
+
+
+def load_baseline(name, baseline_dir=BASELINE_DIR):
+    path = baseline_file(name, baseline_dir)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def check_regressions(run, baseline, threshold=0.25):
+    """
+    Compare a run with its baseline.
+
+    Args:
+        run (dict): benchmark_policy result
+        baseline (dict): earlier benchmark_policy result for the same name
+        threshold (float): allowed relative growth, 0.25 = 25% slower / more memory
+
+    Returns:
+        list: one message per regression, empty when everything is within the threshold
+    """
+    if baseline.get("spec") != run["spec"]:
+        return [f"{run['name']}: baseline was made with a different policy spec, save a new baseline"]
+
+    regressions = []
+    for op, result in run["results"].items():
+        base = baseline["results"].get(op)
+        if base is None:
+            continue
+        seconds, base_seconds = result["seconds"], base["seconds"]
+        if seconds > base_seconds * (1 + threshold) and seconds - base_seconds > MIN_SECONDS:
+            regressions.append(f"{run['name']} {op}: {seconds:.4f}s vs baseline {base_seconds:.4f}s")
+        peak, base_peak = result["peak_bytes"], base["peak_bytes"]
+        if peak > base_peak * (1 + threshold) and peak - base_peak > MIN_BYTES:
+            regressions.append(f"{run['name']} {op}: peak {peak} bytes vs baseline {base_peak} bytes")
+    return regressions
+
+
+def print_run(run, baseline=None):
+    print(f"{run['name']} ({run['spec']['users']} users, {run['spec']['resources']} resources, {run['spec']['rules']} rules)")
+    for op, result in run["results"].items():
+        line = f"  {op:<22} {result['seconds']:9.4f}s  peak {result['peak_bytes'] / 1e6:8.2f} MB"
+        if baseline is not None and op in baseline["results"]:
+            base_seconds = baseline["results"][op]["seconds"]
+            if base_seconds > 0:
+                line += f"  ({result['seconds'] / base_seconds:5.2f}x baseline)"
+        print(line)
+
+
+def main():
+    argv = sys.argv
+    preset = pop_option(argv, "--preset", "all")
+    scale = float(pop_option(argv, "--scale", "1"))
+    repeat = int(pop_option(argv, "--repeat", "3"))
+    requests = int(pop_option(argv, "--requests", "2000"))
+    threshold = float(pop_option(argv, "--threshold", "0.25"))
+    baseline_dir = pop_option(argv, "--baseline-dir", BASELINE_DIR)
+    output_file = pop_option(argv, "--output")
+    save = pop_flag(argv, "--save")
+
+    names = list(PRESETS) if preset == "all" else [preset]
+    for name in names:
+        if name not in PRESETS:
+            print(f"unknown preset {name}, expected one of: {', '.join(PRESETS)} or all")
+            sys.exit(1)
+
+    runs = []
+    regressions = []
+    for name in names:
+        run_name = f"{name}-x{scale:g}"
+        run = benchmark_policy(run_name, preset_spec(name, scale), repeat, requests)
+        baseline = load_baseline(run_name, baseline_dir)
+        print_run(run, baseline)
+        runs.append(run)
+
+        if save:
+            print(f"  baseline saved to {save_baseline(run, baseline_dir)}")
+        elif baseline is not None:
+            regressions.extend(check_regressions(run, baseline, threshold))
+
+    if output_file:
+        with open(output_file, "w", encoding="utf-8") as f:
+            json.dump(runs, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+    if regressions:
+        print("\nREGRESSIONS:")
+        for message in regressions:
+            print(f"  {message}")
+        sys.exit(1)
+
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,491 @@
+#Bitmap ACLs
+# An ACL as one bitmap (a Python int) per action over a users x resources index space: the bit of
+# (user, resource) is set when the action is permitted. Two ACLs on the same index are compared
+# with AND / XOR and int.bit_count, no "<uid>, <rid>, <action>" strings are built. The lines are
+# only decoded from the bitmaps when they are asked for (report_lines, lines).
+# Lines are compared byte for byte, like acl_tools.ACL: only lines that decode back to exactly the
+# same text go into the bitmaps, any other line ("u1,r1,read", several actions, blank) is kept as a
+# string next to them, so a comparison gives the same counts as compare_acl.
+#
+# Layouts:
+#   dense   one int per action, bit user * width + resource (width = resources in the index
+#           when the ACL was built)
+#   sparse  per action a dict user -> int of the resource bits, users without a permission take
+#           no space. Sparse ACLs also accept ids that are not in the index yet.
+#
+# python llm-research/bitmap_acl.py <gt_acl_file> <acl_file | tracebook folder>... [--sparse] [--iterations] [--lines]
+# compares ACL files (every session-ACL.txt in a folder, and with --iterations every iteration of
+# the session-ACL.cache files) with a ground truth ACL: counts, jaccard, precision and recall.
+
+import os
+import sys
+
+import numpy as np
+
+from acl_tools import file_to_set
+from sharding import evaluate_policy
+
+LAYOUTS = ("dense", "sparse")
+# below this many bits a bitmap is built with shifts, above with numpy
+NUMPY_MIN_BITS = 64
+
+
+def bits_to_int(positions):
+    """
+    Int with the given bit positions set.
+    """
+    if len(positions) < NUMPY_MIN_BITS:
+        value = 0
+        for pos in positions:
+            value |= 1 << pos
+        return value
+    positions = np.asarray(positions, dtype=np.int64)
+    data = np.zeros(int(positions.max()) // 8 + 1, dtype=np.uint8)
+    np.bitwise_or.at(data, positions >> 3, (1 << (positions & 7)).astype(np.uint8))
+    return int.from_bytes(data.tobytes(), "little")
+
+
+def int_to_bits(value):
+    """
+    Positions of the set bits of a non negative int, in increasing order.
+
+    Returns:
+        numpy.ndarray: bit positions
+    """
+    if not value:
+        return np.zeros(0, dtype=np.int64)
+    data = np.frombuffer(value.to_bytes((value.bit_length() + 7) // 8, "little"), dtype=np.uint8)
+    return np.flatnonzero(np.unpackbits(data, bitorder="little"))
+
+
+def split_line(line):
+    """
+    (uid, rid, action) of a "<uid>, <rid>, <action>" line, None for any other line. The ids are not
+    stripped, "{uid}, {rid}, {action}" gives the line back unchanged.
+    """
+    parts = line.split(", ")
+    if len(parts) != 3:
+        return None
+    return tuple(parts)
+
+
+class ACLIndex:
+    """
+    Positions of the users and resources ACL bitmaps are built on.
+
+    Args:
+        user_ids (iterable): users, in position order
+        resource_ids (iterable): resources, in position order
+    """
+
+    def __init__(self, user_ids=(), resource_ids=()):
+        self.user_ids = []
+        self.resource_ids = []
+        self.user_pos = {}
+        self.resource_pos = {}
+        for uid in user_ids:
+            self.user_position(uid, add=True)
+        for rid in resource_ids:
+            self.resource_position(rid, add=True)
+
+    @classmethod
+    def from_managers(cls, user_mgr, res_mgr):
+        return cls(user_mgr.users, res_mgr.resources)
+
+    @classmethod
+    def from_lines(cls, lines):
+        """
+        Index of the ids used in ACL lines.
+        """
+        index = cls()
+        index.add_lines(lines)
+        return index
+
+    def add_lines(self, lines):
+        """
+        Add the ids of ACL lines that are not in the index yet.
+        """
+        for line in lines:
+            parts = split_line(line)
+            if parts is not None:
+                self.user_position(parts[0], add=True)
+                self.resource_position(parts[1], add=True)
+
+    def user_position(self, uid, add=False):
+        pos = self.user_pos.get(uid)
+        if pos is None:
+            if not add:
+                raise KeyError(f"user {uid} is not in the ACL index")
+            pos = self.user_pos[uid] = len(self.user_ids)
+            self.user_ids.append(uid)
+        return pos
+
+    def resource_position(self, rid, add=False):
+        pos = self.resource_pos.get(rid)
+        if pos is None:
+            if not add:
+                raise KeyError(f"resource {rid} is not in the ACL index")
+            pos = self.resource_pos[rid] = len(self.resource_ids)
+            self.resource_ids.append(rid)
+        return pos
+
+
+class BitmapACL:
+    """
+    ACL stored as per action bitmaps, see the module comment for the layouts.
+
+    Args:
+        index (ACLIndex): users and resources the bits refer to
+        layout (str): "dense" or "sparse"
+    """
+
+    def __init__(self, index, layout="dense"):
+        if layout not in LAYOUTS:
+            raise ValueError(f"unknown layout {layout}, expected one of {LAYOUTS}")
+        self.index = index
+        self.layout = layout
+        # dense bitmaps are laid out for the resources the index has now
+        self.width = len(index.resource_ids)
+        # dense: action -> int, sparse: action -> {user position: int}
+        self.bitmaps = {}
+        # lines that are not "<uid>, <rid>, <action>", compared as strings
+        self.other_lines = set()
+
+    @classmethod
+    def from_permissions(cls, permissions, index, layout="dense"):
+        """
+        Args:
+            permissions (iterable): (uid, rid, action) tuples
+            index (ACLIndex): index the ids are looked up in
+            layout (str): "dense" or "sparse"
+        """
+        acl = cls(index, layout)
+        sparse = layout == "sparse"
+        user_position, resource_position = index.user_position, index.resource_position
+        width = acl.width
+
+        # bit positions per action (dense) or per action and user (sparse), turned into ints at the end
+        positions = {}
+        for uid, rid, action in permissions:
+            user = user_position(uid, add=sparse)
+            resource = resource_position(rid, add=sparse)
+            if sparse:
+                positions.setdefault(action, {}).setdefault(user, []).append(resource)
+            else:
+                positions.setdefault(action, []).append(user * width + resource)
+
+        for action, action_positions in positions.items():
+            if sparse:
+                acl.bitmaps[action] = {user: bits_to_int(rows) for user, rows in action_positions.items()}
+            else:
+                acl.bitmaps[action] = bits_to_int(action_positions)
+        return acl
+
+    @classmethod
+    def from_lines(cls, lines, index, layout="dense"):
+        """
+        Args:
+            lines (iterable): "<uid>, <rid>, <action>" lines, any other line is kept as it is
+        """
+        other_lines = set()
+
+        def permissions():
+            for line in lines:
+                parts = split_line(line)
+                if parts is None:
+                    other_lines.add(line)
+                else:
+                    yield parts
+        acl = cls.from_permissions(permissions(), index, layout)
+        acl.other_lines = other_lines
+        return acl
+
+    @classmethod
+    def from_file(cls, file_name, index, layout="dense"):
+        return cls.from_lines(file_to_set(file_name), index, layout)
+
+    @classmethod
+    def from_acl(cls, acl, index, layout="dense"):
+        """
+        Args:
+            acl (ACL): in memory ACL (see acl_tools)
+        """
+        return cls.from_lines(acl, index, layout)
+
+    @classmethod
+    def from_policy(cls, user_mgr, res_mgr, rule_mgr, index=None, layout="dense", evaluation=None, workers=1,
+                    rule_cache=None, data_key=None):
+        """
+        Bitmap ACL of a parsed policy, the same permissions build_acl gives.
+
+        Args:
+            user_mgr (UserManager): Manages users and their attributes.
+            res_mgr (ResourceManager): Manages resources and their attributes.
+            rule_mgr (RuleManager): Manages rules for authorization.
+            index (ACLIndex): index to build on, the users and resources of the managers by default
+            layout (str): "dense" or "sparse"
+            evaluation (PolicyEvaluation or PermissionTensor): already evaluated policy, built here if not given
+            workers (int): worker processes to build the evaluation with (see sharding)
+            rule_cache (RulePermissionCache): optional, reuse the permissions of rules evaluated in earlier iterations
+            data_key: identifies the users/resources (e.g. sha256 of the attribute data file), needed with a rule_cache
+        """
+        if index is None:
+            index = ACLIndex.from_managers(user_mgr, res_mgr)
+        if rule_cache is not None:
+            permissions = rule_cache.permissions(user_mgr, res_mgr, rule_mgr, data_key)
+        else:
+            if evaluation is None:
+                evaluation = evaluate_policy(user_mgr, res_mgr, rule_mgr, workers)
+            permissions = evaluation.permissions()
+        return cls.from_permissions(permissions, index, layout)
+
+    def rows(self, action):
+        # sparse bitmaps of an action, user position -> int
+        return self.bitmaps.get(action, {})
+
+    def __len__(self):
+        if self.layout == "sparse":
+            bits = sum(row.bit_count() for rows in self.bitmaps.values() for row in rows.values())
+        else:
+            bits = sum(bitmap.bit_count() for bitmap in self.bitmaps.values())
+        return bits + len(self.other_lines)
+
+    def decode(self, action, bitmap, user=None):
+        """
+        ACL lines of the set bits of a bitmap of this ACL's layout.
+
+        Args:
+            action (str): action of the bitmap
+            bitmap (int): dense bitmap, or a sparse row when user is given
+            user (int): user position of a sparse row
+
+        Returns:
+            list: "<uid>, <rid>, <action>" lines
+        """
+        user_ids, resource_ids = self.index.user_ids, self.index.resource_ids
+        bits = int_to_bits(bitmap)
+        if user is not None:
+            uid = user_ids[user]
+            return [f"{uid}, {resource_ids[rid]}, {action}" for rid in bits.tolist()]
+        users, resources = np.divmod(bits, self.width)
+        return [f"{user_ids[uid]}, {resource_ids[rid]}, {action}" for uid, rid in zip(users.tolist(), resources.tolist())]
+
+    def lines(self):
+        """
+        Returns:
+            list: every line of the ACL, unsorted
+        """
+        result = list(self.other_lines)
+        for action, bitmap in self.bitmaps.items():
+            if self.layout == "sparse":
+                for user, row in bitmap.items():
+                    result.extend(self.decode(action, row, user))
+            else:
+                result.extend(self.decode(action, bitmap))
+        return result
+
+    def compare(self, other):
+        """
+        Compare this (ground truth) ACL with another (LLM) ACL on the same index and layout.
+
+        Returns:
+            BitmapComparison: the differences
+        """
+        return BitmapComparison(self, other)
+
+
+class BitmapComparison:
+    """
+    Result of comparing a ground truth bitmap ACL with an LLM bitmap ACL, the bitmap counterpart of
+    acl_tools.ACLComparison: the same counts and report, computed with AND / XOR and bit_count.
+    """
+
+    def __init__(self, gt_acl, llm_acl):
+        if gt_acl.index is not llm_acl.index or gt_acl.layout != llm_acl.layout:
+            raise ValueError("bitmap ACLs can only be compared on the same index and layout")
+        if gt_acl.layout == "dense" and gt_acl.width != llm_acl.width:
+            raise ValueError("dense bitmap ACLs built before and after the index grew can't be compared")
+        self.gt_acl = gt_acl
+        self.llm_acl = llm_acl
+
+        self.gt_size = len(gt_acl)
+        self.llm_size = len(llm_acl)
+        self.correct = len(gt_acl.other_lines & llm_acl.other_lines)
+        for gt_bitmap, llm_bitmap, _action, _user in self.pairs():
+            self.correct += (gt_bitmap & llm_bitmap).bit_count()
+        self.under = self.gt_size - self.correct
+        self.over = self.llm_size - self.correct
+
+    def pairs(self):
+        """
+        Yield (gt bitmap, llm bitmap, action, user position or None) of every bitmap either ACL has.
+        """
+        gt, llm = self.gt_acl, self.llm_acl
+        for action in gt.bitmaps.keys() | llm.bitmaps.keys():
+            if gt.layout == "sparse":
+                gt_rows, llm_rows = gt.rows(action), llm.rows(action)
+                for user in gt_rows.keys() | llm_rows.keys():
+                    yield gt_rows.get(user, 0), llm_rows.get(user, 0), action, user
+            else:
+                yield gt.bitmaps.get(action, 0), llm.bitmaps.get(action, 0), action, None
+
+    @property
+    def complete_match(self):
+        return not self.under and not self.over
+
+    def counts(self):
+        """
+        Returns:
+            dict: same keys as ACLComparison.counts
+        """
+        return {
+            "gt": self.gt_size,
+            "llm": self.llm_size,
+            "correct": self.correct,
+            "under": self.under,
+            "over": self.over,
+            "different": self.under + self.over,
+        }
+
+    def similarity(self):
+        """
+        Returns:
+            dict: jaccard, precision and recall of the LLM ACL against the ground truth,
+                  1.0 when there is nothing to divide by (e.g. both ACLs are empty)
+        """
+        union = self.gt_size + self.over
+        return {
+            "jaccard": self.correct / union if union else 1.0,
+            "precision": self.correct / self.llm_size if self.llm_size else 1.0,
+            "recall": self.correct / self.gt_size if self.gt_size else 1.0,
+        }
+
+    def lines(self, kind):
+        """
+        Decode one part of the comparison.
+
+        Args:
+            kind (str): "common", "under" (only in the ground truth) or "over" (only in the LLM ACL)
+
+        Returns:
+            list: sorted ACL lines
+        """
+        gt_other, llm_other = self.gt_acl.other_lines, self.llm_acl.other_lines
+        if kind == "common":
+            result = list(gt_other & llm_other)
+        elif kind == "under":
+            result = list(gt_other - llm_other)
+        elif kind == "over":
+            result = list(llm_other - gt_other)
+        else:
+            raise ValueError(f"unknown part {kind}, expected common, under or over")
+        for gt_bitmap, llm_bitmap, action, user in self.pairs():
+            if kind == "common":
+                bitmap = gt_bitmap & llm_bitmap
+            elif kind == "under":
+                bitmap = gt_bitmap & ~llm_bitmap
+            else:
+                bitmap = llm_bitmap & ~gt_bitmap
+            if bitmap:
+                result.extend(self.gt_acl.decode(action, bitmap, user))
+        return sorted(result)
+
+    def report_lines(self):
+        """
+        Returns:
+            list: the same text report as ACLComparison.report_lines
+        """
+        lines = []
+        lines.append(f"Commong lines / Lines that are correct: {self.correct}")
+        lines.extend(self.lines("common"))
+        lines.append("")
+        lines.append(f"Only in ground truth ACL (under permissions): {self.under}")
+        lines.extend(self.lines("under"))
+        lines.append("")
+        lines.append(f"Only in LLM ACL (over permissions): {self.over}")
+        lines.extend(self.lines("over"))
+        lines.append("")
+        lines.append(f"Total different lines: {self.under + self.over}")
+        return lines
+
+
+def compare_acl_bitmaps(acl1, acl2, layout="dense"):
+    """
+    compare_acl on bitmaps: compare the ground truth ACL (acl1) with the LLM ACL (acl2).
+
+    Args:
+        acl1 (ACL or str): ground truth ACL or the path of its file
+        acl2 (ACL or str): LLM ACL or the path of its file
+        layout (str): "dense" or "sparse"
+
+    Returns:
+        bool, dict, dict: True on a complete match, counts (see ACLComparison.counts), similarity
+    """
+    lines1 = file_to_set(acl1) if isinstance(acl1, str) else acl1
+    lines2 = file_to_set(acl2) if isinstance(acl2, str) else acl2
+    index = ACLIndex.from_lines(lines1)
+    index.add_lines(lines2)
+
+    comparison = BitmapACL.from_lines(lines1, index, layout).compare(BitmapACL.from_lines(lines2, index, layout))
+    return comparison.complete_match, comparison.counts(), comparison.similarity()
+
+
+def tracebook_acls(path, iterations=False):
+    """
+    ACLs to compare under a file or folder.
+
+    Yields:
+        str, set: name and lines of every session-ACL.txt (and, with iterations, of every iteration
+                  of the session-ACL.cache files)
+    """
+    from api_functions.response_cache import split_iterations
+
+    if os.path.isfile(path):
+        yield path, file_to_set(path)
+        return
+    for folder, _dirs, files in sorted(os.walk(path)):
+        for name in sorted(files):
+            file_name = os.path.join(folder, name)
+            if name.endswith("session-ACL.txt"):
+                yield file_name, file_to_set(file_name)
+            elif iterations and name.endswith("session-ACL.cache"):
+                with open(file_name, "r", encoding="utf-8") as f:
+                    for num, text in sorted(split_iterations(f.read()).items()):
+                        yield f"{file_name}#{num}", {line.strip() for line in text.splitlines()}
+
+
+def main():
+    from myabac import pop_flag
+
+    argv = sys.argv
+    layout = "sparse" if pop_flag(argv, "--sparse") else "dense"
+    iterations = pop_flag(argv, "--iterations")
+    show_lines = pop_flag(argv, "--lines")
+    if len(argv) < 3:
+        print("Usage: python3 bitmap_acl.py <gt_acl_file> <acl_file | tracebook folder>... [--sparse] [--iterations] [--lines]")
+        sys.exit(1)
+
+    gt_lines = file_to_set(argv[1])
+    acls = [acl for path in argv[2:] for acl in tracebook_acls(path, iterations)]
+
+    # one index for everything, the ground truth bitmaps are built once
+    index = ACLIndex.from_lines(gt_lines)
+    for _name, lines in acls:
+        index.add_lines(lines)
+    gt_acl = BitmapACL.from_lines(gt_lines, index, layout)
+
+    print(f"{'correct':>8} {'under':>7} {'over':>7} {'jaccard':>8} {'precision':>9} {'recall':>7}  acl")
+    for name, lines in acls:
+        comparison = gt_acl.compare(BitmapACL.from_lines(lines, index, layout))
+        counts, similarity = comparison.counts(), comparison.similarity()
+        print(f"{counts['correct']:>8} {counts['under']:>7} {counts['over']:>7} {similarity['jaccard']:>8.3f} "
+              f"{similarity['precision']:>9.3f} {similarity['recall']:>7.3f}  {name}")
+        if show_lines:
+            for line in comparison.lines("under"):
+                print(f"    - {line}")
+            for line in comparison.lines("over"):
+                print(f"    + {line}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+from collections import OrderedDict
+
+
+class DecisionCache:
+    """
+    Bounded LRU cache of request decisions, (uid, rid, action) -> 'Permit' / 'Deny'.
+
+    The cache remembers which managers (and which version of them) its decisions came from.
+    When a manager is reloaded (parse_* or deserialize bumps its version) or different managers
+    are passed in, every cached decision is dropped.
+
+    Args:
+        maxsize (int): number of decisions kept, least recently used ones are evicted first
+    """
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        # managers the decisions were made with and their versions at that time
+        self.managers = None
+        self.versions = None
+        self.hits = 0
+        self.misses = 0
+
+    def check_policy(self, user_mgr, res_mgr, rule_mgr):
+        """
+        Clear the cache if the policy is not the one the cached decisions were made with.
+        """
+        managers = (user_mgr, res_mgr, rule_mgr)
+        versions = tuple(mgr.version for mgr in managers)
+        same = self.managers is not None and all(a is b for a, b in zip(managers, self.managers))
+        if not same or versions != self.versions:
+            self.clear()
+            self.managers = managers
+            self.versions = versions
+
+    def get(self, key):
+        decision = self.entries.get(key)
+        if decision is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return decision
+
+    def put(self, key, decision):
+        self.entries[key] = decision
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
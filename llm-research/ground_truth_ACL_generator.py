@@ -1,14 +1,19 @@
+import sys
 from helper_functions import clear_file, append_from_file
-from myabac import parse_abac_file
+from myabac import parse_abac_file, parse_workers
 from acl_tools import generate_acl
+from session_workspace import SessionWorkspace
 
 
-def gt_acl_generator(attribute_data_file, gt_rules_file, output_file):
+def gt_acl_generator(attribute_data_file, gt_rules_file, output_file, workers=1, workspace=None):
     
     print("running gt acl_gen")
    
     #pass in the file where we want to store the abac file that is about to be generated
-    abac_file = "llm-research/session/session-abac.abac"
+    # (in the given session workspace, llm-research/session by default)
+    if workspace is None:
+        workspace = SessionWorkspace()
+    abac_file = workspace.gt_abac_file
 
     clear_file(abac_file)
 
@@ -17,10 +22,10 @@ def gt_acl_generator(attribute_data_file, gt_rules_file, output_file):
     append_from_file(abac_file, gt_rules_file)
 
     #generate the abac data structures
-    user, res, rule = parse_abac_file(abac_file)
+    user, res, rule = parse_abac_file(abac_file, snapshot=False, workers=workers)
 
-    #generate the acl
-    generate_acl(user, res, rule, output_file)
+    #generate the acl, split over worker processes when workers > 1
+    generate_acl(user, res, rule, output_file, workers=workers)
 
 
 
@@ -29,10 +34,12 @@ def gt_acl_generator(attribute_data_file, gt_rules_file, output_file):
 
 def main():  
 
+    workers = parse_workers(sys.argv)
+
     attribute_data_file ="DATASETS-for-LLM/university/university-attribute-data.txt"
     gt_rules_file="llm-research/ground-truth-ABAC-rules/university-abac-rules.txt"
     output_file="llm-research/ground-truth-ACL/university-gt-ACL.txt"
-    gt_acl_generator(attribute_data_file, gt_rules_file, output_file)
+    gt_acl_generator(attribute_data_file, gt_rules_file, output_file, workers)
 
 
     return  
@@ -1,9 +1,14 @@
 #Functions to assist in the llm-research folder .py files
 #includes but is not limmited to files to open text files
 # combine text files
-import os, sys
-from acl_tools import compare_acl, generate_acl
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from acl_tools import ACL, build_acl, compare_acl
 from myabac import parse_abac_file
+from rule_cache import RulePermissionCache
+from session_workspace import SessionWorkspace
+from prompt_builder import PromptBuilder
+from snapshot import file_hash
 
 
 def write_to_file(filename, lines):
@@ -85,38 +90,18 @@ def prepend_file(dest_file, src_file):
 
     return
 
-def prompt_generator(gt_acl_file, attribute_data_file, attribute_data_description_file, prompt_file, complete_request_file , comparison_file ):
-   
-    clear_file(complete_request_file)
-    
-    #if comparison is not empty include it
-    comparison = read_entire_file(comparison_file)
-    include_comparison = bool(comparison.strip())
-
-    # build a single request file
-    sections = {
-        "LLM REQUEST": prompt_file,
-        "## ATTRIBUTE_DESCRIPTION ##": attribute_data_description_file,
-        "## ATTRIBUTE_DATA ##": attribute_data_file,
-        "## GROUND_TRUTH_ACL ##":gt_acl_file
-        }
-
-    if include_comparison:
-        sections["## ACL_COMPARISON ##"]= comparison_file
-        sections["## CURRENT_RULES ##"]= "llm-research/session/session-llm-response.txt"
-    else:
-        pass 
-
-    with open(prompt_file, "r", encoding="utf-8") as f:
-        for line in f:
-            marker = line.strip()
-            if marker in sections:
-                append_to_file(complete_request_file, line)
-                append_from_file(complete_request_file, sections[marker])
-            else:
-                append_to_file(complete_request_file, line)
-            
-    return
+def prompt_generator(gt_acl_file, attribute_data_file, attribute_data_description_file, prompt_file, complete_request_file , comparison_file, current_rules_file="llm-research/session/session-llm-response.txt", builder=None ):
+    # builder: PromptBuilder of the session, made here (reading every section) when not given
+    if builder is None:
+        builder = PromptBuilder(gt_acl_file, attribute_data_file, attribute_data_description_file)
+
+    # build a single request, the comparison and current rules are only included when there is a comparison
+    request = builder.build_from_files(prompt_file, comparison_file, current_rules_file)
+
+    # the file is only a trace of what is sent
+    builder.write(request, complete_request_file)
+
+    return request
 
 
 
@@ -132,16 +117,34 @@ def clear_text_files(folder_path):
 
 
 
-def iterate_api_requests(gt_acl_file, attribute_data_file, attribute_data_description_file,  api_call, max_num_it):
+def iterate_api_requests(gt_acl_file, attribute_data_file, attribute_data_description_file,  api_call, max_num_it, workspace=None, response_cache=None, model=None, candidates=1):
+    # workspace: SessionWorkspace the session files are written to, llm-research/session if not given
+    if workspace is None:
+        workspace = SessionWorkspace()
+
+    # candidates: rule sets requested at the same time every iteration, the one closest to the
+    # ground truth ACL is kept (see best_candidate)
+    candidates = max(1, candidates)
+
+    # response_cache: ResponseCache in front of api_call, identical prompts to the same model are answered from disk
+    # (every candidate has its own entry, otherwise they would all get the same cached answer)
+    candidate_calls = [api_call] * candidates
+    if response_cache is not None:
+        candidate_calls = [response_cache.wrap(api_call, model, {"candidate": i} if i else None) for i in range(candidates)]
+    api_call = candidate_calls[0]
+
     # generated file #: declare the location on the complete request being made
     # this file should contain everyhting we are feeding the LLM to make the rules.
-    complete_request_file = "prompts/complete-prompt.txt"
+    complete_request_file = workspace.complete_prompt_file
     prompt_file = "prompts/initial-starting-prompt.txt"
     comparison_file ="prompts/empty.txt"
 
-    prompt_generator(gt_acl_file, attribute_data_file, attribute_data_description_file, prompt_file, complete_request_file , comparison_file )
+    # templates and the static sections are read once for the whole session
+    builder = PromptBuilder(gt_acl_file, attribute_data_file, attribute_data_description_file)
+
+    complete_request = prompt_generator(gt_acl_file, attribute_data_file, attribute_data_description_file, prompt_file, complete_request_file , comparison_file, workspace.llm_response_file, builder ).strip()
     
-    append_from_file("llm-research/session/output/complete-initial-prompt.txt", complete_request_file )
+    append_from_file(workspace.complete_initial_prompt_file, complete_request_file )
     print("ITERATING API CALLS..")
 
     #TODO: delcare output stats files and write to them
@@ -149,61 +152,81 @@ def iterate_api_requests(gt_acl_file, attribute_data_file, attribute_data_descri
 
     is_match = False
     counter = 0
-    session_abac_file ="llm-research/session/session-abac.txt"
-    session_acl_file="llm-research/session/session-ACL.txt"
-    session_comparison_file="llm-research/session/session-comparison.txt"
-    session_llm_response_file="llm-research/session/session-llm-response.txt"
+    session_abac_file = workspace.abac_file
+    session_acl_file = workspace.acl_file
+    session_comparison_file = workspace.comparison_file
+    session_llm_response_file = workspace.llm_response_file
+
+    # permissions of every rule seen in this session, only new or changed rules get evaluated
+    rule_cache = RulePermissionCache()
 
-    #The initial complete prompt file, to make the initial request
+    # the ground truth ACL doesn't change during the session, it is read once and compared in memory
+    gt_acl = ACL.from_file(gt_acl_file)
 
-    complete_request = read_entire_file(complete_request_file)
+    # the candidate threads live as long as the session, so every one keeps its HTTP session
+    # (and open connections, see LLMClient.session) from one iteration to the next
+    candidate_pool = ThreadPoolExecutor(max_workers=candidates) if candidates > 1 else None
 
-    # The api_call function will return text of the response.
-    payload_text = api_call(complete_request)
+    def run_iteration(complete_request):
+        # sends the request and updates the session files, returns is_match (None when no payload was received)
+        if candidates > 1:
+            return best_candidate(candidate_calls, complete_request, workspace, attribute_data_file, gt_acl, rule_cache,
+                                  candidate_pool)
+
+        # The api_call function will return text of the response.
+        payload_text = api_call(complete_request)
+        if(payload_text is None):
+            return None
 
-    #output the abac rules to a file for testing
-    if(payload_text is None):
-        print(f"skipping iteration: payload not received\n")
-        sys.exit()
-    else:
+        #output the abac rules to a file for testing
         with open(session_llm_response_file, "w", encoding="utf-8") as of:
             of.write(payload_text)
-    
-    is_match = create_session_data(session_abac_file, attribute_data_file, session_llm_response_file, session_acl_file, gt_acl_file, session_comparison_file)
-    write_to_logs(counter)
 
-    counter +=1
+        return create_session_data(session_abac_file, attribute_data_file, session_llm_response_file, session_acl_file, gt_acl_file, session_comparison_file, rule_cache, gt_acl)
 
-    while(is_match is False and counter < max_num_it):
+    # the newest first .cache views are rendered from the iteration logs when the session ends, also
+    # when it crashes or is interrupted (Ctrl-C), so the iterations done so far are never lost
+    try:
+        is_match = run_iteration(complete_request)
 
-        print("api loop running")
+        if(is_match is None):
+            # only this organization's session stops, other runs may still be going on
+            print(f"skipping session: initial payload not received\n")
+            return
+    
+        write_to_logs(counter, workspace)
 
-        prompt_file = ("prompts/subsequent-starting-prompt.txt")
-        prompt_generator(gt_acl_file, attribute_data_file, attribute_data_description_file,prompt_file, complete_request_file , session_comparison_file )
+        counter +=1
 
-        complete_request = read_entire_file(complete_request_file)
+        while(is_match is False and counter < max_num_it):
 
-        # The api_call function will return text of the response.
-        payload_text = api_call(complete_request)
+            print("api loop running")
+
+            prompt_file = ("prompts/subsequent-starting-prompt.txt")
+            complete_request = prompt_generator(gt_acl_file, attribute_data_file, attribute_data_description_file,prompt_file, complete_request_file , session_comparison_file, session_llm_response_file, builder ).strip()
+
+            iteration_match = run_iteration(complete_request)
         
-        #output the abac rules to a file for testing
-        if(payload_text is None):
-            print(f"skipping iteration: payload not received\n")
-            counter +=1
-            continue
-        else:
-            with open(session_llm_response_file, "w", encoding="utf-8") as of:
-                of.write(payload_text)
+            if(iteration_match is None):
+                print(f"skipping iteration: payload not received\n")
+                counter +=1
+                continue
 
-        is_match = create_session_data(session_abac_file, attribute_data_file, session_llm_response_file, session_acl_file, gt_acl_file, session_comparison_file)
-        write_to_logs(counter)
+            is_match = iteration_match
+            write_to_logs(counter, workspace)
 
-        counter +=1
+            counter +=1
+    finally:
+        if candidate_pool is not None:
+            candidate_pool.shutdown()
+        workspace.render_logs()
 
     return
 
 
-def create_session_data(session_abac_file, attribute_data_file, session_response, llm_acl_file, gt_acl_file, session_comparison_file):
+def create_session_data(session_abac_file, attribute_data_file, session_response, llm_acl_file, gt_acl_file, session_comparison_file, rule_cache=None, gt_acl=None):
+        # llm_acl_file: the LLM ACL is only written to disk if a file is given
+        # gt_acl: the ground truth ACL already loaded (ACL object), gt_acl_file is read when not given
         #clear the file for the iteration
         clear_file(session_abac_file)
         # write the abac policy (llm version that has no rules) into the session abac file
@@ -213,40 +236,134 @@ def create_session_data(session_abac_file, attribute_data_file, session_response
         append_from_file(session_abac_file, session_response)
 
         # create abac data structures from the session abac file (the one generated with LLM abac rules)
-        user2, res2, rule2 = parse_abac_file(session_abac_file)
+        # the file changes every iteration, so no snapshot is kept for it
+        user2, res2, rule2 = parse_abac_file(session_abac_file, snapshot=False)
 
         # make a new ACL using the rules given by the LLM
-        generate_acl(user2, res2, rule2, llm_acl_file)
+        # with a rule cache only the rules that changed since the last iteration are evaluated
+        # the cached rule permissions are only reused for the same attribute data
+        data_key = file_hash(attribute_data_file) if rule_cache is not None else None
+        llm_acl = build_acl(user2, res2, rule2, rule_cache=rule_cache, data_key=data_key)
+        if llm_acl_file:
+            llm_acl.write(llm_acl_file)
+        print(f"permission Count {len(llm_acl)}")
 
         #store the comparison in a text object
-        temp_text, is_match = compare_acl(gt_acl_file,llm_acl_file)
+        temp_text, is_match, counts = compare_acl(gt_acl if gt_acl is not None else gt_acl_file, llm_acl)
+        print(f"correct: {counts['correct']}, under: {counts['under']}, over: {counts['over']}")
 
         #write the comparison to a text file
         write_to_file(session_comparison_file, temp_text)
 
         return is_match
 
-def write_to_logs(num_it):
-
-    divider_text = (f"\n===============================================================\nITERATION : {num_it}\n===============================================================\n")
-    
-    prepend_file("llm-research/session/cache/complete-prompt.cache", "prompts/complete-prompt.txt")
-    prepend_text_to_file("llm-research/session/cache/complete-prompt.cache", divider_text)
-
-    prepend_file("llm-research/session/cache/session-abac.cache", "llm-research/session/session-abac.txt")
-    prepend_text_to_file("llm-research/session/cache/session-abac.cache", divider_text)
-
-    prepend_file("llm-research/session/cache/session-ACL.cache", "llm-research/session/session-ACL.txt")
-    prepend_text_to_file("llm-research/session/cache/session-ACL.cache", divider_text)
-
-    prepend_file("llm-research/session/cache/session-comparison.cache", "llm-research/session/session-comparison.txt")
-    prepend_text_to_file("llm-research/session/cache/session-comparison.cache", divider_text)
-
-    prepend_file("llm-research/session/cache/session-llm-response.cache", "llm-research/session/session-llm-response.txt")
-    prepend_text_to_file("llm-research/session/cache/session-llm-response.cache", divider_text)
+def score_candidate(candidate_abac_file, attribute_data_file, payload_text, gt_acl, rule_cache=None):
+    """
+    Build the ACL of one candidate rule set and compare it with the ground truth ACL,
+    like create_session_data but without touching the session files.
+
+    Args:
+        candidate_abac_file (str): file the candidate's abac policy is written to (one per candidate)
+        attribute_data_file (str): users and resources of the organization
+        payload_text (str): rules answered by the LLM
+        gt_acl (ACL): ground truth ACL
+        rule_cache (RulePermissionCache): optional, shared by the candidates of the session
+
+    Returns:
+        dict: payload, abac_file, acl, report (comparison lines), is_match and counts (see ACLComparison.counts)
+    """
+    with open(attribute_data_file, "r", encoding="utf-8") as f:
+        attribute_data = f.read()
+    with open(candidate_abac_file, "w", encoding="utf-8") as f:
+        f.write(attribute_data)
+        f.write(payload_text)
+
+    user2, res2, rule2 = parse_abac_file(candidate_abac_file, snapshot=False)
+    data_key = file_hash(attribute_data_file) if rule_cache is not None else None
+    llm_acl = build_acl(user2, res2, rule2, rule_cache=rule_cache, data_key=data_key)
+
+    report, is_match, counts = compare_acl(gt_acl, llm_acl)
+    return {"payload": payload_text, "abac_file": candidate_abac_file, "acl": llm_acl,
+            "report": report, "is_match": is_match, "counts": counts}
+
+
+def best_candidate(candidate_calls, complete_request, workspace, attribute_data_file, gt_acl, rule_cache=None, pool=None):
+    """
+    Request one rule set per api call function at the same time, score every answer as soon as it
+    arrives and keep the one with the fewest different ACL lines (the first candidate wins ties).
+    The kept candidate is written to the session files, as create_session_data would.
+
+    Args:
+        candidate_calls (list): api call functions, one per candidate
+        complete_request (str): request sent to every candidate
+        workspace (SessionWorkspace): session files
+        attribute_data_file (str): users and resources of the organization
+        gt_acl (ACL): ground truth ACL
+        rule_cache (RulePermissionCache): optional, shared by the candidates
+        pool (ThreadPoolExecutor): threads the candidates run in, kept by the caller across iterations;
+                                   a pool just for this call when not given
+
+    Returns:
+        bool: is_match of the kept candidate, None when no candidate got an answer
+    """
+    def request_and_score(pos):
+        payload_text = candidate_calls[pos](complete_request)
+        if payload_text is None:
+            return pos, None
+        candidate_abac_file = os.path.join(workspace.root, f"candidate-{pos}-abac.txt")
+        return pos, score_candidate(candidate_abac_file, attribute_data_file, payload_text, gt_acl, rule_cache)
+
+    scores = {}
+    own_pool = pool is None
+    if own_pool:
+        pool = ThreadPoolExecutor(max_workers=len(candidate_calls))
+    try:
+        futures = [pool.submit(request_and_score, pos) for pos in range(len(candidate_calls))]
+        for future in as_completed(futures):
+            pos, score = future.result()
+            if score is not None:
+                scores[pos] = score
+                counts = score["counts"]
+                print(f"candidate {pos}: correct: {counts['correct']}, under: {counts['under']}, over: {counts['over']}")
+    finally:
+        if own_pool:
+            pool.shutdown()
+
+    if not scores:
+        return None
+
+    best_pos = min(scores, key=lambda pos: (scores[pos]["counts"]["different"], pos))
+    best = scores[best_pos]
+    print(f"keeping candidate {best_pos} of {len(candidate_calls)}")
+
+    with open(workspace.llm_response_file, "w", encoding="utf-8") as of:
+        of.write(best["payload"])
+    os.replace(best["abac_file"], workspace.abac_file)
+    best["acl"].write(workspace.acl_file)
+    write_to_file(workspace.comparison_file, best["report"])
+    for score in scores.values():
+        if os.path.exists(score["abac_file"]):
+            os.remove(score["abac_file"])
+
+    return best["is_match"]
+
+
+def write_to_logs(num_it, workspace=None):
+    # workspace: SessionWorkspace of the session, llm-research/session if not given
+    if workspace is None:
+        workspace = SessionWorkspace()
+
+    # every file is appended to its iteration log, the newest first .cache files are
+    # rendered when the session ends (workspace.render_logs in iterate_api_requests)
+    logs = workspace.iteration_logs()
+
+    logs["complete-prompt"].append_file(num_it, workspace.complete_prompt_file)
+    logs["session-abac"].append_file(num_it, workspace.abac_file)
+    logs["session-ACL"].append_file(num_it, workspace.acl_file)
+    logs["session-comparison"].append_file(num_it, workspace.comparison_file)
+    logs["session-llm-response"].append_file(num_it, workspace.llm_response_file)
     #write to output file too
-    prepend_file("llm-research/session/output/generated-rules.txt", "llm-research/session/session-llm-response.txt")
-    prepend_text_to_file("llm-research/session/output/generated-rules.txt", divider_text)
+    logs["generated-rules"].append_file(num_it, workspace.llm_response_file)
 
 
     return
@@ -0,0 +1,251 @@
+#Opt-in evaluation instrumentation
+# Off by default. When enabled (enable()), decide / process_request go through instrumented_decide, which
+# records per rule: evaluations, permits, cumulative time and which condition rejected the request,
+# and the phases wrapped in phase(...) (parsing, ACL generation, analytics) record their time.
+# When disabled the only cost is one flag check per request and a no-op context manager per phase.
+#
+# The numbers are exported as JSON (to_json) or in the Prometheus text format (to_prometheus).
+import json
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from rule import compile_condition, compile_constraint
+from rule_cache import rule_fingerprint
+
+enabled = False
+
+_lock = threading.Lock()
+_NULL_PHASE = nullcontext()
+
+
+class RuleStats:
+    """
+    Counters of one rule.
+    """
+
+    def __init__(self, rule):
+        self.rule = rule
+        self.text = rule_fingerprint(rule)
+        self.evaluations = 0
+        self.permits = 0
+        self.seconds = 0.0
+        # reason -> count, reason is "action", "sub_cond[i]", "res_cond[i]" or "cons[i]"
+        self.rejections = {}
+        self.explainer = None
+
+    def rejection_reason(self, user, resource, action):
+        """
+        The first part of the rule that rejects the request, in Rule.evaluate order.
+        """
+        rule = self.rule
+        if self.explainer is None:
+            self.explainer = (
+                [compile_condition(attr, op, value) for attr, op, value in rule.sub_cond],
+                [compile_condition(attr, op, value) for attr, op, value in rule.res_cond],
+                [compile_constraint(left, op, right) for left, op, right in rule.cons],
+            )
+        sub_checks, res_checks, cons_checks = self.explainer
+
+        if action not in rule.acts:
+            return "action"
+        for pos, check in enumerate(sub_checks):
+            if not check(user.attributes):
+                return f"sub_cond[{pos}]"
+        for pos, check in enumerate(res_checks):
+            if not check(resource.attributes):
+                return f"res_cond[{pos}]"
+        for pos, check in enumerate(cons_checks):
+            if not check(user.attributes, resource.attributes):
+                return f"cons[{pos}]"
+        return "unknown"
+
+    def to_dict(self):
+        return {
+            "rule": self.text,
+            "evaluations": self.evaluations,
+            "permits": self.permits,
+            "hit_rate": self.permits / self.evaluations if self.evaluations else 0.0,
+            "seconds": self.seconds,
+            "rejections": dict(self.rejections),
+        }
+
+
+class Instrumentation:
+    """
+    Everything recorded since the last reset.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        # id(rule) -> RuleStats, the stats keep their rule alive so ids are not reused
+        self.rules = {}
+        # phase -> [calls, seconds]
+        self.phases = {}
+        self.requests = 0
+        self.permits = 0
+        self.request_seconds = 0.0
+        # candidate rules returned by the rule index, against the rules of the policy
+        self.candidates = 0
+        self.policy_rules = 0
+
+    def rule_stats(self, rule):
+        stats = self.rules.get(id(rule))
+        if stats is None:
+            with _lock:
+                stats = self.rules.setdefault(id(rule), RuleStats(rule))
+        return stats
+
+    def add_phase(self, name, seconds):
+        with _lock:
+            entry = self.phases.setdefault(name, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def to_json(self):
+        """
+        Returns:
+            dict: requests, phases and per rule counters
+        """
+        return {
+            "requests": {
+                "total": self.requests,
+                "permits": self.permits,
+                "seconds": self.request_seconds,
+                "candidate_rules": self.candidates,
+                # share of the rules the index could not prune, lower is better
+                "candidate_ratio": self.candidates / self.policy_rules if self.policy_rules else 0.0,
+            },
+            "phases": {name: {"calls": calls, "seconds": seconds} for name, (calls, seconds) in self.phases.items()},
+            "rules": [stats.to_dict() for stats in self.rules.values()],
+        }
+
+    def to_prometheus(self):
+        """
+        Returns:
+            str: the counters in the Prometheus text exposition format
+        """
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{escape_label(val)}"' for key, val in labels)
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+        metric("abac_requests_total", "counter", "Requests decided.",
+               [((("decision", "Permit"),), self.permits), ((("decision", "Deny"),), self.requests - self.permits)])
+        metric("abac_request_seconds_total", "counter", "Time spent deciding requests.", [((), self.request_seconds)])
+        metric("abac_candidate_rules_total", "counter", "Rules returned by the rule index.", [((), self.candidates)])
+        metric("abac_policy_rules_total", "counter", "Rules of the policy, summed over the requests.",
+               [((), self.policy_rules)])
+
+        phases = sorted(self.phases.items())
+        metric("abac_phase_calls_total", "counter", "Calls of an instrumented phase.",
+               [((("phase", name),), calls) for name, (calls, _seconds) in phases])
+        metric("abac_phase_seconds_total", "counter", "Time spent in an instrumented phase.",
+               [((("phase", name),), seconds) for name, (_calls, seconds) in phases])
+
+        rules = list(self.rules.values())
+        metric("abac_rule_evaluations_total", "counter", "Evaluations of a rule.",
+               [((("rule", stats.text),), stats.evaluations) for stats in rules])
+        metric("abac_rule_permits_total", "counter", "Evaluations of a rule that permitted the request.",
+               [((("rule", stats.text),), stats.permits) for stats in rules])
+        metric("abac_rule_seconds_total", "counter", "Time spent evaluating a rule.",
+               [((("rule", stats.text),), stats.seconds) for stats in rules])
+        metric("abac_rule_rejections_total", "counter", "Rejections of a rule by the part that rejected.",
+               [((("rule", stats.text), ("reason", reason)), count)
+                for stats in rules for reason, count in sorted(stats.rejections.items())])
+
+        return "\n".join(lines) + "\n"
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+stats = Instrumentation()
+
+
+def enable(reset=True):
+    global enabled
+    if reset:
+        stats.reset()
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def phase(name):
+    """
+    Context manager timing a phase, a shared no-op when instrumentation is off.
+    """
+    if not enabled:
+        return _NULL_PHASE
+    return _timed_phase(name)
+
+
+@contextmanager
+def _timed_phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.add_phase(name, time.perf_counter() - start)
+
+
+def instrumented_decide(user, resource, action, rule_mgr):
+    """
+    Same decision as myabac.decide on the rule path, recording every rule evaluation.
+
+    Args:
+        user (User): requesting subject, None if unknown
+        resource (Resource): requested object, None if unknown
+        action (str): requested action
+        rule_mgr (RuleManager): rules of the policy
+
+    Returns:
+        str: 'Permit' or 'Deny'
+    """
+    start = time.perf_counter()
+    decision = "Deny"
+    if user and resource:
+        candidates = rule_mgr.candidate_rules(user, resource, action)
+        stats.candidates += len(candidates)
+        stats.policy_rules += len(rule_mgr.rules)
+        for rule in candidates:
+            rule_stats = stats.rule_stats(rule)
+            rule_start = time.perf_counter()
+            permitted = rule.check(user, resource, action)
+            rule_stats.seconds += time.perf_counter() - rule_start
+            rule_stats.evaluations += 1
+            if permitted:
+                rule_stats.permits += 1
+                decision = "Permit"
+                break
+            reason = rule_stats.rejection_reason(user, resource, action)
+            rule_stats.rejections[reason] = rule_stats.rejections.get(reason, 0) + 1
+
+    stats.requests += 1
+    if decision == "Permit":
+        stats.permits += 1
+    stats.request_seconds += time.perf_counter() - start
+    return decision
+
+
+def export(file_name):
+    """
+    Write the recorded numbers, Prometheus text for .prom files, JSON otherwise.
+    """
+    with open(file_name, "w", encoding="utf-8") as f:
+        if file_name.endswith(".prom"):
+            f.write(stats.to_prometheus())
+        else:
+            json.dump(stats.to_json(), f, indent=2)
+            f.write("\n")
@@ -0,0 +1,131 @@
+#Append only iteration logs
+# The session .cache files list every iteration newest first. Building them by prepending means
+# re-reading and re-writing the whole file on every iteration, so each log is kept append only
+# instead and the newest first .cache view is rendered from it when it is needed (end of a session,
+# also a crashed or interrupted one).
+#
+#   <cache file>.idx      one "iteration segment offset length" line per appended entry
+#   <cache file>.<n>.log  segment n, the entry contents one after the other
+#
+# A new segment is started once the current one is larger than SEGMENT_BYTES.
+import os
+
+SEGMENT_BYTES = 64 * 1024 * 1024
+
+DIVIDER = "\n===============================================================\nITERATION : {num}\n===============================================================\n"
+
+
+def divider_text(num):
+    # same divider the .cache files always had
+    return DIVIDER.format(num=num)
+
+
+class IterationLog:
+    """
+    Append only log of the iterations of one session file.
+
+    Args:
+        cache_file (str): newest first view the log renders to (e.g. cache/session-abac.cache)
+    """
+
+    def __init__(self, cache_file):
+        self.cache_file = cache_file
+        self.index_file = cache_file + ".idx"
+
+    def segment_file(self, segment):
+        return f"{self.cache_file}.{segment}.log"
+
+    def entries(self):
+        """
+        Returns:
+            list: (iteration, segment, offset, length) tuples in the order they were appended
+        """
+        if not os.path.exists(self.index_file):
+            return []
+        entries = []
+        with open(self.index_file, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entries.append(tuple(int(field) for field in line.split()))
+        return entries
+
+    def reset(self):
+        """
+        Delete every segment and the index.
+        """
+        for segment in {entry[1] for entry in self.entries()} | {0}:
+            if os.path.exists(self.segment_file(segment)):
+                os.remove(self.segment_file(segment))
+        if os.path.exists(self.index_file):
+            os.remove(self.index_file)
+
+    def current_segment(self):
+        entries = self.entries()
+        if not entries:
+            return 0
+        _num, segment, offset, length = entries[-1]
+        if offset + length >= SEGMENT_BYTES:
+            return segment + 1
+        return segment
+
+    def append_bytes(self, num, data):
+        segment = self.current_segment()
+        with open(self.segment_file(segment), "ab") as f:
+            offset = f.tell()
+            f.write(data)
+        with open(self.index_file, "a", encoding="utf-8") as f:
+            f.write(f"{num} {segment} {offset} {len(data)}\n")
+
+    def append(self, num, text):
+        """
+        Log text as the content of iteration num.
+        """
+        self.append_bytes(num, text.encode("utf-8"))
+
+    def append_file(self, num, src_file):
+        """
+        Log the current content of a session file as the content of iteration num.
+        """
+        with open(src_file, "rb") as f:
+            self.append_bytes(num, f.read())
+
+    def read(self, num):
+        """
+        Returns:
+            str: content logged for iteration num (the last one if it was logged twice), None if not logged
+        """
+        for entry_num, segment, offset, length in reversed(self.entries()):
+            if entry_num == num:
+                with open(self.segment_file(segment), "rb") as f:
+                    f.seek(offset)
+                    return f.read(length).decode("utf-8")
+        return None
+
+    def render(self, dest_file=None):
+        """
+        Write the newest first view: for every entry, newest first, its divider and its content.
+
+        Args:
+            dest_file (str): where to write the view, the log's cache file by default
+
+        Returns:
+            str: the written file
+        """
+        dest_file = dest_file or self.cache_file
+        # written next to the destination and moved in place, a render that fails half way leaves
+        # the previous file (and the log) as they were
+        tmp_file = dest_file + ".tmp"
+        with open(tmp_file, "wb") as out:
+            for num, segment, offset, length in reversed(self.entries()):
+                out.write(divider_text(num).encode("utf-8"))
+                with open(self.segment_file(segment), "rb") as f:
+                    f.seek(offset)
+                    remaining = length
+                    while remaining:
+                        block = f.read(min(remaining, 1 << 20))
+                        if not block:
+                            break
+                        out.write(block)
+                        remaining -= len(block)
+        os.replace(tmp_file, dest_file)
+        return dest_file
@@ -1,7 +1,13 @@
 from api_functions.gemini_call import gemini_api
-from helper_functions import clear_text_files, write_text_to_file
+from api_functions.llm_client import GEMINI_MODEL
+from api_functions.response_cache import ResponseCache, DEFAULT_CACHE_DIR
+from helper_functions import write_text_to_file
 from file_manip import move_and_rename_all
+from myabac import pop_flag, pop_option
+from session_workspace import SessionWorkspace
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import datetime
+import sys
 
 def parse_config_file(file):
     with open(file, "r", encoding="utf-8") as f:
@@ -31,54 +37,104 @@ def parse_config_file(file):
 
 
 
-def main():
-    config_file = "config/config.txt"
+def run_organization(org_line, max_num_it, api_to_run, response_cache=None, candidates=1):
+    """
+    Run the LLM session of one organization line of the config file in its own session workspace,
+    then save the workspace to the tracebook and output folders.
 
-    #clear cache and session files
-    clear_text_files("llm-research/session/cache")
-    clear_text_files("llm-research/session")
+    Args:
+        response_cache (ResponseCache): optional, answers prompts already sent to the model
+        candidates (int): rule sets requested in parallel every iteration, the closest to the ground truth is kept
 
-   
-    with open(config_file, "r", encoding="utf-8") as f:
-        lines = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    Returns:
+        str: organization name
+    """
+    org_name, rest = org_line.split("(", 1)
+    org_name = org_name.strip()
+    parts = rest.rstrip(")").split(";")
+    parts = [p.strip() for p in parts]
 
-        max_num_it = int(lines[0])
-        api_to_run = lines[1]
+    organization = org_name
+    gt_acl_file = parts[0]
+    gt_abac_rules_file = parts[1]
+    attribute_data_description_file = parts[2]
+    attribute_data_file = parts[3]
+    tracebook_path = parts[4]
+    output_path = parts[5]
 
-        for org_line in lines[2:]:
-            org_name, rest = org_line.split("(", 1)
-            org_name = org_name.strip()
-            parts = rest.rstrip(")").split(";")
-            parts = [p.strip() for p in parts]
 
-            organization = org_name
-            gt_acl_file = parts[0]
-            gt_abac_rules_file = parts[1]
-            attribute_data_description_file = parts[2]
-            attribute_data_file = parts[3]
-            tracebook_path = parts[4]
-            output_path = parts[5]
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    meta_data = (f"{org_name}{timestamp}\n{max_num_it}\n{api_to_run}\n{organization}\n{gt_acl_file}\n{gt_abac_rules_file}\n{attribute_data_description_file}\n{attribute_data_file}\n{tracebook_path}\n{output_path}\n")
 
+    # every run gets its own session files, so organizations can run at the same time
+    workspace = SessionWorkspace.for_run(org_name, timestamp)
 
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            meta_data = (f"{org_name}{timestamp}\n{max_num_it}\n{api_to_run}\n{organization}\n{gt_acl_file}\n{gt_abac_rules_file}\n{attribute_data_description_file}\n{attribute_data_file}\n{tracebook_path}\n{output_path}\n")
+    # A call to any API should be made here
+    gemini_api( gt_acl_file, attribute_data_file, attribute_data_description_file, max_num_it, workspace, response_cache, candidates)
 
+    #TODO: generate analytics here
 
-            # A call to any API should be made here
-            gemini_api( gt_acl_file, attribute_data_file, attribute_data_description_file, max_num_it)
+    # Save all session files and cache files generated from the session 
+    write_text_to_file(workspace.info_file, meta_data)
+    # the .cache files were rendered when the session ended (a failed render raised before this
+    # point and kept the logs), the append only logs they come from are not saved
+    workspace.remove_logs()
+    move_and_rename_all(workspace.root, tracebook_path , org_name, timestamp)
+    move_and_rename_all(workspace.output_dir, output_path , org_name, timestamp)
 
-            #TODO: generate analytics here
+    workspace.remove()
 
-            # Save all session files and cache files generated from the session 
-            
-            session_info = "llm-research/session/session-info.txt"
-            write_text_to_file(session_info, meta_data)
-            move_and_rename_all("llm-research/session", tracebook_path , org_name, timestamp)
-            move_and_rename_all("llm-research/session/output", output_path , org_name, timestamp)
+    return org_name
 
 
-            clear_text_files("llm-research/session/cache")
-            clear_text_files("llm-research/session")
+def main():
+    config_file = "config/config.txt"
+
+    # organizations running at the same time, all of them by default (the runs mostly wait on the LLM)
+    concurrency = pop_option(sys.argv, "--concurrency")
+    if concurrency is not None and not concurrency.isdigit():
+        print("--concurrency expects a number of organizations")
+        sys.exit(1)
+
+    # candidate rule sets requested at the same time every iteration
+    candidates = pop_option(sys.argv, "--candidates", "1")
+    if not candidates.isdigit():
+        print("--candidates expects a number of rule sets")
+        sys.exit(1)
+    candidates = max(1, int(candidates))
+
+    # response cache: --response-cache DIR stores the LLM answers in DIR, --replay only answers from the cache,
+    # --import-tracebook DIR primes the cache with the sessions saved in a tracebook folder
+    # (llm-research/response-cache unless --response-cache is given)
+    cache_dir = pop_option(sys.argv, "--response-cache")
+    replay_only = pop_flag(sys.argv, "--replay")
+    import_dir = pop_option(sys.argv, "--import-tracebook")
+    response_cache = None
+    if cache_dir is not None or replay_only or import_dir is not None:
+        response_cache = ResponseCache(cache_dir or DEFAULT_CACHE_DIR, replay_only=replay_only)
+    if import_dir is not None:
+        count = response_cache.import_tracebook(import_dir, GEMINI_MODEL)
+        print(f"imported {count} responses from {import_dir}")
+
+    with open(config_file, "r", encoding="utf-8") as f:
+        lines = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+    max_num_it = int(lines[0])
+    api_to_run = lines[1]
+    org_lines = lines[2:]
+    if not org_lines:
+        return
+
+    max_workers = max(1, int(concurrency)) if concurrency is not None else len(org_lines)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(run_organization, org_line, max_num_it, api_to_run, response_cache, candidates): org_line for org_line in org_lines}
+        for future in as_completed(futures):
+            try:
+                print(f"finished session: {future.result()}")
+            except Exception as e:
+                # one failed organization doesn't stop the others
+                print(f"session failed for {futures[future]}: {e}")
 
     return
    
@@ -0,0 +1,111 @@
+#Shared policy evaluation result
+# works out which rule grants which (user, resource, action) once, and lets the ACL writer,
+# the heatmap, the bar chart and request decisions all read from it.
+# Nothing is computed up front, each rule is joined (acl_engine) the first time a query needs it.
+
+from acl_engine import rule_pairs
+
+
+class PolicyEvaluation:
+    """
+    Lazily evaluated grants of a parsed policy.
+
+    Args:
+        user_mgr (UserManager): holds users from abac
+        res_mgr (ResourceManager): holds resources from abac
+        rule_mgr (RuleManager): holds rules from abac
+        precomputed (list): optional (uid, rid) pair sets per rule, e.g. merged from worker processes
+    """
+
+    def __init__(self, user_mgr, res_mgr, rule_mgr, precomputed=None):
+        self.user_mgr = user_mgr
+        self.res_mgr = res_mgr
+        self.rules = list(rule_mgr.rules)
+        self.actions = sorted({action for rule in self.rules for action in rule.acts})
+
+        self._rule_pairs = list(precomputed) if precomputed is not None else [None] * len(self.rules)
+        # action -> set of (uid, rid)
+        self._action_pairs = {}
+
+    def rule_pairs(self, rule_idx):
+        """
+        (uid, rid) pairs the rule grants its actions on.
+
+        Returns:
+            set: (uid, rid) tuples
+        """
+        pairs = self._rule_pairs[rule_idx]
+        if pairs is None:
+            pairs = set(rule_pairs(self.rules[rule_idx], self.user_mgr, self.res_mgr))
+            self._rule_pairs[rule_idx] = pairs
+        return pairs
+
+    def action_pairs(self, action):
+        """
+        (uid, rid) pairs permitted to perform action by any rule.
+
+        Returns:
+            set: (uid, rid) tuples
+        """
+        pairs = self._action_pairs.get(action)
+        if pairs is None:
+            pairs = set()
+            for rule_idx, rule in enumerate(self.rules):
+                if action in rule.acts:
+                    pairs |= self.rule_pairs(rule_idx)
+            self._action_pairs[action] = pairs
+        return pairs
+
+    def is_permitted(self, uid, rid, action):
+        return (uid, rid) in self.action_pairs(action)
+
+    def decide(self, uid, rid, action):
+        """
+        Returns:
+            str: 'Permit' or 'Deny'
+        """
+        return "Permit" if self.is_permitted(uid, rid, action) else "Deny"
+
+    def permissions(self):
+        """
+        Yield every permitted (uid, rid, action) triple once.
+        """
+        for action in self.actions:
+            for uid, rid in self.action_pairs(action):
+                yield uid, rid, action
+
+    def attribute_counts(self, rule_idx):
+        """
+        Heatmap counts for one rule: for every attribute the rule references, the number of
+        authorizations (user, resource, action) it grants where the user/resource has that attribute.
+
+        Returns:
+            dict: "user.<attr>" / "resource.<attr>" -> count
+        """
+        rule = self.rules[rule_idx]
+        pairs = self.rule_pairs(rule_idx)
+        num_acts = len(rule.acts)
+        users = self.user_mgr.users
+        resources = self.res_mgr.resources
+        rule_attributes = rule.get_attributes()
+
+        counts = {}
+        for attr in rule_attributes["user"]:
+            counts[f"user.{attr}"] = num_acts * sum(1 for uid, _ in pairs if attr in users[uid].attributes)
+        for attr in rule_attributes["resource"]:
+            counts[f"resource.{attr}"] = num_acts * sum(1 for _, rid in pairs if attr in resources[rid].attributes)
+        return counts
+
+    def resource_counts(self):
+        """
+        Number of (user, rule, action) grants per resource.
+
+        Returns:
+            dict: rid -> count, in resource order
+        """
+        counts = dict.fromkeys(self.res_mgr.resources, 0)
+        for rule_idx, rule in enumerate(self.rules):
+            num_acts = len(rule.acts)
+            for _, rid in self.rule_pairs(rule_idx):
+                counts[rid] += num_acts
+        return counts
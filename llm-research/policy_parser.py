@@ -0,0 +1,398 @@
+#Streaming .abac policy parser
+# The file is read line by line (never loaded whole) and every line is scanned once: userAttrib /
+# resourceAttrib lines are split into their id and key=value pairs and stored straight into the
+# managers (names and values interned, equal sets shared, like User.add_attribute does), rule lines
+# go to RuleManager.parse_rule. The managers are the same as the ones the per line parse_* methods
+# build, but a malformed line raises a PolicySyntaxError with its line and column instead of a
+# ValueError from tuple unpacking.
+#
+# With workers > 1 (and a big enough file) the file is split into chunks at line boundaries and the
+# attribute lines of every chunk are scanned in a worker process. The chunks are merged back in
+# file order, so later lines still replace earlier ones with the same id.
+
+import io
+import os
+import sys
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from user import User, UserManager
+from res import Resource, ResourceManager
+from rule import RuleManager
+
+# files smaller than this are always parsed in one process, the pool costs more than it saves
+PARALLEL_MIN_BYTES = 4 << 20
+# chunks per worker, keeps the workers busy when some chunks are mostly rules or comments
+CHUNKS_PER_WORKER = 4
+
+USER, RESOURCE, RULE = "userAttrib", "resourceAttrib", "rule"
+
+
+class PolicySyntaxError(ValueError):
+    """
+    Malformed policy line.
+
+    Args:
+        message (str): what is wrong
+        file_name (str): policy file
+        line (int): line number, from 1
+        column (int): column in the line, from 1
+        text (str): the line as it is in the file
+    """
+
+    def __init__(self, message, file_name=None, line=None, column=None, text=None):
+        self.message = message
+        self.file_name = file_name
+        self.line = line
+        self.column = column
+        self.text = text
+        super().__init__(message)
+
+    def __str__(self):
+        where = ":".join(str(part) for part in (self.file_name, self.line, self.column) if part is not None)
+        result = f"{where}: {self.message}" if where else self.message
+        if self.text is not None:
+            result += f"\n    {self.text.rstrip()}"
+            if self.column is not None:
+                result += "\n    " + " " * (self.column - 1) + "^"
+        return result
+
+    def __reduce__(self):
+        # raised in worker processes, keep every field when pickled back
+        return (PolicySyntaxError, (self.message, self.file_name, self.line, self.column, self.text))
+
+
+def line_kind(line):
+    """
+    Kind of a stripped line, None for blank lines, comments and anything else.
+    """
+    if not line or line[0] == "#":
+        return None
+    if line.startswith(USER):
+        return USER
+    if line.startswith(RESOURCE):
+        return RESOURCE
+    if line.startswith(RULE):
+        return RULE
+    return None
+
+
+def scan_attrib(line):
+    """
+    Split an attribute line, e.g. "userAttrib(u1, position=staff, projects={p1 p2})".
+
+    Values keep what the old parser kept: the text after "=" (trailing spaces removed), or a
+    frozenset of the space separated elements of a {...} value.
+
+    Args:
+        line (str): stripped userAttrib / resourceAttrib line
+
+    Returns:
+        str, list: entity id and (key, value) pairs in line order
+
+    Raises:
+        PolicySyntaxError: with the column in the stripped line, no line number
+    """
+    open_pos = line.find("(")
+    close_pos = line.rfind(")")
+    if open_pos == -1:
+        keyword = RESOURCE if line.startswith(RESOURCE) else USER
+        raise PolicySyntaxError("expected '(' after the line type", column=len(keyword) + 1)
+    if close_pos < open_pos:
+        raise PolicySyntaxError("missing closing ')'", column=len(line) + 1)
+
+    entity_id, comma, attrs = line[open_pos + 1:close_pos].partition(",")
+    entity_id = entity_id.strip()
+    items = []
+    if not comma:
+        return entity_id, items
+
+    for attr in attrs.split(","):
+        key, eq, value = attr.strip().partition("=")
+        if not eq:
+            raise PolicySyntaxError(f"expected key=value, got '{attr.strip()}'",
+                                    column=_attr_column(line, open_pos, len(items)))
+        if value.startswith("{"):
+            if not value.endswith("}"):
+                raise PolicySyntaxError(f"set value of '{key.strip()}' is missing its closing '}}'",
+                                        column=_attr_column(line, open_pos, len(items)))
+            value = frozenset(value[1:-1].split())
+        items.append((key.strip(), value))
+    return entity_id, items
+
+
+def _attr_column(line, open_pos, index):
+    # column (from 1) of the index-th key=value pair, only computed for errors
+    pos = line.find(",", open_pos) + 1
+    for _ in range(index):
+        pos = line.find(",", pos) + 1
+    while pos < len(line) and line[pos] == " ":
+        pos += 1
+    return pos + 1
+
+
+def rule_column(line):
+    """
+    Best guess of the column (from 1) where RuleManager.parse_rule failed on a line.
+
+    Returns:
+        int, str: column and what is wrong there
+    """
+    open_pos = line.find("(")
+    close_pos = line.rfind(")")
+    start = open_pos + 1
+    content = line[start:close_pos] if close_pos > open_pos else line[start:]
+
+    sections = content.split(";")
+    if len(sections) < 3:
+        return start + len(content) + 1, "expected 'subject conditions; resource conditions; actions[; constraints]'"
+
+    offset = start
+    for number, section in enumerate(sections[:4]):
+        for part in section.split(","):
+            ops = ("=", ">", "]", "[") if number == 3 else ("[", "]")
+            for op in ops:
+                if op in part:
+                    if part.count(op) > 1:
+                        second = part.find(op, part.find(op) + 1)
+                        return offset + second + 1, f"more than one '{op}' in '{part.strip()}'"
+                    break
+            offset += len(part) + 1
+    return start + 1, "malformed rule"
+
+
+def store_entity(kind, entity_id, items, user_mgr, res_mgr):
+    """
+    Add a scanned attribute line to its manager, same result as parse_user_attrib / parse_resource_attrib.
+    """
+    intern = sys.intern
+    if kind == USER:
+        entity = User(entity_id)
+        shared = user_mgr.shared_values
+    else:
+        entity = Resource(entity_id)
+        shared = res_mgr.shared_values
+    attributes = entity.attributes
+
+    for key, value in items:
+        if value.__class__ is frozenset:
+            found = shared.get(value)
+            if found is None:
+                # frozensets coming from worker processes are not interned yet
+                found = frozenset(map(intern, value))
+                shared[found] = found
+            value = found
+        else:
+            value = intern(value)
+        attributes[intern(key)] = value
+
+    if kind == USER:
+        user_mgr.users[entity_id] = entity
+        user_mgr.version += 1
+    else:
+        res_mgr.resources[entity_id] = entity
+        res_mgr.version += 1
+    return entity
+
+
+def parse_rule_line(line, rule_mgr):
+    try:
+        return rule_mgr.parse_rule(line)
+    except (ValueError, IndexError) as exc:
+        column, message = rule_column(line)
+        raise PolicySyntaxError(message, column=column) from exc
+
+
+def _located(exc, file_name, line_no, raw):
+    # turn a column in the stripped line into a located error on the raw line
+    indent = len(raw) - len(raw.lstrip())
+    column = exc.column + indent if exc.column is not None else None
+    return PolicySyntaxError(exc.message, file_name, line_no, column, raw.rstrip("\r\n"))
+
+
+def parse_lines(lines, user_mgr, res_mgr, rule_mgr, file_name=None, first_line=1):
+    """
+    Parse policy lines into the managers.
+
+    Args:
+        lines (iterable): raw lines, e.g. an open file
+        user_mgr (UserManager): receives the userAttrib lines
+        res_mgr (ResourceManager): receives the resourceAttrib lines
+        rule_mgr (RuleManager): receives the rule lines
+        file_name (str): used in error messages
+        first_line (int): number of the first line, used in error messages
+
+    Raises:
+        PolicySyntaxError: on the first malformed line
+    """
+    line_no = first_line - 1
+    for raw in lines:
+        line_no += 1
+        line = raw.strip()
+        kind = line_kind(line)
+        if kind is None:
+            continue
+        try:
+            if kind == RULE:
+                parse_rule_line(line, rule_mgr)
+            else:
+                entity_id, items = scan_attrib(line)
+                store_entity(kind, entity_id, items, user_mgr, res_mgr)
+        except PolicySyntaxError as exc:
+            raise _located(exc, file_name, line_no, raw) from exc.__cause__
+
+
+def chunk_offsets(file_name, num_chunks):
+    """
+    Byte offsets splitting a file into about num_chunks pieces, every piece starts at a line start.
+
+    Returns:
+        list: (start, end) byte ranges covering the whole file
+    """
+    size = os.path.getsize(file_name)
+    step = max(1, size // max(1, num_chunks))
+    bounds = [0]
+    with open(file_name, "rb") as f:
+        while bounds[-1] + step < size:
+            f.seek(bounds[-1] + step)
+            f.readline()
+            pos = f.tell()
+            if pos >= size:
+                break
+            bounds.append(pos)
+    bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+
+def parse_chunk(file_name, start, end):
+    """
+    Scan the lines of one chunk, runs in a worker process.
+
+    The attribute lines are sent back in a compact form that is cheap to pickle: every distinct
+    id, key and value once in a table, and the lines as a flat array of table positions
+    (kind, id, number of pairs, key, value, key, value, ...).
+
+    Returns:
+        list, array, list, int: value table, attribute line records, (relative line number,
+                                stripped line, raw line) of the rules, number of lines
+    """
+    with open(file_name, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    table = {}
+    records = array("l")
+    rules = []
+    line_no = 0
+
+    def position(value):
+        pos = table.get(value)
+        if pos is None:
+            pos = table[value] = len(table)
+        return pos
+
+    for raw in io.StringIO(data.decode("utf-8"), newline=None):
+        line_no += 1
+        line = raw.strip()
+        kind = line_kind(line)
+        if kind is None:
+            continue
+        if kind == RULE:
+            # rules are few, they are parsed in order by the main process
+            rules.append((line_no, line, raw))
+            continue
+        try:
+            entity_id, items = scan_attrib(line)
+        except PolicySyntaxError as exc:
+            raise _located(exc, file_name, line_no, raw) from None
+        records.append(0 if kind == USER else 1)
+        records.append(position(entity_id))
+        records.append(len(items))
+        for key, value in items:
+            records.append(position(key))
+            records.append(position(value))
+    return list(table), records, rules, line_no
+
+
+def merge_chunk(values, records, user_mgr, res_mgr):
+    """
+    Store the attribute lines of a parse_chunk result, same result as store_entity line by line.
+    """
+    intern = sys.intern
+    strings = [intern(value) if value.__class__ is str else None for value in values]
+    # sets are shared per manager like the sequential parser does, so every manager has its own
+    # table where a set is looked up the first time it is used (None until then)
+    tables = (list(strings), list(strings))
+    shared_values = (user_mgr.shared_values, res_mgr.shared_values)
+    users, resources = user_mgr.users, res_mgr.resources
+    fields = iter(records)
+    for kind in fields:
+        entity_id = strings[next(fields)]
+        table = tables[kind]
+        if kind == 0:
+            entity = User(entity_id)
+            users[entity_id] = entity
+            user_mgr.version += 1
+        else:
+            entity = Resource(entity_id)
+            resources[entity_id] = entity
+            res_mgr.version += 1
+        attributes = entity.attributes
+        for _ in range(next(fields)):
+            key = strings[next(fields)]
+            pos = next(fields)
+            value = table[pos]
+            if value is None:
+                shared = shared_values[kind]
+                value = shared.get(values[pos])
+                if value is None:
+                    value = frozenset(map(intern, values[pos]))
+                    shared[value] = value
+                table[pos] = value
+            attributes[key] = value
+
+
+def parse_policy(file_name, workers=1, user_mgr=None, res_mgr=None, rule_mgr=None):
+    """
+    Parse a policy file, in a process pool when workers > 1 and the file is large.
+
+    Args:
+        file_name (str): .abac file
+        workers (int): number of worker processes
+        user_mgr, res_mgr, rule_mgr: managers to fill, new ones by default
+
+    Returns:
+        UserManager, ResourceManager, RuleManager: the parsed policy (rules are not indexed yet)
+
+    Raises:
+        PolicySyntaxError: on the first malformed line
+    """
+    user_mgr = user_mgr if user_mgr is not None else UserManager()
+    res_mgr = res_mgr if res_mgr is not None else ResourceManager()
+    rule_mgr = rule_mgr if rule_mgr is not None else RuleManager()
+
+    if workers <= 1 or os.path.getsize(file_name) < PARALLEL_MIN_BYTES:
+        with open(file_name, "r", encoding="UTF-8") as f:
+            parse_lines(f, user_mgr, res_mgr, rule_mgr, file_name)
+        return user_mgr, res_mgr, rule_mgr
+
+    chunks = chunk_offsets(file_name, workers * CHUNKS_PER_WORKER)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(parse_chunk, file_name, start, end) for start, end in chunks]
+        # line number before the current chunk, the chunks are merged in file order
+        base = 0
+        for future in futures:
+            try:
+                values, records, rules, num_lines = future.result()
+            except PolicySyntaxError as exc:
+                exc.line += base
+                raise
+            merge_chunk(values, records, user_mgr, res_mgr)
+            for line_no, line, raw in rules:
+                try:
+                    parse_rule_line(line, rule_mgr)
+                except PolicySyntaxError as exc:
+                    raise _located(exc, file_name, base + line_no, raw) from exc.__cause__
+            base += num_lines
+
+    return user_mgr, res_mgr, rule_mgr
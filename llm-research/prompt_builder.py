@@ -0,0 +1,84 @@
+#Prompt assembly
+# The complete request is the prompt template with the content of a section file inserted after
+# every marker line. The templates and the sections that don't change during a session (attribute
+# description, attribute data, ground truth ACL) are read once, the request is assembled in memory
+# and only written to a file to keep a trace of what was sent.
+import io
+
+
+def read_text(file_name):
+    with open(file_name, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+class PromptBuilder:
+    """
+    Builds the complete requests of one session.
+
+    Args:
+        gt_acl_file (str): ground truth ACL
+        attribute_data_file (str): users and resources of the organization
+        attribute_data_description_file (str): description of the attributes
+    """
+
+    def __init__(self, gt_acl_file, attribute_data_file, attribute_data_description_file):
+        # marker -> section content
+        self.static_sections = {
+            "## ATTRIBUTE_DESCRIPTION ##": read_text(attribute_data_description_file),
+            "## ATTRIBUTE_DATA ##": read_text(attribute_data_file),
+            "## GROUND_TRUTH_ACL ##": read_text(gt_acl_file),
+        }
+        # prompt file -> (lines, content)
+        self.templates = {}
+
+    def template(self, prompt_file):
+        cached = self.templates.get(prompt_file)
+        if cached is None:
+            content = read_text(prompt_file)
+            cached = self.templates[prompt_file] = (list(io.StringIO(content)), content)
+        return cached
+
+    def build(self, prompt_file, comparison_text="", current_rules_text=""):
+        """
+        Assemble a complete request.
+
+        Args:
+            prompt_file (str): prompt template (initial or subsequent starting prompt)
+            comparison_text (str): ACL comparison of the last iteration, the comparison and
+                                   current rules sections are only filled in when it is not empty
+            current_rules_text (str): rules of the last LLM response
+
+        Returns:
+            str: complete request, as written to the complete prompt file
+        """
+        lines, content = self.template(prompt_file)
+
+        sections = dict(self.static_sections)
+        sections["LLM REQUEST"] = content
+        if comparison_text.strip():
+            sections["## ACL_COMPARISON ##"] = comparison_text
+            sections["## CURRENT_RULES ##"] = current_rules_text
+
+        parts = []
+        for line in lines:
+            parts.append(line)
+            section = sections.get(line.strip())
+            if section is not None:
+                parts.append(section)
+        return "".join(parts)
+
+    def build_from_files(self, prompt_file, comparison_file, current_rules_file):
+        """
+        build with the comparison and current rules read from the session files.
+        """
+        comparison_text = read_text(comparison_file)
+        current_rules_text = read_text(current_rules_file) if comparison_text.strip() else ""
+        return self.build(prompt_file, comparison_text, current_rules_text)
+
+    @staticmethod
+    def write(request, complete_request_file):
+        """
+        Keep a trace of the request that was sent.
+        """
+        with open(complete_request_file, "w", encoding="utf-8") as f:
+            f.write(request)
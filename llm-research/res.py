@@ -1,10 +1,17 @@
-import pickle
+import sys
+from attribute_values import compact_value
+
 class Resource:
+    # no per instance __dict__, only the attribute dict: the evaluators read it directly (dict.get)
+    # so it stays a plain dict, one per resource. Its names and string values are
+    # interned, equal set values are one frozenset shared through the manager's shared_values.
+    __slots__ = ("attributes",)
+
     def __init__(self, rid):
-        self.attributes = {"rid": rid}
+        self.attributes = {"rid": sys.intern(rid)}
 
-    def add_attribute(self, key, value):
-        self.attributes[key] = value
+    def add_attribute(self, key, value, shared=None):
+        self.attributes[sys.intern(key)] = compact_value(value, shared)
 
     def get_attribute(self, key):
         return self.attributes.get(key)
@@ -17,6 +24,10 @@ class Resource:
 
 class ResourceManager:
     def __init__(self):
+        # bumped whenever the data is (re)loaded, lets caches notice a reload
+        self.version = 0
+        # equal set values are stored once and shared between entities
+        self.shared_values = {}
         self.resources = {}
 
     def parse_resource_attrib(self, line):
@@ -32,18 +43,24 @@ class ResourceManager:
                 # Handle set values
                 if value.startswith("{"):
                     value = set(value[1:-1].split())
-                resource.add_attribute(key.strip(), value)
+                resource.add_attribute(key.strip(), value, self.shared_values)
 
         self.resources[rid] = resource
+        self.version += 1
         return resource
 
     def get_resource(self, rid):
         return self.resources.get(rid)
 
     def serialize(self, file_path):
-        with open(file_path, 'wb') as file:
-            pickle.dump(self.resources, file)
+        # binary snapshot holding only this manager, see snapshot.py
+        from snapshot import write_snapshot
+        write_snapshot(file_path, res_mgr=self)
 
     def deserialize(self, file_path):
-        with open(file_path, 'rb') as file:
-            self.resources = pickle.load(file)
\ No newline at end of file
+        from snapshot import load_snapshot, SnapshotError
+        user_mgr, res_mgr, rule_mgr = load_snapshot(file_path)
+        if res_mgr is None:
+            raise SnapshotError(f"{file_path} holds no resources")
+        self.resources = res_mgr.resources
+        self.version += 1
\ No newline at end of file
@@ -0,0 +1,267 @@
+#Subject specialized residual policies
+# Partial evaluation of the rules against one user: every subject condition is decided on the
+# user's attributes (rules the user fails are dropped) and the user side of every constraint is
+# filled in with the user's value, e.g. "uid [ recipients" for alice becomes
+# "resource.recipients contains alice". What is left is a short list of checks over resource
+# attributes per action, dispatched on the resource side of the RuleIndex keys (the user side keys
+# are resolved with the user's values). Residual policies are kept per subject in a bounded LRU
+# cache, so repeated requests of the same subject only run the resource side of the rules that can
+# still permit.
+# Gives the same decision as Rule.evaluate, see rule.compile_condition / compile_constraint.
+
+from collections import OrderedDict
+
+from attribute_values import SET_TYPES
+from rule import compile_condition
+
+
+def residual_constraint(op, user_val, right_attr):
+    """
+    Constraint with the user value filled in.
+
+    Args:
+        op (str): "=", ">", "]" or "["
+        user_val: the user's value of the left attribute (None when missing)
+        right_attr (str): resource attribute name
+
+    Returns:
+        function: check(resource_attributes) -> bool, or None when no resource can pass
+    """
+    if op == "=":
+        if user_val is None:
+            return None
+        def check(res_attrs):
+            res_val = res_attrs.get(right_attr)
+            return res_val is not None and user_val == res_val
+    elif op == ">":  # supseteq
+        if not isinstance(user_val, SET_TYPES):
+            return None
+        def check(res_attrs):
+            res_val = res_attrs.get(right_attr)
+            return res_val is not None and user_val.issuperset(res_val)
+    elif op == "]":
+        if not isinstance(user_val, SET_TYPES):
+            return None
+        def check(res_attrs):
+            res_val = res_attrs.get(right_attr)
+            return res_val is not None and res_val in user_val
+    elif op == "[":
+        if user_val is None:
+            return None
+        def check(res_attrs):
+            res_val = res_attrs.get(right_attr)
+            return isinstance(res_val, SET_TYPES) and user_val in res_val
+    else:
+        if user_val is None:
+            return None
+        def check(res_attrs):
+            return res_attrs.get(right_attr) is not None
+    return check
+
+
+def all_checks(checks):
+    # one check over the resource attributes out of several
+    if not checks:
+        return lambda res_attrs: True
+    if len(checks) == 1:
+        return checks[0]
+    checks = tuple(checks)
+
+    def check(res_attrs):
+        for cond in checks:
+            if not cond(res_attrs):
+                return False
+        return True
+    return check
+
+
+class CompiledRule:
+    """
+    The user independent parts of a rule, compiled once and shared by every residual policy.
+    """
+    __slots__ = ("rule", "sub_checks", "res_checks", "cons")
+
+    def __init__(self, rule):
+        self.rule = rule
+        self.sub_checks = tuple(compile_condition(attr, op, value) for attr, op, value in rule.sub_cond)
+        self.res_checks = [compile_condition(attr, op, value) for attr, op, value in rule.res_cond]
+        self.cons = tuple(rule.cons)
+
+
+class ResidualPolicy:
+    """
+    Rules of a policy specialized to one user.
+
+    Args:
+        uid (str): the user
+        by_action (dict): action -> (checks of the rules every resource is a candidate for,
+                          ((resource attr, {value: checks}, checks of every rule keyed on attr), ...)),
+                          see RuleIndex.candidates
+        num_rules (int): rules left after the partial evaluation
+    """
+    __slots__ = ("uid", "by_action", "num_rules")
+
+    def __init__(self, uid, by_action, num_rules):
+        self.uid = uid
+        self.by_action = by_action
+        self.num_rules = num_rules
+
+    def decide(self, resource, action):
+        """
+        Returns:
+            str: 'Permit' or 'Deny'
+        """
+        entry = self.by_action.get(action)
+        if entry is None:
+            return "Deny"
+        unkeyed, keyed = entry
+        res_attrs = resource.attributes
+        for check in unkeyed:
+            if check(res_attrs):
+                return "Permit"
+        for attr, groups, every in keyed:
+            value = res_attrs.get(attr)
+            if value is None:
+                continue
+            # set valued attributes pass "[" conditions, every rule keyed on attr is a candidate
+            for check in every if isinstance(value, SET_TYPES) else groups.get(value, ()):
+                if check(res_attrs):
+                    return "Permit"
+        return "Deny"
+
+    def __len__(self):
+        return self.num_rules
+
+
+def residual_rule(compiled, user_attrs):
+    """
+    Returns:
+        function: check(resource_attributes) of the rule for this user, None when the user can't pass it
+    """
+    if not all(check(user_attrs) for check in compiled.sub_checks):
+        return None
+    checks = list(compiled.res_checks)
+    for left_attr, op, right_attr in compiled.cons:
+        check = residual_constraint(op, user_attrs.get(left_attr), right_attr)
+        if check is None:
+            return None
+        checks.append(check)
+    return all_checks(checks)
+
+
+def specialize(user, index, compiled_rules):
+    """
+    Partially evaluate the rules against a user.
+
+    Args:
+        user (User): the subject
+        index (RuleIndex): index of the rules
+        compiled_rules (list): CompiledRule of every rule of index.rules, in the same order
+
+    Returns:
+        ResidualPolicy: the rules the user can still be permitted by, over resource attributes only
+    """
+    user_attrs = user.attributes
+    residuals = [residual_rule(compiled, user_attrs) for compiled in compiled_rules]
+
+    def checks(positions):
+        return tuple(residuals[pos] for pos in positions if residuals[pos] is not None)
+
+    by_action = {}
+    for action, bucket in index.by_action.items():
+        unkeyed = list(bucket["unkeyed"])
+        keyed = []
+        for (side, attr), groups in bucket["keyed"].items():
+            if side == "user":
+                # the user's value picks the rules once, like RuleIndex.candidates does per request
+                value = user_attrs.get(attr)
+                if value is not None:
+                    unkeyed.extend(bucket["all"][(side, attr)] if isinstance(value, SET_TYPES) else groups.get(value, ()))
+                continue
+            every = checks(bucket["all"][(side, attr)])
+            if not every:
+                continue
+            by_value = {}
+            for value, positions in groups.items():
+                found = checks(positions)
+                if found:
+                    by_value[value] = found
+            keyed.append((attr, by_value, every))
+        unkeyed = checks(sorted(unkeyed))
+        if unkeyed or keyed:
+            by_action[action] = (unkeyed, tuple(keyed))
+
+    return ResidualPolicy(user_attrs["uid"], by_action, sum(residual is not None for residual in residuals))
+
+
+class ResidualCache:
+    """
+    Bounded LRU cache of residual policies, uid -> ResidualPolicy.
+
+    Like DecisionCache, the cache remembers which managers (and versions) its policies were built
+    from and drops everything when the users or the rules are reloaded or other managers are used.
+
+    Args:
+        maxsize (int): number of subjects kept, least recently used ones are evicted first
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.index = None
+        self.compiled_rules = None
+        self.managers = None
+        self.versions = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def check_policy(self, user_mgr, rule_mgr):
+        """
+        Clear the cache if the users, rules or rule index are not the ones the residual policies came from.
+        """
+        if rule_mgr.index is None:
+            rule_mgr.build_index()
+        if (self.managers is not None and self.managers[0] is user_mgr and self.managers[1] is rule_mgr
+                and self.versions == (user_mgr.version, rule_mgr.version) and self.index is rule_mgr.index):
+            return
+        self.clear()
+        self.managers = (user_mgr, rule_mgr)
+        self.versions = (user_mgr.version, rule_mgr.version)
+        self.index = rule_mgr.index
+        self.compiled_rules = [CompiledRule(rule) for rule in self.index.rules]
+
+    def policy_for(self, user, user_mgr, rule_mgr):
+        """
+        Residual policy of a user, built on the first request of the subject.
+
+        Args:
+            user (User): the subject
+            user_mgr (UserManager): holds user data from abac
+            rule_mgr (RuleManager): holds rules from abac
+
+        Returns:
+            ResidualPolicy: the user's residual policy
+        """
+        self.check_policy(user_mgr, rule_mgr)
+        uid = user.attributes["uid"]
+        policy = self.entries.get(uid)
+        if policy is not None:
+            self.entries.move_to_end(uid)
+            self.hits += 1
+            return policy
+
+        self.misses += 1
+        policy = self.entries[uid] = specialize(user, self.index, self.compiled_rules)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        return policy
+
+    def clear(self):
+        self.entries.clear()
+        self.index = None
+        self.compiled_rules = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
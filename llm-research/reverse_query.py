@@ -0,0 +1,267 @@
+#Reverse queries
+# "who can access this resource" and "what can this user access", without going through every
+# (user, resource) pair. Users and resources get inverted indexes on their attribute values; for a
+# query every rule that has the action is checked on the one known entity (its subject or resource
+# conditions), then the other side's conditions and the constraints (with the known entity's values
+# filled in) are answered as set operations on the index of the other side.
+# Gives exactly the pairs Rule.evaluate permits, see rule.compile_condition / compile_constraint.
+
+from attribute_values import SET_TYPES
+from rule import compile_condition, compile_constraint
+
+EMPTY = frozenset()
+
+
+def hashable(value):
+    # set values are looked up by content
+    if isinstance(value, set):
+        return frozenset(value)
+    return value
+
+
+class AttributeIndex:
+    """
+    Inverted indexes over the attributes of users or resources.
+
+    Args:
+        entities (dict): id -> User or id -> Resource
+    """
+
+    def __init__(self, entities):
+        self.entities = entities
+        self.ids = frozenset(entities)
+        # attr -> ids having the attribute
+        self.present = {}
+        # attr -> value -> ids, set values are keyed by the frozenset itself
+        self.by_value = {}
+        # attr -> ids with a set value / a scalar value
+        self.set_valued = {}
+        self.scalar_valued = {}
+        # attr -> element -> ids whose set value contains the element
+        self.elements = {}
+
+        for eid, entity in entities.items():
+            for attr, value in entity.attributes.items():
+                self.present.setdefault(attr, set()).add(eid)
+                self.by_value.setdefault(attr, {}).setdefault(hashable(value), set()).add(eid)
+                if isinstance(value, SET_TYPES):
+                    self.set_valued.setdefault(attr, set()).add(eid)
+                    elements = self.elements.setdefault(attr, {})
+                    for element in value:
+                        elements.setdefault(element, set()).add(eid)
+                else:
+                    self.scalar_valued.setdefault(attr, set()).add(eid)
+
+    def with_value(self, attr, value):
+        return self.by_value.get(attr, {}).get(hashable(value), EMPTY)
+
+    def containing(self, attr, element):
+        return self.elements.get(attr, {}).get(hashable(element), EMPTY)
+
+    def matching(self, attr, op, value):
+        """
+        Ids passing one subject/resource condition, same answer as compile_condition.
+        """
+        if op == "[" and isinstance(value, SET_TYPES):
+            # scalar value in the rule's set, set values always pass
+            found = set(self.set_valued.get(attr, EMPTY))
+            for element in value:
+                found |= self.with_value(attr, element)
+            return found
+        if op == "]":
+            # scalar values always pass, set values have to contain the rule's value
+            return self.scalar_valued.get(attr, EMPTY) | self.containing(attr, value)
+        return self.present.get(attr, EMPTY)
+
+    def matching_all(self, conds):
+        """
+        Ids passing every condition of rule.sub_cond or rule.res_cond.
+        """
+        if not conds:
+            return self.ids
+        found = None
+        for attr, op, value in sorted(conds, key=lambda cond: len(self.present.get(cond[0], EMPTY))):
+            matched = self.matching(attr, op, value)
+            found = set(matched) if found is None else found & matched
+            if not found:
+                break
+        return found
+
+
+def constraint_users(index, left_attr, op, res_val):
+    """
+    Users passing "user.left_attr <op> resource value" for a known resource value, None when the
+    constraint can't be answered from the index (the candidates are then checked one by one).
+    """
+    if op == "=":
+        return index.with_value(left_attr, res_val) if res_val is not None else EMPTY
+    if op == "]":
+        # the resource value has to be an element of the user's set
+        return index.containing(left_attr, res_val) if res_val is not None else EMPTY
+    if op == "[":
+        # the user's (scalar) value has to be an element of the resource's set
+        if not isinstance(res_val, SET_TYPES):
+            return EMPTY
+        found = set()
+        for element in res_val:
+            found |= index.with_value(left_attr, element)
+        return found
+    return None
+
+
+def constraint_resources(index, right_attr, op, user_val):
+    """
+    Resources passing "user value <op> resource.right_attr" for a known user value, None when the
+    constraint can't be answered from the index.
+    """
+    if op == "=":
+        return index.with_value(right_attr, user_val) if user_val is not None else EMPTY
+    if op == "]":
+        # the resource's (scalar) value has to be an element of the user's set
+        if not isinstance(user_val, SET_TYPES):
+            return EMPTY
+        found = set()
+        for element in user_val:
+            found |= index.with_value(right_attr, element)
+        return found
+    if op == "[":
+        # the user's value has to be an element of the resource's set
+        return index.containing(right_attr, user_val) if user_val is not None else EMPTY
+    return None
+
+
+class ReverseIndex:
+    """
+    Answers reverse queries on a parsed policy.
+
+    The indexes are built on first use and rebuilt when a manager is reloaded (its version changes).
+
+    Args:
+        user_mgr (UserManager): holds users from abac
+        res_mgr (ResourceManager): holds resources from abac
+        rule_mgr (RuleManager): holds rules from abac
+    """
+
+    def __init__(self, user_mgr, res_mgr, rule_mgr):
+        self.user_mgr = user_mgr
+        self.res_mgr = res_mgr
+        self.rule_mgr = rule_mgr
+        self.versions = None
+        self.user_index = None
+        self.res_index = None
+        # id(rule) -> compiled (sub checks, res checks, constraint checks, rule), the rule is kept so its id is not reused
+        self.checks = {}
+
+    def refresh(self):
+        versions = (self.user_mgr.version, self.res_mgr.version, self.rule_mgr.version)
+        if versions != self.versions:
+            self.user_index = AttributeIndex(self.user_mgr.users)
+            self.res_index = AttributeIndex(self.res_mgr.resources)
+            self.checks = {}
+            self.versions = versions
+
+    def rule_checks(self, rule):
+        checks = self.checks.get(id(rule))
+        if checks is None:
+            checks = self.checks[id(rule)] = (
+                [compile_condition(attr, op, value) for attr, op, value in rule.sub_cond],
+                [compile_condition(attr, op, value) for attr, op, value in rule.res_cond],
+                [compile_constraint(left, op, right) for left, op, right in rule.cons],
+                rule,
+            )
+        return checks
+
+    def rules_for(self, action):
+        for rule in self.rule_mgr.rules:
+            if action is None or action in rule.acts:
+                yield rule
+
+    def users_for_resource(self, rid, action=None):
+        """
+        Users permitted to act on a resource.
+
+        Args:
+            rid (str): resource id
+            action (str): only this action, every action of the policy when None
+
+        Returns:
+            dict: action -> sorted list of uids (actions without any user are left out)
+        """
+        self.refresh()
+        resource = self.res_mgr.get_resource(rid)
+        if resource is None:
+            return {}
+        res_attrs = resource.attributes
+        users = self.user_mgr.users
+
+        granted = {}
+        for rule in self.rules_for(action):
+            _sub_checks, res_checks, con_checks, _rule = self.rule_checks(rule)
+            if not all(check(res_attrs) for check in res_checks):
+                continue
+
+            found = self.user_index.matching_all(rule.sub_cond)
+            leftover = []
+            for (left, op, right), check in zip(rule.cons, con_checks):
+                if not found:
+                    break
+                matched = constraint_users(self.user_index, left, op, res_attrs.get(right))
+                if matched is None:
+                    leftover.append(check)
+                else:
+                    found = found & matched
+            if leftover:
+                found = {uid for uid in found if all(check(users[uid].attributes, res_attrs) for check in leftover)}
+            if not found:
+                continue
+
+            for act in rule.acts:
+                if action is None or act == action:
+                    granted.setdefault(act, set()).update(found)
+
+        return {act: sorted(uids) for act, uids in sorted(granted.items())}
+
+    def resources_for_user(self, uid, action=None):
+        """
+        Resources a user is permitted to act on.
+
+        Args:
+            uid (str): user id
+            action (str): only this action, every action of the policy when None
+
+        Returns:
+            dict: action -> sorted list of rids (actions without any resource are left out)
+        """
+        self.refresh()
+        user = self.user_mgr.get_user(uid)
+        if user is None:
+            return {}
+        user_attrs = user.attributes
+        resources = self.res_mgr.resources
+
+        granted = {}
+        for rule in self.rules_for(action):
+            sub_checks, _res_checks, con_checks, _rule = self.rule_checks(rule)
+            if not all(check(user_attrs) for check in sub_checks):
+                continue
+
+            found = self.res_index.matching_all(rule.res_cond)
+            leftover = []
+            for (left, op, right), check in zip(rule.cons, con_checks):
+                if not found:
+                    break
+                matched = constraint_resources(self.res_index, right, op, user_attrs.get(left))
+                if matched is None:
+                    leftover.append(check)
+                else:
+                    found = found & matched
+            if leftover:
+                found = {rid for rid in found if all(check(user_attrs, resources[rid].attributes) for check in leftover)}
+            if not found:
+                continue
+
+            for act in rule.acts:
+                if action is None or act == action:
+                    granted.setdefault(act, set()).update(found)
+
+        return {act: sorted(rids) for act, rids in sorted(granted.items())}
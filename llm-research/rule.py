@@ -1,10 +1,138 @@
-import pickle
+from attribute_values import SET_TYPES
+from rule_index import RuleIndex
+
+
+def compile_condition(attr, op, value):
+    """
+    Turn one subject/resource condition into a check over an attribute dict.
+    Mirrors the condition loop of Rule.evaluate, the branch on the rule value is taken here once.
+
+    Args:
+        attr (str): attribute name
+        op (str): "[" or "]"
+        value (str or set): value from the rule
+
+    Returns:
+        function: check(attributes) -> bool
+    """
+    if op == "[" and isinstance(value, SET_TYPES):
+        def check(attributes):
+            val = attributes.get(attr)
+            if val is None:
+                return False
+            return isinstance(val, SET_TYPES) or val in value
+    elif op == "]":
+        def check(attributes):
+            val = attributes.get(attr)
+            if val is None:
+                return False
+            return not isinstance(val, SET_TYPES) or value in val
+    else:
+        # only the presence of the attribute is checked
+        def check(attributes):
+            return attributes.get(attr) is not None
+
+    return check
+
+
+def compile_constraint(left_attr, op, right_attr):
+    """
+    Turn one constraint into a check over the user and resource attribute dicts.
+    Mirrors the constraint loop of Rule.evaluate.
+
+    Args:
+        left_attr (str): user attribute name
+        op (str): "=", ">", "]" or "["
+        right_attr (str): resource attribute name
+
+    Returns:
+        function: check(user_attributes, resource_attributes) -> bool
+    """
+    def values(user_attrs, res_attrs):
+        return user_attrs.get(left_attr), res_attrs.get(right_attr)
+
+    if op == "=":
+        def check(user_attrs, res_attrs):
+            user_val, res_val = values(user_attrs, res_attrs)
+            return user_val is not None and res_val is not None and user_val == res_val
+    elif op == ">":  # supseteq
+        def check(user_attrs, res_attrs):
+            user_val, res_val = values(user_attrs, res_attrs)
+            return res_val is not None and isinstance(user_val, SET_TYPES) and user_val.issuperset(res_val)
+    elif op == "]":
+        def check(user_attrs, res_attrs):
+            user_val, res_val = values(user_attrs, res_attrs)
+            return res_val is not None and isinstance(user_val, SET_TYPES) and res_val in user_val
+    elif op == "[":
+        def check(user_attrs, res_attrs):
+            user_val, res_val = values(user_attrs, res_attrs)
+            return user_val is not None and isinstance(res_val, SET_TYPES) and user_val in res_val
+    else:
+        def check(user_attrs, res_attrs):
+            user_val, res_val = values(user_attrs, res_attrs)
+            return user_val is not None and res_val is not None
+
+    return check
+
+
 class Rule:
     def __init__(self, sub_cond, res_cond, acts, cons):
         self.sub_cond = sub_cond  # Subject conditions
         self.res_cond = res_cond  # Resource conditions
         self.acts = acts  # Allowed actions
         self.cons = cons  # Constraints
+        # check(user, resource, action) is what the evaluation loops call,
+        # it stays the interpreted evaluate until compile() replaces it
+        self.compiled = False
+        self.check = self.evaluate
+
+    def compile(self):
+        """
+        Build the compiled form of the rule and use it as self.check.
+        Gives the same answer as evaluate() without re-reading the condition tuples per call.
+        The rule should not be edited after compiling (call compile() again if it is).
+
+        Returns:
+            function: check(user, resource, action) -> bool
+        """
+        acts = frozenset(self.acts)
+        sub_checks = tuple(compile_condition(attr, op, value) for attr, op, value in self.sub_cond)
+        res_checks = tuple(compile_condition(attr, op, value) for attr, op, value in self.res_cond)
+        con_checks = tuple(compile_constraint(left, op, right) for left, op, right in self.cons)
+
+        def check(user, resource, action):
+            if action not in acts:
+                return False
+            user_attrs = user.attributes
+            for cond in sub_checks:
+                if not cond(user_attrs):
+                    return False
+            res_attrs = resource.attributes
+            for cond in res_checks:
+                if not cond(res_attrs):
+                    return False
+            for cond in con_checks:
+                if not cond(user_attrs, res_attrs):
+                    return False
+            return True
+
+        self.compiled = True
+        self.check = check
+        return check
+
+    def __getstate__(self):
+        # compiled checks are closures and cannot be pickled, they are rebuilt on load
+        state = self.__dict__.copy()
+        state.pop("check", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.compiled = state.get("compiled", False)
+        if self.compiled:
+            self.compile()
+        else:
+            self.check = self.evaluate
 
     def get_attributes(self):
         user_attributes = {attr for attr, _, _ in self.sub_cond}  
@@ -36,10 +164,10 @@ class Rule:
             user_val = user.get_attribute(attr)
             if user_val is None:
                 return False
-            if op == "[" and isinstance(value, set):
-                if not isinstance(user_val, set) and user_val not in value:
+            if op == "[" and isinstance(value, SET_TYPES):
+                if not isinstance(user_val, SET_TYPES) and user_val not in value:
                     return False
-            elif op == "]" and isinstance(user_val, set):
+            elif op == "]" and isinstance(user_val, SET_TYPES):
                 if value not in user_val:
                     return False
 
@@ -48,10 +176,10 @@ class Rule:
             res_val = resource.get_attribute(attr)
             if res_val is None:
                 return False
-            if op == "[" and isinstance(value, set):
-                if not isinstance(res_val, set) and res_val not in value:
+            if op == "[" and isinstance(value, SET_TYPES):
+                if not isinstance(res_val, SET_TYPES) and res_val not in value:
                     return False
-            elif op == "]" and isinstance(res_val, set):
+            elif op == "]" and isinstance(res_val, SET_TYPES):
                 if value not in res_val:
                     return False
 
@@ -66,13 +194,13 @@ class Rule:
                 if user_val != res_val:
                     return False
             elif op == ">":  # supseteq
-                if not isinstance(user_val, set) or not user_val.issuperset(res_val):
+                if not isinstance(user_val, SET_TYPES) or not user_val.issuperset(res_val):
                     return False
             elif op == "]":
-                if not isinstance(user_val, set) or res_val not in user_val:
+                if not isinstance(user_val, SET_TYPES) or res_val not in user_val:
                     return False
             elif op == "[":
-                if not isinstance(res_val, set) or user_val not in res_val:
+                if not isinstance(res_val, SET_TYPES) or user_val not in res_val:
                     return False
 
         return True
@@ -80,8 +208,13 @@ class Rule:
 
 
 class RuleManager:
-    def __init__(self):
+    def __init__(self, compiled=True):
         self.rules = []
+        self.index = None
+        # bumped whenever the rules are (re)loaded, lets caches notice a reload
+        self.version = 0
+        # compiled=False keeps every rule on the interpreted Rule.evaluate (for debugging)
+        self.compiled = compiled
 
     def parse_rule(self, line):
         content = line[line.find("(")+1:line.rfind(")")].strip()
@@ -142,10 +275,42 @@ class RuleManager:
                     cons.append((left.strip(), "[", right.strip()))
 
         rule = Rule(sub_cond, res_cond, acts, cons)
+        if self.compiled:
+            rule.compile()
 
         self.rules.append(rule)
+        # any index built so far no longer covers every rule
+        self.index = None
+        self.version += 1
         return rule
 
+    def build_index(self):
+        """
+        Build the action/attribute dispatch index over the current rules.
+        Called once after the policy is parsed, see RuleIndex.
+
+        Returns:
+            RuleIndex: the new index
+        """
+        self.index = RuleIndex(self.rules)
+        return self.index
+
+    def candidate_rules(self, user, resource, action):
+        """
+        Rules that could permit the request, the index is (re)built if it is missing.
+
+        Args:
+            user (User): requesting subject
+            resource (Resource): requested object
+            action (str): requested action
+
+        Returns:
+            list: Rule objects worth evaluating, in policy order
+        """
+        if self.index is None:
+            self.build_index()
+        return self.index.candidates(user, resource, action)
+
     def get_rule(self, index):
         """
         Retrieve a rule by its index.
@@ -162,9 +327,15 @@ class RuleManager:
             raise IndexError("Rule index out of range")
         
     def serialize(self, file_path):
-        with open(file_path, 'wb') as file:
-            pickle.dump(self.rules, file)
+        # binary snapshot holding only this manager, see snapshot.py
+        from snapshot import write_snapshot
+        write_snapshot(file_path, rule_mgr=self)
 
     def deserialize(self, file_path):
-        with open(file_path, 'rb') as file:
-            self.rules = pickle.load(file)
\ No newline at end of file
+        from snapshot import load_snapshot, SnapshotError
+        user_mgr, res_mgr, rule_mgr = load_snapshot(file_path)
+        if rule_mgr is None:
+            raise SnapshotError(f"{file_path} holds no rules")
+        self.rules = rule_mgr.rules
+        self.index = None
+        self.version += 1
\ No newline at end of file
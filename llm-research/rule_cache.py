@@ -0,0 +1,95 @@
+#Per rule permission cache for the LLM iteration loop
+# Between two iterations the LLM usually keeps most of its rules and only changes a few.
+# The permissions of every rule are cached under a normalized fingerprint of the rule, so an
+# iteration only evaluates new or changed rules and the session ACL is the union of the cached sets.
+# A rule grants different permissions on other users/resources, so every lookup names the attribute
+# data it is for (data_key, e.g. the sha256 of the attribute data file) and entries are keyed on
+# (data_key, fingerprint). Entries of older attribute data are dropped when new data shows up.
+
+from acl_engine import rule_permissions
+from attribute_values import SET_TYPES
+
+
+def rule_fingerprint(rule):
+    """
+    Normalized text form of a rule: condition, action and constraint order and set element
+    order don't change what a rule grants, so they are sorted.
+
+    Args:
+        rule (Rule): parsed rule
+
+    Returns:
+        str: fingerprint, equal for rules granting the same permissions by construction
+    """
+    def value_text(value):
+        if isinstance(value, SET_TYPES):
+            return "{" + " ".join(sorted(value)) + "}"
+        return value
+
+    def conds_text(conds):
+        return ", ".join(sorted(f"{attr} {op} {value_text(value)}" for attr, op, value in conds))
+
+    cons = ", ".join(sorted(f"{left} {op} {right}" for left, op, right in rule.cons))
+    return f"{conds_text(rule.sub_cond)}; {conds_text(rule.res_cond)}; {value_text(set(rule.acts))}; {cons}"
+
+
+class RulePermissionCache:
+    """
+    (data_key, fingerprint) -> frozenset of (uid, rid, action), kept across the iterations of one session.
+    """
+
+    def __init__(self):
+        # attribute data of the cached entries
+        self.data_key = None
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def check_data(self, data_key):
+        """
+        Drop the cached sets of other attribute data, called on every lookup.
+
+        Args:
+            data_key: anything identifying the attribute data, e.g. the sha256 of the attribute data file
+        """
+        if data_key is None:
+            raise ValueError("the rule cache needs the data_key of the users/resources the rules are evaluated on")
+        if data_key != self.data_key:
+            self.entries.clear()
+            self.data_key = data_key
+
+    def rule_permissions(self, rule, user_mgr, res_mgr, data_key):
+        """
+        Permissions granted by one rule, evaluated only if the rule is not cached yet for this data.
+
+        Args:
+            data_key: identifies the users/resources of user_mgr and res_mgr (see check_data)
+
+        Returns:
+            frozenset: (uid, rid, action) tuples
+        """
+        self.check_data(data_key)
+        key = (data_key, rule_fingerprint(rule))
+        permissions = self.entries.get(key)
+        if permissions is None:
+            self.misses += 1
+            permissions = frozenset(rule_permissions(rule, user_mgr, res_mgr))
+            self.entries[key] = permissions
+        else:
+            self.hits += 1
+        return permissions
+
+    def permissions(self, user_mgr, res_mgr, rule_mgr, data_key):
+        """
+        Every permission of the policy, the union of the per rule sets.
+
+        Args:
+            data_key: identifies the users/resources of user_mgr and res_mgr (see check_data)
+
+        Returns:
+            set: (uid, rid, action) tuples
+        """
+        acl = set()
+        for rule in rule_mgr.rules:
+            acl |= self.rule_permissions(rule, user_mgr, res_mgr, data_key)
+        return acl
@@ -0,0 +1,89 @@
+from attribute_values import SET_TYPES
+
+
+class RuleIndex:
+    """
+    Dispatch table from a request to the few rules that could grant it.
+
+    Rules are bucketed by every action in their acts. Inside an action bucket each rule is
+    keyed on one discriminating condition of the form "attr [ {v1 v2 ..}" (subject or
+    resource side), so a lookup only has to read that attribute from the user or resource
+    and pick the rules listed under its value. Rules without such a condition are always
+    returned as candidates.
+
+    The index only narrows the search, every candidate still has to pass Rule.evaluate.
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        # action -> {"keyed": {(side, attr): {value: [rule_pos]}}, "all": {(side, attr): [rule_pos]}, "unkeyed": [rule_pos]}
+        self.by_action = {}
+
+        for pos, rule in enumerate(self.rules):
+            key = self.pick_key(rule)
+            for action in rule.acts:
+                bucket = self.by_action.setdefault(action, {"keyed": {}, "all": {}, "unkeyed": []})
+                if key is None:
+                    bucket["unkeyed"].append(pos)
+                    continue
+
+                side, attr, values = key
+                groups = bucket["keyed"].setdefault((side, attr), {})
+                for value in values:
+                    groups.setdefault(value, []).append(pos)
+                bucket["all"].setdefault((side, attr), []).append(pos)
+
+    @staticmethod
+    def pick_key(rule):
+        """
+        Choose the condition a rule is filed under.
+
+        Only "[" conditions with a set value can be used: Rule.evaluate rejects a scalar
+        attribute value outside of that set and a missing attribute. The condition with the
+        fewest values wins, resource conditions are preferred on ties (e.g. type [ {roster}).
+
+        Args:
+            rule (Rule): rule to index
+
+        Returns:
+            tuple: (side, attr, values) or None when the rule has no usable condition
+        """
+        best = None
+        for side, conds in (("resource", rule.res_cond), ("user", rule.sub_cond)):
+            for attr, op, value in conds:
+                if op != "[" or not isinstance(value, SET_TYPES):
+                    continue
+                if best is None or len(value) < len(best[2]):
+                    best = (side, attr, value)
+        return best
+
+    def candidates(self, user, resource, action):
+        """
+        Return the rules that may permit action for (user, resource), in policy order.
+
+        Args:
+            user (User): requesting subject
+            resource (Resource): requested object
+            action (str): requested action
+
+        Returns:
+            list: Rule objects to evaluate
+        """
+        bucket = self.by_action.get(action)
+        if bucket is None:
+            return []
+
+        found = list(bucket["unkeyed"])
+        for (side, attr), groups in bucket["keyed"].items():
+            entity = user if side == "user" else resource
+            value = entity.get_attribute(attr)
+            if value is None:
+                continue
+            # Rule.evaluate lets set valued attributes through "[" conditions
+            if isinstance(value, SET_TYPES):
+                found.extend(bucket["all"][(side, attr)])
+            else:
+                found.extend(groups.get(value, ()))
+
+        found.sort()
+        return [self.rules[pos] for pos in found]
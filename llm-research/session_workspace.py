@@ -0,0 +1,126 @@
+#Session workspaces
+# Every organization run writes its session files (session abac, ACL, comparison, LLM response,
+# caches and outputs) into its own workspace folder, so several runs can go on at the same time.
+# The layout of a workspace is the one of llm-research/session:
+#
+#   <root>/session-*.txt            files of the current iteration
+#   <root>/cache/*.cache            every iteration of the session, newest first (rendered from the
+#                                   append only logs next to them, see iteration_log)
+#   <root>/output/*.txt             generated rules and the initial prompt
+
+import os
+import shutil
+
+from iteration_log import IterationLog
+
+DEFAULT_ROOT = "llm-research/session"
+WORKSPACES_DIR = "llm-research/workspaces"
+
+
+class SessionWorkspace:
+    """
+    Paths of the session files of one run.
+
+    Args:
+        root (str): workspace folder, llm-research/session by default
+    """
+
+    def __init__(self, root=DEFAULT_ROOT):
+        self.root = root
+        self.cache_dir = os.path.join(root, "cache")
+        self.output_dir = os.path.join(root, "output")
+
+        self.abac_file = os.path.join(root, "session-abac.txt")
+        self.acl_file = os.path.join(root, "session-ACL.txt")
+        self.comparison_file = os.path.join(root, "session-comparison.txt")
+        self.llm_response_file = os.path.join(root, "session-llm-response.txt")
+        self.info_file = os.path.join(root, "session-info.txt")
+        # abac file the ground truth ACL generator builds
+        self.gt_abac_file = os.path.join(root, "session-abac.abac")
+        # request sent to the LLM, one per workspace so runs don't overwrite each other's prompt
+        self.complete_prompt_file = os.path.join(root, "complete-prompt.txt")
+
+        self.complete_prompt_cache = os.path.join(self.cache_dir, "complete-prompt.cache")
+        self.abac_cache = os.path.join(self.cache_dir, "session-abac.cache")
+        self.acl_cache = os.path.join(self.cache_dir, "session-ACL.cache")
+        self.comparison_cache = os.path.join(self.cache_dir, "session-comparison.cache")
+        self.llm_response_cache = os.path.join(self.cache_dir, "session-llm-response.cache")
+
+        self.complete_initial_prompt_file = os.path.join(self.output_dir, "complete-initial-prompt.txt")
+        self.generated_rules_file = os.path.join(self.output_dir, "generated-rules.txt")
+        self.statistics_file = os.path.join(self.output_dir, "statistics.txt")
+
+    @classmethod
+    def for_run(cls, org_name, timestamp, base_dir=WORKSPACES_DIR):
+        """
+        Fresh workspace for one organization run, <base_dir>/<org>_<timestamp>/session.
+        The last folder is still called "session" so the tracebook keeps its folder names.
+        """
+        workspace = cls(os.path.join(base_dir, f"{org_name}_{timestamp}", "session"))
+        workspace.create()
+        return workspace
+
+    def text_files(self):
+        # every file a session writes, they all have to exist before the first iteration
+        return [
+            self.abac_file, self.acl_file, self.comparison_file, self.llm_response_file, self.info_file,
+            self.complete_prompt_file,
+            self.complete_prompt_cache, self.abac_cache, self.acl_cache, self.comparison_cache,
+            self.llm_response_cache,
+            self.complete_initial_prompt_file, self.generated_rules_file, self.statistics_file,
+        ]
+
+    def iteration_logs(self):
+        """
+        Returns:
+            dict: name -> IterationLog of every file the session keeps per iteration
+        """
+        return {
+            "complete-prompt": IterationLog(self.complete_prompt_cache),
+            "session-abac": IterationLog(self.abac_cache),
+            "session-ACL": IterationLog(self.acl_cache),
+            "session-comparison": IterationLog(self.comparison_cache),
+            "session-llm-response": IterationLog(self.llm_response_cache),
+            "generated-rules": IterationLog(self.generated_rules_file),
+        }
+
+    def render_logs(self):
+        """
+        Write the newest first .cache files (and output/generated-rules.txt) from the iteration logs.
+        """
+        for log in self.iteration_logs().values():
+            log.render()
+
+    def remove_logs(self):
+        """
+        Delete the iteration logs, once the session files they render to are written.
+        """
+        for log in self.iteration_logs().values():
+            log.reset()
+
+    def create(self):
+        """
+        Create the folders and the (empty) session files.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.clear()
+
+    def clear(self):
+        """
+        Empty every session file and iteration log, the folders are kept.
+        """
+        for file_name in self.text_files():
+            with open(file_name, "w", encoding="utf-8"):
+                pass
+        self.remove_logs()
+
+    def remove(self):
+        """
+        Delete a workspace made by for_run, once its files are saved to the tracebook.
+        The default workspace (llm-research/session) is only cleared.
+        """
+        if os.path.normpath(self.root) == os.path.normpath(DEFAULT_ROOT):
+            self.clear()
+            return
+        shutil.rmtree(os.path.dirname(self.root), ignore_errors=True)
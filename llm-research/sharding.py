@@ -0,0 +1,124 @@
+#Process pool evaluation for large datasets
+# the users are split into shards and every worker process joins all the rules against its shard
+# (acl_engine.rule_pairs). The per rule grants of the shards are merged into one PolicyEvaluation,
+# so the ACL, heatmap and bar data all come out of a single parallel pass.
+# stream_permissions gives the same grants without keeping them: every rule (or shard) is handed
+# on as soon as it is joined, for writers that don't need the whole ACL in memory.
+# The "tensor" engine evaluates the whole policy as NumPy masks instead (tensor_engine).
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from acl_engine import rule_pairs, rule_permissions
+from policy_eval import PolicyEvaluation
+from tensor_engine import PermissionTensor
+from user import UserManager
+
+# evaluation engines, see evaluate_policy
+ENGINES = ("python", "tensor")
+# shards per worker in stream_permissions, smaller shards keep less of the ACL in flight
+STREAM_SHARDS_PER_WORKER = 4
+
+
+def shard_users(user_mgr, num_shards):
+    """
+    Split the users of a UserManager into smaller UserManagers.
+
+    Args:
+        user_mgr (UserManager): users to split
+        num_shards (int): number of shards wanted
+
+    Returns:
+        list: UserManager objects, each holding a slice of the users
+    """
+    items = list(user_mgr.users.items())
+    size = max(1, -(-len(items) // max(1, num_shards)))
+
+    shards = []
+    for start in range(0, len(items), size):
+        shard = UserManager()
+        shard.users = dict(items[start:start + size])
+        shards.append(shard)
+    return shards
+
+
+def evaluate_shard(user_shard, res_mgr, rules):
+    # runs in a worker process, returns the (uid, rid) pairs of every rule for this shard
+    return [rule_pairs(rule, user_shard, res_mgr) for rule in rules]
+
+
+def stream_permissions(user_mgr, res_mgr, rule_mgr, workers=1):
+    """
+    Yield the permissions of a policy rule by rule (shard by shard with workers > 1), nothing is cached.
+
+    The same triple can come out of several rules, callers that need every permission once have to
+    deduplicate (ACLWriter does). Only one rule's pairs (or the pairs of the shards being worked on)
+    are in memory at a time.
+
+    Args:
+        user_mgr (UserManager): holds users from abac
+        res_mgr (ResourceManager): holds resources from abac
+        rule_mgr (RuleManager): holds rules from abac
+        workers (int): number of worker processes
+
+    Returns:
+        generator: (uid, rid, action) tuples
+    """
+    rules = list(rule_mgr.rules)
+    if workers <= 1 or len(user_mgr.users) < 2:
+        for rule in rules:
+            yield from rule_permissions(rule, user_mgr, res_mgr)
+        return
+
+    shards = deque(shard_users(user_mgr, workers * STREAM_SHARDS_PER_WORKER))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # at most one shard per worker waiting to be written
+        pending = deque()
+        while shards or pending:
+            while shards and len(pending) < workers:
+                pending.append(pool.submit(evaluate_shard, shards.popleft(), res_mgr, rules))
+            shard_pairs = pending.popleft().result()
+            for rule, pairs in zip(rules, shard_pairs):
+                for action in rule.acts:
+                    for uid, rid in pairs:
+                        yield uid, rid, action
+
+
+def evaluate_policy(user_mgr, res_mgr, rule_mgr, workers=1, engine="python"):
+    """
+    Evaluate a policy, in a process pool when workers > 1.
+
+    With one worker the PolicyEvaluation is returned as is (lazy). With more, every rule is
+    evaluated up front: each worker gets a copy of the resources and rules and one shard of the users.
+    The tensor engine evaluates in this process (NumPy), workers are not used.
+
+    Args:
+        user_mgr (UserManager): holds users from abac
+        res_mgr (ResourceManager): holds resources from abac
+        rule_mgr (RuleManager): holds rules from abac
+        workers (int): number of worker processes
+        engine (str): "python" (rule by rule joins) or "tensor" (PermissionTensor)
+
+    Returns:
+        PolicyEvaluation or PermissionTensor: evaluation of the policy
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"unknown engine {engine!r}, expected one of {', '.join(ENGINES)}")
+    if engine == "tensor":
+        return PermissionTensor(user_mgr, res_mgr, rule_mgr)
+
+    if workers <= 1 or len(user_mgr.users) < 2:
+        return PolicyEvaluation(user_mgr, res_mgr, rule_mgr)
+
+    # only what the workers need is pickled, not the rule index
+    rules = list(rule_mgr.rules)
+    shards = shard_users(user_mgr, workers)
+    merged = [set() for _ in rules]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(evaluate_shard, shard, res_mgr, rules) for shard in shards]
+        for future in futures:
+            for rule_idx, pairs in enumerate(future.result()):
+                merged[rule_idx].update(pairs)
+
+    return PolicyEvaluation(user_mgr, res_mgr, rule_mgr, precomputed=merged)
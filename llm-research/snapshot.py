@@ -0,0 +1,411 @@
+#Binary policy snapshots
+# A snapshot holds the parsed managers of a policy so short lived processes don't have to
+# re-parse the text policy. Layout (little endian):
+#
+#   header   magic "ABACSNAP", format version (u32), section count (u32), sha256 of the source policy,
+#            crc32 of the file with this field set to 0 (u32)
+#   table    one (kind u32, offset u64, length u64) entry per section
+#   sections every section is a flat u32 array except the string data, 8 byte aligned
+#
+#   STRING_OFFSETS  [count, offset_0 .. offset_count] into STRING_DATA
+#   STRING_DATA     utf-8 bytes of every distinct string (attribute names, values, ids, ops)
+#   SETS            [count, offset_0 .. offset_count, member string ids ...]
+#   USERS/RESOURCES [n, id string ids[n], cells, cell_entity[cells], cell_key[cells], cell_kind[cells], cell_ref[cells]]
+#   RULES           [n, per rule: n_sub, (attr, op, kind, ref) * n_sub, n_res, (...) * n_res,
+#                    n_acts, act ids, n_cons, (left, op, right) * n_cons, compiled]
+#
+# cell_kind / kind is 0 for a string (ref is a string id) and 1 for a set (ref is a set id).
+# Loading maps the file and reads the arrays in place (memoryview.cast), nothing is tokenized.
+# A snapshot that is truncated, corrupt or from another format version raises SnapshotError, callers
+# treat that as a cache miss and parse the text policy.
+
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import zlib
+from array import array
+
+from attribute_values import SET_TYPES
+from res import Resource, ResourceManager
+from rule import Rule, RuleManager
+from user import User, UserManager
+
+MAGIC = b"ABACSNAP"
+FORMAT_VERSION = 2
+
+HEADER = struct.Struct("<8sII32sI4x")
+SECTION = struct.Struct("<IQQ")
+
+STRING_OFFSETS, STRING_DATA, SETS, USERS, RESOURCES, RULES = range(1, 7)
+
+STRING, SET = 0, 1
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def snapshot_path(policy_file):
+    """
+    Where the snapshot of a policy file lives (next to it).
+    """
+    return policy_file + ".snap"
+
+
+def file_hash(path):
+    """
+    Returns:
+        bytes: sha256 digest of the file content
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.digest()
+
+
+class SnapshotWriter:
+    # collects strings and sets into tables while the sections are encoded
+
+    def __init__(self):
+        self.strings = {}
+        self.sets = {}
+        self.set_list = []
+
+    def string_id(self, text):
+        sid = self.strings.get(text)
+        if sid is None:
+            sid = self.strings[text] = len(self.strings)
+        return sid
+
+    def set_id(self, values):
+        key = frozenset(values)
+        sid = self.sets.get(key)
+        if sid is None:
+            sid = self.sets[key] = len(self.set_list)
+            self.set_list.append(sorted(self.string_id(v) for v in key))
+        return sid
+
+    def value_ref(self, value):
+        if isinstance(value, SET_TYPES):
+            return SET, self.set_id(value)
+        return STRING, self.string_id(value)
+
+    def entities(self, entities):
+        ids = array("I")
+        cell_entity, cell_key, cell_kind, cell_ref = array("I"), array("I"), array("I"), array("I")
+        for pos, (eid, entity) in enumerate(entities.items()):
+            ids.append(self.string_id(eid))
+            for key, value in entity.attributes.items():
+                kind, ref = self.value_ref(value)
+                cell_entity.append(pos)
+                cell_key.append(self.string_id(key))
+                cell_kind.append(kind)
+                cell_ref.append(ref)
+
+        out = array("I", [len(ids)])
+        out.extend(ids)
+        out.append(len(cell_entity))
+        for column in (cell_entity, cell_key, cell_kind, cell_ref):
+            out.extend(column)
+        return out
+
+    def rules(self, rules):
+        out = array("I", [len(rules)])
+        for rule in rules:
+            for conds in (rule.sub_cond, rule.res_cond):
+                out.append(len(conds))
+                for attr, op, value in conds:
+                    kind, ref = self.value_ref(value)
+                    out.extend((self.string_id(attr), self.string_id(op), kind, ref))
+            acts = sorted(rule.acts)
+            out.append(len(acts))
+            out.extend(self.string_id(act) for act in acts)
+            out.append(len(rule.cons))
+            for left, op, right in rule.cons:
+                out.extend((self.string_id(left), self.string_id(op), self.string_id(right)))
+            out.append(1 if rule.compiled else 0)
+        return out
+
+    def string_sections(self):
+        data = bytearray()
+        offsets = array("I", [len(self.strings), 0])
+        for text in self.strings:
+            data += text.encode("utf-8")
+            offsets.append(len(data))
+        return offsets, bytes(data)
+
+    def set_section(self):
+        out = array("I", [len(self.set_list), 0])
+        members = array("I")
+        for values in self.set_list:
+            members.extend(values)
+            out.append(len(members))
+        out.extend(members)
+        return out
+
+
+def write_snapshot(path, user_mgr=None, res_mgr=None, rule_mgr=None, source_hash=b""):
+    """
+    Write the given managers to a snapshot file (written to a temporary file, then moved in place,
+    so concurrent writers of the same snapshot never leave a half written file behind).
+
+    Args:
+        path (str): snapshot file
+        user_mgr (UserManager): optional
+        res_mgr (ResourceManager): optional
+        rule_mgr (RuleManager): optional
+        source_hash (bytes): sha256 of the policy the managers were parsed from
+    """
+    writer = SnapshotWriter()
+    sections = []
+    if user_mgr is not None:
+        sections.append((USERS, writer.entities(user_mgr.users)))
+    if res_mgr is not None:
+        sections.append((RESOURCES, writer.entities(res_mgr.resources)))
+    if rule_mgr is not None:
+        sections.append((RULES, writer.rules(rule_mgr.rules)))
+    offsets, data = writer.string_sections()
+    sections = [(STRING_OFFSETS, offsets), (STRING_DATA, data), (SETS, writer.set_section())] + sections
+
+    blobs = []
+    for kind, content in sections:
+        if isinstance(content, array):
+            if sys.byteorder != "little":
+                content = array("I", content)
+                content.byteswap()
+            content = content.tobytes()
+        blobs.append((kind, content))
+
+    position = HEADER.size + SECTION.size * len(blobs)
+    table = []
+    for kind, content in blobs:
+        position += -position % 8
+        table.append((kind, position, len(content)))
+        position += len(content)
+
+    body = bytearray()
+    for entry in table:
+        body += SECTION.pack(*entry)
+    for (kind, offset, length), (_, content) in zip(table, blobs):
+        body += b"\0" * (offset - HEADER.size - len(body))
+        body += content
+
+    # every writer gets its own temporary file, the last complete one wins
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp",
+                                    dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            header = (MAGIC, FORMAT_VERSION, len(blobs), source_hash.ljust(32, b"\0"))
+            f.write(HEADER.pack(*header, zlib.crc32(body, zlib.crc32(HEADER.pack(*header, 0)))))
+            f.write(body)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class SnapshotReader:
+    # reads the sections of a mapped snapshot, close() has to be called before the map is closed
+
+    def __init__(self, buffer):
+        size = len(buffer)
+        if size < HEADER.size:
+            raise SnapshotError("file too short for a snapshot")
+        magic, version, count, source_hash, crc = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise SnapshotError("not a policy snapshot")
+        if version != FORMAT_VERSION:
+            raise SnapshotError(f"snapshot format {version}, expected {FORMAT_VERSION}")
+        if HEADER.size + count * SECTION.size > size:
+            raise SnapshotError("section table past the end of the file")
+
+        self.buffer = memoryview(buffer)
+        # views into the buffer handed out by words() / section(), released by close()
+        self.views = []
+        self.source_hash = source_hash
+        self.sections = {}
+        for pos in range(count):
+            kind, offset, length = SECTION.unpack_from(buffer, HEADER.size + pos * SECTION.size)
+            if offset < HEADER.size or offset + length > size:
+                raise SnapshotError(f"section {kind} out of range ({offset} + {length} > {size} bytes)")
+            if kind != STRING_DATA and (offset % 4 or length % 4):
+                raise SnapshotError(f"section {kind} is not a u32 array")
+            self.sections[kind] = (offset, length)
+        for kind in (STRING_OFFSETS, STRING_DATA, SETS):
+            if kind not in self.sections:
+                raise SnapshotError(f"section {kind} missing")
+
+        payload = self.view(HEADER.size, size - HEADER.size)
+        if zlib.crc32(payload, zlib.crc32(HEADER.pack(magic, version, count, source_hash, 0))) != crc:
+            raise SnapshotError("checksum mismatch, corrupt snapshot")
+
+        self.strings = self.load_strings()
+        self.sets = self.load_sets()
+
+    def view(self, offset, length):
+        view = self.buffer[offset:offset + length]
+        self.views.append(view)
+        return view
+
+    def section(self, kind):
+        return self.view(*self.sections[kind])
+
+    def words(self, kind):
+        view = self.section(kind).cast("I")
+        self.views.append(view)
+        if not len(view):
+            raise SnapshotError(f"section {kind} is empty")
+        if sys.byteorder != "little":
+            view = array("I", view)
+            view.byteswap()
+        return view
+
+    def close(self):
+        # derived views first, the base view can't be released while they are exported
+        for view in reversed(self.views):
+            view.release()
+        self.views = []
+        self.buffer.release()
+
+    def load_strings(self):
+        offsets = self.words(STRING_OFFSETS)
+        data = self.section(STRING_DATA)
+        count = offsets[0]
+        if count + 2 > len(offsets):
+            raise SnapshotError("string table truncated")
+        return [sys.intern(str(data[offsets[1 + i]:offsets[2 + i]], "utf-8")) for i in range(count)]
+
+    def load_sets(self):
+        words = self.words(SETS)
+        count = words[0]
+        if count + 2 > len(words):
+            raise SnapshotError("set table truncated")
+        base = count + 2
+        strings = self.strings
+        return [frozenset(strings[w] for w in words[base + words[1 + i]:base + words[2 + i]]) for i in range(count)]
+
+    def value(self, kind, ref):
+        return self.sets[ref] if kind == SET else self.strings[ref]
+
+    def entities(self, kind, cls):
+        words = self.words(kind)
+        strings = self.strings
+        count = words[0]
+        if count + 2 > len(words):
+            raise SnapshotError(f"section {kind} truncated")
+        ids = [strings[w] for w in words[1:1 + count]]
+        pos = 1 + count
+        cells = words[pos]
+        pos += 1
+        if pos + 4 * cells > len(words):
+            raise SnapshotError(f"section {kind} truncated")
+        cell_entity = words[pos:pos + cells]
+        cell_key = words[pos + cells:pos + 2 * cells]
+        cell_kind = words[pos + 2 * cells:pos + 3 * cells]
+        cell_ref = words[pos + 3 * cells:pos + 4 * cells]
+
+        entities = {}
+        objects = []
+        for eid in ids:
+            entity = cls(eid)
+            entity.attributes = {}
+            entities[eid] = entity
+            objects.append(entity)
+        for i in range(cells):
+            objects[cell_entity[i]].attributes[strings[cell_key[i]]] = self.value(cell_kind[i], cell_ref[i])
+        return entities
+
+    def rules(self):
+        words = self.words(RULES)
+        strings = self.strings
+        rules = []
+        pos = 1
+        for _ in range(words[0]):
+            conds = []
+            for _side in range(2):
+                side = []
+                for _c in range(words[pos]):
+                    attr, op, kind, ref = words[pos + 1:pos + 5]
+                    value = set(self.sets[ref]) if kind == SET else strings[ref]
+                    side.append((strings[attr], strings[op], value))
+                    pos += 4
+                pos += 1
+                conds.append(side)
+            acts = {strings[w] for w in words[pos + 1:pos + 1 + words[pos]]}
+            pos += 1 + words[pos]
+            cons = []
+            for _c in range(words[pos]):
+                left, op, right = words[pos + 1:pos + 4]
+                cons.append((strings[left], strings[op], strings[right]))
+                pos += 3
+            pos += 1
+            rule = Rule(conds[0], conds[1], acts, cons)
+            if words[pos]:
+                rule.compile()
+            pos += 1
+            rules.append(rule)
+        return rules
+
+
+def load_snapshot(path, expected_hash=None):
+    """
+    Load the managers stored in a snapshot.
+
+    Args:
+        path (str): snapshot file
+        expected_hash (bytes): when given, the snapshot is only used if it was made from a policy with this sha256
+
+    Returns:
+        tuple: (UserManager, ResourceManager, RuleManager), None for the sections the file doesn't hold,
+               or None when expected_hash doesn't match
+
+    Raises:
+        SnapshotError: truncated, corrupt or outdated snapshot
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise SnapshotError("empty snapshot file")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            reader = managers = error = None
+            try:
+                reader = SnapshotReader(mapped)
+                managers = read_managers(reader, expected_hash)
+            except SnapshotError as exc:
+                error = str(exc)
+            except (ValueError, TypeError, IndexError, KeyError, OverflowError, struct.error) as exc:
+                # anything the checks of SnapshotReader missed, the snapshot is just not usable
+                error = f"corrupt snapshot: {exc!r}"
+            # the views into the map have to be gone before it is closed, this is after the except
+            # clauses so the traceback (and the frames holding views) is already dropped
+            if reader is not None:
+                reader.close()
+    if error is not None:
+        raise SnapshotError(error)
+    return managers
+
+
+def read_managers(reader, expected_hash):
+    if expected_hash is not None and reader.source_hash != expected_hash.ljust(32, b"\0"):
+        return None
+
+    user_mgr = res_mgr = rule_mgr = None
+    if USERS in reader.sections:
+        user_mgr = UserManager()
+        user_mgr.users = reader.entities(USERS, User)
+        user_mgr.version += 1
+    if RESOURCES in reader.sections:
+        res_mgr = ResourceManager()
+        res_mgr.resources = reader.entities(RESOURCES, Resource)
+        res_mgr.version += 1
+    if RULES in reader.sections:
+        rule_mgr = RuleManager()
+        rule_mgr.rules = reader.rules()
+        rule_mgr.version += 1
+    return user_mgr, res_mgr, rule_mgr
@@ -0,0 +1,178 @@
+#Streaming request evaluation
+# requests ("<user>,<resource>,<action>" per line) are read in large chunks from a file or stdin,
+# decided one by one and written back per chunk in a machine readable format (csv or jsonl).
+# Latency of every decision goes into a fixed size histogram so throughput and percentiles can be
+# reported at the end, memory doesn't grow with the length of the stream.
+
+import json
+import time
+
+FORMATS = ("csv", "jsonl")
+
+# bytes of input read per chunk
+CHUNK_SIZE = 1 << 20
+
+# latency buckets per power of two, percentiles are within 1 / SUB_BUCKETS of the real value
+SUB_BITS = 4
+SUB_BUCKETS = 1 << SUB_BITS
+
+
+class LatencyHistogram:
+    """
+    Log-linear histogram of latencies in nanoseconds.
+
+    Values below 2 * SUB_BUCKETS get a bucket each, every power of two above is split into
+    SUB_BUCKETS buckets, so the size only depends on the largest latency seen (a few hundred
+    buckets for a minute) and not on the number of requests.
+    """
+
+    def __init__(self):
+        self.counts = []
+        self.count = 0
+        self.max = 0
+
+    @staticmethod
+    def bucket(value):
+        shift = value.bit_length() - SUB_BITS - 1
+        if shift <= 0:
+            return value
+        return (shift << SUB_BITS) + (value >> shift)
+
+    @staticmethod
+    def bucket_value(index):
+        # middle of the values falling into the bucket
+        if index < 2 * SUB_BUCKETS:
+            return index
+        shift, top = divmod(index, SUB_BUCKETS)
+        shift -= 1
+        top += SUB_BUCKETS
+        return (top << shift) + (1 << shift) // 2
+
+    def record(self, value):
+        index = self.bucket(value)
+        counts = self.counts
+        if index >= len(counts):
+            counts.extend([0] * (index + 1 - len(counts)))
+        counts[index] += 1
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, pct):
+        """
+        Returns:
+            int: latency (ns) of the nearest rank, 0 when nothing was recorded
+        """
+        if not self.count:
+            return 0
+        rank = min(self.count - 1, int(round(pct / 100 * (self.count - 1))))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen > rank:
+                return min(self.bucket_value(index), self.max)
+        return self.max
+
+
+class StreamStats:
+    """
+    Counters of a streaming run.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.denies = 0
+        self.malformed = 0
+        self.elapsed = 0.0
+        # nanoseconds per decision
+        self.latencies = LatencyHistogram()
+
+    def summary(self):
+        """
+        Returns:
+            list: text lines with the totals, requests/sec and latency percentiles (microseconds)
+        """
+        rate = self.requests / self.elapsed if self.elapsed > 0 else 0.0
+        lines = [
+            f"requests: {self.requests}",
+            f"denies: {self.denies}",
+            f"malformed lines skipped: {self.malformed}",
+            f"elapsed: {self.elapsed:.3f} s",
+            f"throughput: {rate:.0f} requests/sec",
+        ]
+        for pct in (50, 90, 99):
+            lines.append(f"latency p{pct}: {self.latencies.percentile(pct) / 1000:.2f} us")
+        lines.append(f"latency max: {self.latencies.max / 1000:.2f} us")
+        return lines
+
+
+def format_decision(sub_id, res_id, action, decision, fmt):
+    if fmt == "jsonl":
+        return json.dumps({"user": sub_id, "resource": res_id, "action": action, "decision": decision}) + "\n"
+    return f"{sub_id},{res_id},{action},{decision}\n"
+
+
+def read_chunks(stream, chunk_size=CHUNK_SIZE):
+    """
+    Yield lists of lines, about chunk_size bytes at a time.
+    """
+    while True:
+        lines = stream.readlines(chunk_size)
+        if not lines:
+            return
+        yield lines
+
+
+def stream_evaluate(stream, out, evaluate, fmt="csv", deny_only=False, chunk_size=CHUNK_SIZE):
+    """
+    Evaluate every request of a stream and write the decisions to out.
+
+    Args:
+        stream (file): text stream of requests, one per line (blank and # lines are skipped)
+        out (file): text stream the decisions are written to, once per chunk
+        evaluate (function): evaluate((sub_id, res_id, action)) -> 'Permit' or 'Deny'
+        fmt (str): "csv" or "jsonl"
+        deny_only (bool): only write the Deny decisions
+        chunk_size (int): bytes read per chunk
+
+    Returns:
+        StreamStats: counters and latencies of the run
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown output format {fmt}, expected one of {FORMATS}")
+
+    stats = StreamStats()
+    record = stats.latencies.record
+    clock = time.perf_counter_ns
+
+    if fmt == "csv":
+        out.write("user,resource,action,decision\n")
+
+    start = time.perf_counter()
+    for lines in read_chunks(stream, chunk_size):
+        written = []
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            key = tuple(line.split(','))
+            if len(key) != 3:
+                stats.malformed += 1
+                continue
+
+            t0 = clock()
+            decision = evaluate(key)
+            record(clock() - t0)
+
+            stats.requests += 1
+            if decision == "Deny":
+                stats.denies += 1
+            elif deny_only:
+                continue
+            written.append(format_decision(key[0], key[1], key[2], decision, fmt))
+
+        out.write("".join(written))
+
+    out.flush()
+    stats.elapsed = time.perf_counter() - start
+    return stats
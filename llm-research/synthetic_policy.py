@@ -0,0 +1,138 @@
+#Synthetic ABAC policies for benchmarks
+# Policies are shaped like the bundled domains (DATASETS-for-LLM): users have a role, scalar and set
+# valued attributes, resources have a type, an owner, a set of recipients and attributes shared with
+# the users, and the rules look like the ground truth rules, e.g.
+#
+#   rule(role [ {employee}, a0 [ {v0_3}; type [ {t2}; {view send}; a1 = a1)
+#   rule(; type [ {t0}; {read}; uid [ recipients)
+#
+# Every size is a parameter so the policies can be scaled far past the bundled ones.
+import random
+
+# sizes of the bundled domains, scale multiplies users and resources
+PRESETS = {
+    "edocument": {"users": 500, "resources": 300, "attributes": 6, "cardinality": 12, "set_size": 8, "rules": 25, "actions": 4},
+    "workforce": {"users": 353, "resources": 250, "attributes": 6, "cardinality": 10, "set_size": 3, "rules": 30, "actions": 6},
+    "university": {"users": 22, "resources": 34, "attributes": 4, "cardinality": 6, "set_size": 3, "rules": 10, "actions": 5},
+    "healthcare": {"users": 21, "resources": 16, "attributes": 4, "cardinality": 5, "set_size": 2, "rules": 13, "actions": 4},
+    "project-management": {"users": 19, "resources": 40, "attributes": 4, "cardinality": 6, "set_size": 3, "rules": 12, "actions": 4},
+}
+
+ROLES = ["employee", "customer", "admin", "helpdesk", "manager"]
+RESOURCE_TYPES = 6
+
+
+def preset_spec(name, scale=1.0):
+    """
+    Args:
+        name (str): one of PRESETS
+        scale (float): multiplies the number of users and resources
+
+    Returns:
+        dict: keyword arguments for generate_policy
+    """
+    spec = dict(PRESETS[name])
+    spec["users"] = max(1, int(spec["users"] * scale))
+    spec["resources"] = max(1, int(spec["resources"] * scale))
+    return spec
+
+
+def generate_policy(users=500, resources=300, attributes=6, cardinality=12, set_size=4, rules=25, actions=4, seed=0):
+    """
+    Generate the text of an .abac policy.
+
+    Attribute a<k> exists on both sides with the values v<k>_0 .. v<k>_<cardinality-1>. It is scalar on
+    both sides when k % 3 == 0, a set on resources when k % 3 == 1 and a set on users when k % 3 == 2,
+    so the constraints "=", "[" and "]" of the rules join users and resources through them.
+
+    Args:
+        users (int): number of userAttrib lines
+        resources (int): number of resourceAttrib lines
+        attributes (int): shared attributes per user/resource (besides role, type, owner, recipients)
+        cardinality (int): distinct values of every attribute
+        set_size (int): elements of set valued attributes
+        rules (int): number of rules
+        actions (int): distinct actions
+        seed (int): random seed, the same arguments always give the same policy
+
+    Returns:
+        str: policy text
+    """
+    rnd = random.Random(seed)
+    set_size = max(1, min(set_size, cardinality))
+    uids = [f"user{i}" for i in range(users)]
+    acts = [f"act{i}" for i in range(actions)]
+
+    def values(k):
+        return [f"v{k}_{j}" for j in range(cardinality)]
+
+    def value_text(k, is_set):
+        if is_set:
+            return "{" + " ".join(rnd.sample(values(k), set_size)) + "}"
+        return rnd.choice(values(k))
+
+    lines = ["# synthetic ABAC policy", ""]
+    for uid in uids:
+        attrs = [f"role={rnd.choice(ROLES)}"]
+        attrs += [f"a{k}={value_text(k, k % 3 == 2)}" for k in range(attributes)]
+        lines.append(f"userAttrib({uid}, {', '.join(attrs)})")
+    lines.append("")
+
+    for i in range(resources):
+        attrs = [f"type=t{rnd.randrange(RESOURCE_TYPES)}", f"owner={rnd.choice(uids)}"]
+        attrs.append("recipients={" + " ".join(rnd.sample(uids, min(set_size, len(uids)))) + "}")
+        attrs += [f"a{k}={value_text(k, k % 3 == 1)}" for k in range(attributes)]
+        lines.append(f"resourceAttrib(res{i}, {', '.join(attrs)})")
+    lines.append("")
+
+    for _ in range(rules):
+        sub_cond = []
+        if rnd.random() < 0.8:
+            sub_cond.append("role [ {" + " ".join(rnd.sample(ROLES, rnd.randint(1, 2))) + "}")
+        for k in rnd.sample(range(attributes), rnd.randint(0, min(2, attributes))):
+            if k % 3 == 2:
+                sub_cond.append(f"a{k} ] {rnd.choice(values(k))}")
+            else:
+                sub_cond.append(f"a{k} [ {{{' '.join(rnd.sample(values(k), rnd.randint(1, min(3, cardinality))))}}}")
+
+        res_cond = []
+        if rnd.random() < 0.7:
+            types = rnd.sample(range(RESOURCE_TYPES), rnd.randint(1, 2))
+            res_cond.append("type [ {" + " ".join(f"t{t}" for t in types) + "}")
+
+        rule_acts = "{" + " ".join(rnd.sample(acts, rnd.randint(1, min(3, actions)))) + "}"
+
+        cons = []
+        for _c in range(rnd.choice([0, 1, 1, 2])):
+            kind = rnd.randrange(4)
+            if kind == 0:
+                cons.append(rnd.choice(["uid = owner", "uid [ recipients"]))
+            elif attributes:
+                k = rnd.randrange(attributes)
+                op = {0: "=", 1: "[", 2: "]"}[k % 3]
+                cons.append(f"a{k} {op} a{k}")
+
+        lines.append(f"rule({', '.join(sub_cond)}; {', '.join(res_cond)}; {rule_acts}; {', '.join(cons)})")
+
+    return "\n".join(lines) + "\n"
+
+
+def random_requests(count, users, resources, actions, seed=0):
+    """
+    Requests "<user>,<resource>,<action>" over the ids generate_policy uses.
+    """
+    rnd = random.Random(seed)
+    return [f"user{rnd.randrange(users)},res{rnd.randrange(resources)},act{rnd.randrange(actions)}" for _ in range(count)]
+
+
+def write_policy(file_name, **spec):
+    """
+    Write a generated policy to a file.
+
+    Args:
+        file_name (str): .abac file to write
+        **spec: see generate_policy
+    """
+    with open(file_name, "w", encoding="utf-8") as f:
+        f.write(generate_policy(**spec))
+    return file_name
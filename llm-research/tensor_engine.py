@@ -0,0 +1,267 @@
+#NumPy permission tensor
+# every attribute value (users, resources and rules) is dictionary encoded into one shared
+# vocabulary of integer codes so values can be compared across attributes (uid = student).
+# Scalar attributes become an int array of codes, set valued attributes become a bitmask
+# (one uint64 word per 64 vocabulary entries) per user/resource.
+# Each rule is then evaluated as boolean masks over all users x all resources at once.
+# The semantics are the ones of Rule.evaluate, including its corner cases
+# (set valued attributes pass "[" conditions, scalars pass "]" conditions).
+
+import numpy as np
+
+from attribute_values import SET_TYPES
+
+
+class EncodedColumn:
+    """
+    One attribute of every user (or every resource), dictionary encoded.
+
+    present: bool array, the entity has the attribute
+    is_set: bool array, the value is a set
+    codes: int array, vocabulary code of a scalar value (-1 for sets and missing values)
+    words: uint64 array (entities x words), bitmask of the set elements
+    """
+
+    def __init__(self, count, num_words):
+        self.present = np.zeros(count, dtype=bool)
+        self.is_set = np.zeros(count, dtype=bool)
+        self.codes = np.full(count, -1, dtype=np.int64)
+        self.words = np.zeros((count, num_words), dtype=np.uint64)
+
+    def has_element(self, code):
+        """bool array, the set value contains the vocabulary code"""
+        if code is None:
+            return np.zeros(len(self.present), dtype=bool)
+        word, bit = divmod(code, 64)
+        return ((self.words[:, word] >> np.uint64(bit)) & np.uint64(1)).astype(bool)
+
+
+class PermissionTensor:
+    """
+    Full user x resource x action decision tensor for a parsed policy.
+
+    decisions[a, u, r] is True when any rule permits user_ids[u] to do actions[a] on res_ids[r].
+    The tensor is dense (len(actions) * len(users) * len(resources) bytes), per rule masks
+    are computed once and kept for the analytics.
+    Answers the same queries as policy_eval.PolicyEvaluation and can be used in its place.
+
+    Args:
+        user_mgr (UserManager): holds users from abac
+        res_mgr (ResourceManager): holds resources from abac
+        rule_mgr (RuleManager): holds rules from abac
+    """
+
+    def __init__(self, user_mgr, res_mgr, rule_mgr):
+        self.rules = list(rule_mgr.rules)
+        self.user_ids = list(user_mgr.users)
+        self.res_ids = list(res_mgr.resources)
+        self.users = list(user_mgr.users.values())
+        self.resources = list(res_mgr.resources.values())
+        self.actions = sorted({action for rule in self.rules for action in rule.acts})
+        self.action_pos = {action: pos for pos, action in enumerate(self.actions)}
+        self.user_pos = {uid: pos for pos, uid in enumerate(self.user_ids)}
+        self.res_pos = {rid: pos for pos, rid in enumerate(self.res_ids)}
+
+        self.vocab = {}
+        for entity in self.users + self.resources:
+            for value in entity.attributes.values():
+                self.encode_value(value)
+        for rule in self.rules:
+            for _, _, value in rule.sub_cond + rule.res_cond:
+                self.encode_value(value)
+        self.num_words = max(1, (len(self.vocab) + 63) // 64)
+
+        self.user_columns = {}
+        self.res_columns = {}
+        self._rule_masks = [None] * len(self.rules)
+        self._decisions = None
+
+    def encode_value(self, value):
+        if isinstance(value, SET_TYPES):
+            for element in value:
+                self.vocab.setdefault(element, len(self.vocab))
+        else:
+            self.vocab.setdefault(value, len(self.vocab))
+
+    def column(self, side, attr):
+        """
+        Encoded column for a user ("user") or resource ("resource") attribute, built on first use.
+        """
+        columns, entities = (self.user_columns, self.users) if side == "user" else (self.res_columns, self.resources)
+        if attr in columns:
+            return columns[attr]
+
+        col = EncodedColumn(len(entities), self.num_words)
+        for pos, entity in enumerate(entities):
+            value = entity.attributes.get(attr)
+            if value is None:
+                continue
+            col.present[pos] = True
+            if isinstance(value, SET_TYPES):
+                col.is_set[pos] = True
+                for element in value:
+                    word, bit = divmod(self.vocab[element], 64)
+                    col.words[pos, word] |= np.uint64(1) << np.uint64(bit)
+            else:
+                col.codes[pos] = self.vocab[value]
+
+        columns[attr] = col
+        return col
+
+    def condition_mask(self, side, attr, op, value):
+        # one subject/resource condition over every user or every resource
+        col = self.column(side, attr)
+        if op == "[" and isinstance(value, SET_TYPES):
+            codes = [self.vocab[v] for v in value if v in self.vocab]
+            return col.present & (col.is_set | np.isin(col.codes, codes))
+        if op == "]":
+            return col.present & (~col.is_set | col.has_element(self.vocab.get(value)))
+        return col.present.copy()
+
+    def constraint_mask(self, left_attr, op, right_attr):
+        # one constraint over every (user, resource) pair
+        ucol = self.column("user", left_attr)
+        rcol = self.column("resource", right_attr)
+        both = np.outer(ucol.present, rcol.present)
+
+        if op == "=":
+            scalar_eq = np.equal.outer(ucol.codes, rcol.codes) & np.outer(~ucol.is_set, ~rcol.is_set)
+            set_eq = np.outer(ucol.is_set, rcol.is_set) & self.words_relation(ucol.words, rcol.words, "equal")
+            return both & (scalar_eq | set_eq)
+
+        if op == ">":  # supseteq
+            mask = np.outer(ucol.is_set, rcol.is_set) & self.words_relation(ucol.words, rcol.words, "superset")
+            # set.issuperset(str) checks the characters of the string
+            for pos in np.flatnonzero(rcol.present & ~rcol.is_set):
+                chars = set(self.resources[pos].attributes.get(right_attr))
+                covered = ucol.is_set.copy()
+                for char in chars:
+                    covered &= ucol.has_element(self.vocab.get(char))
+                mask[:, pos] |= covered
+            return mask
+
+        if op == "]":
+            scalar = rcol.present & ~rcol.is_set
+            members = self.member_matrix(ucol.words, rcol.codes)
+            return np.outer(ucol.is_set, scalar) & members
+
+        if op == "[":
+            scalar = ucol.present & ~ucol.is_set
+            members = self.member_matrix(rcol.words, ucol.codes).T
+            return np.outer(scalar, rcol.is_set) & members
+
+        return both
+
+    @staticmethod
+    def member_matrix(words, codes):
+        """
+        (len(words) x len(codes)) bool matrix, bitmask row contains code column.
+        Negative codes (sets, missing values) are never members.
+        """
+        valid = codes >= 0
+        safe = np.where(valid, codes, 0)
+        picked = words[:, safe // 64]
+        bits = (picked >> (safe % 64).astype(np.uint64)) & np.uint64(1)
+        return bits.astype(bool) & valid
+
+    @staticmethod
+    def words_relation(left, right, relation, chunk=1024):
+        # compare every left bitmask with every right bitmask, chunked to bound memory
+        out = np.zeros((len(left), len(right)), dtype=bool)
+        for start in range(0, len(left), chunk):
+            block = left[start:start + chunk, None, :]
+            if relation == "equal":
+                out[start:start + chunk] = np.all(block == right[None, :, :], axis=2)
+            else:
+                out[start:start + chunk] = np.all((right[None, :, :] & ~block) == 0, axis=2)
+        return out
+
+    def rule_mask(self, rule_idx):
+        """
+        bool matrix (users x resources), pairs the rule grants its actions on.
+        """
+        mask = self._rule_masks[rule_idx]
+        if mask is not None:
+            return mask
+
+        rule = self.rules[rule_idx]
+        user_ok = np.ones(len(self.users), dtype=bool)
+        for attr, op, value in rule.sub_cond:
+            user_ok &= self.condition_mask("user", attr, op, value)
+        res_ok = np.ones(len(self.resources), dtype=bool)
+        for attr, op, value in rule.res_cond:
+            res_ok &= self.condition_mask("resource", attr, op, value)
+
+        mask = np.outer(user_ok, res_ok)
+        for left_attr, op, right_attr in rule.cons:
+            if not mask.any():
+                break
+            mask &= self.constraint_mask(left_attr, op, right_attr)
+
+        self._rule_masks[rule_idx] = mask
+        return mask
+
+    @property
+    def decisions(self):
+        """
+        bool tensor (actions x users x resources), computed in one pass over the rules.
+        """
+        if self._decisions is None:
+            tensor = np.zeros((len(self.actions), len(self.users), len(self.resources)), dtype=bool)
+            for rule_idx, rule in enumerate(self.rules):
+                mask = self.rule_mask(rule_idx)
+                for action in rule.acts:
+                    tensor[self.action_pos[action]] |= mask
+            self._decisions = tensor
+        return self._decisions
+
+    def decide(self, uid, rid, action):
+        return "Permit" if self.is_permitted(uid, rid, action) else "Deny"
+
+    def is_permitted(self, uid, rid, action):
+        if uid not in self.user_pos or rid not in self.res_pos or action not in self.action_pos:
+            return False
+        return bool(self.decisions[self.action_pos[action], self.user_pos[uid], self.res_pos[rid]])
+
+    def permissions(self):
+        """
+        Yield every permitted (uid, rid, action) triple.
+        """
+        for a, u, r in zip(*np.nonzero(self.decisions)):
+            yield self.user_ids[u], self.res_ids[r], self.actions[a]
+
+    def attribute_counts(self, rule_idx):
+        """
+        Heatmap counts for one rule: for every attribute the rule references, the number of
+        authorizations (user, resource, action) it grants where the user/resource has that attribute.
+
+        Returns:
+            dict: "user.<attr>" / "resource.<attr>" -> count
+        """
+        rule = self.rules[rule_idx]
+        mask = self.rule_mask(rule_idx)
+        num_acts = len(rule.acts)
+        per_user = mask.sum(axis=1)
+        per_res = mask.sum(axis=0)
+        rule_attributes = rule.get_attributes()
+
+        counts = {}
+        for attr in rule_attributes["user"]:
+            has = np.array([attr in user.attributes for user in self.users], dtype=bool)
+            counts[f"user.{attr}"] = int(per_user[has].sum()) * num_acts
+        for attr in rule_attributes["resource"]:
+            has = np.array([attr in resource.attributes for resource in self.resources], dtype=bool)
+            counts[f"resource.{attr}"] = int(per_res[has].sum()) * num_acts
+        return counts
+
+    def resource_counts(self):
+        """
+        Number of (user, rule, action) grants per resource.
+
+        Returns:
+            dict: rid -> count, in resource order
+        """
+        counts = np.zeros(len(self.resources), dtype=np.int64)
+        for rule_idx, rule in enumerate(self.rules):
+            counts += self.rule_mask(rule_idx).sum(axis=0) * len(rule.acts)
+        return {rid: int(count) for rid, count in zip(self.res_ids, counts)}
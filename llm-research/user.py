@@ -1,10 +1,17 @@
-import pickle
+import sys
+from attribute_values import compact_value
+
 class User:
+    # no per instance __dict__, only the attribute dict: the evaluators read it directly (dict.get)
+    # so it stays a plain dict, one per user. Its names and string values are
+    # interned, equal set values are one frozenset shared through the manager's shared_values.
+    __slots__ = ("attributes",)
+
     def __init__(self, uid):
-        self.attributes = {"uid": uid}
+        self.attributes = {"uid": sys.intern(uid)}
 
-    def add_attribute(self, key, value):
-        self.attributes[key] = value
+    def add_attribute(self, key, value, shared=None):
+        self.attributes[sys.intern(key)] = compact_value(value, shared)
 
     def get_attribute(self, key):
         return self.attributes.get(key)
@@ -14,6 +21,10 @@ class User:
 
 class UserManager:
     def __init__(self):
+        # bumped whenever the data is (re)loaded, lets caches notice a reload
+        self.version = 0
+        # equal set values are stored once and shared between entities
+        self.shared_values = {}
         self.users = {}
 
     def parse_user_attrib(self, line):
@@ -30,18 +41,24 @@ class UserManager:
                 # Handle set values
                 if value.startswith("{"):
                     value = set(value[1:-1].split())
-                user.add_attribute(key.strip(), value)
+                user.add_attribute(key.strip(), value, self.shared_values)
 
         self.users[uid] = user
+        self.version += 1
         return user
 
     def get_user(self, uid):
         return self.users.get(uid)
 
     def serialize(self, file_path):
-        with open(file_path, 'wb') as file:
-            pickle.dump(self.users, file)
+        # binary snapshot holding only this manager, see snapshot.py
+        from snapshot import write_snapshot
+        write_snapshot(file_path, user_mgr=self)
 
     def deserialize(self, file_path):
-        with open(file_path, 'rb') as file:
-            self.users = pickle.load(file)
\ No newline at end of file
+        from snapshot import load_snapshot, SnapshotError
+        user_mgr, res_mgr, rule_mgr = load_snapshot(file_path)
+        if user_mgr is None:
+            raise SnapshotError(f"{file_path} holds no users")
+        self.users = user_mgr.users
+        self.version += 1
\ No newline at end of file
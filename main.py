@@ -2,40 +2,71 @@ import sys
 import matplotlib.pyplot as plt
 import numpy as np
 import seaborn as sns
-from core.user import UserManager
-from core.res import ResourceManager
-from core.rule import RuleManager
-
-def parse_abac_file(filename):
+from core.policy_parser import parse_policy
+from core.sharding import evaluate_policy, ENGINES
+from core.decision_cache import DecisionCache
+from core.stream_eval import stream_evaluate, FORMATS
+from core.reverse_query import ReverseIndex
+from core.residual_policy import ResidualCache
+from core.snapshot import snapshot_path, file_hash, load_snapshot, write_snapshot, SnapshotError
+from core import instrumentation
+
+# decisions of evaluate_many, dropped automatically when the policy is reloaded
+decision_cache = DecisionCache()
+# inverted indexes of the last policy a reverse query was asked on
+reverse_index = None
+# rules specialized to the most recent subjects, see decide
+residual_cache = ResidualCache()
+
+def parse_abac_file(filename, snapshot=True, workers=1):
     """
-    Delegate parsing based on what line contains (user, resource, or rule)
+    Parse the policy in one streaming pass (see policy_parser), user, resource and rule lines
+    go to their manager. A binary snapshot of the result is kept next to the file (<filename>.snap) and loaded
+    instead of parsing as long as the file content doesn't change.
 
     Args:
         filename (str): path to file
+        snapshot (bool): use / write the snapshot, turn off for files rewritten on every run
+        workers (int): parse the attribute lines of large files in that many processes
 
     Returns:
         UserManager, ResourceManager, RuleManager: initalized objects poulated based on parsed abac
-    """
-    user_mgr = UserManager()
-    res_mgr = ResourceManager()
-    rule_mgr = RuleManager()
-
-    with open(filename, 'r', encoding="UTF-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line or line.startswith('#'):
-                continue
 
-            if line.startswith('userAttrib'):
-                user_mgr.parse_user_attrib(line)
-            elif line.startswith('resourceAttrib'):
-                res_mgr.parse_resource_attrib(line)
-            elif line.startswith('rule'):
-                rule_mgr.parse_rule(line)
+    Raises:
+        PolicySyntaxError: malformed line, with its line and column
+    """
+    if snapshot:
+        source_hash = file_hash(filename)
+        snap_file = snapshot_path(filename)
+        try:
+            with instrumentation.phase("parse_abac_file.snapshot_load"):
+                loaded = load_snapshot(snap_file, source_hash)
+        except (OSError, SnapshotError):
+            loaded = None
+        if loaded is not None and None not in loaded:
+            user_mgr, res_mgr, rule_mgr = loaded
+            with instrumentation.phase("parse_abac_file.build_index"):
+                rule_mgr.build_index()
+            return user_mgr, res_mgr, rule_mgr
+
+    with instrumentation.phase("parse_abac_file.parse"):
+        user_mgr, res_mgr, rule_mgr = parse_policy(filename, workers)
+
+    # index the rules once so requests only look at rules that could match
+    with instrumentation.phase("parse_abac_file.build_index"):
+        rule_mgr.build_index()
+
+    if snapshot:
+        try:
+            with instrumentation.phase("parse_abac_file.snapshot_write"):
+                write_snapshot(snap_file, user_mgr, res_mgr, rule_mgr, source_hash)
+        except OSError:
+            # read only location, the text policy still works
+            pass
 
     return user_mgr, res_mgr, rule_mgr
 
-def process_request(request, user_mgr, res_mgr, rule_mgr):
+def process_request(request, user_mgr, res_mgr, rule_mgr, evaluation=None):
     """
     Given a request in the form "<user>, <resource>, <action>" the function
 
@@ -44,26 +75,160 @@ def process_request(request, user_mgr, res_mgr, rule_mgr):
         user_mgr (UserManager): holds user data from abac
         res_mgr (ResourceManager): holds resources from abac
         rule_mgr (RuleManager): holds rules from abac
+        evaluation (PolicyEvaluation): optional, answer from an already evaluated policy
 
     Returns:
         str: 'Permit' or 'Deny'
     """
     sub_id, res_id, action = request.strip().split(',')
 
+    return decide(sub_id, res_id, action, user_mgr, res_mgr, rule_mgr, evaluation)
+
+def decide(sub_id, res_id, action, user_mgr, res_mgr, rule_mgr, evaluation=None):
+    """
+    Decision for an already split request, see process_request.
+
+    Returns:
+        str: 'Permit' or 'Deny'
+    """
+    if evaluation is not None:
+        return evaluation.decide(sub_id, res_id, action)
+
     user = user_mgr.get_user(sub_id)
     resource = res_mgr.get_resource(res_id)
 
+    # per rule counters and timings, only when instrumentation is turned on
+    if instrumentation.enabled:
+        return instrumentation.instrumented_decide(user, resource, action, rule_mgr)
+
     if not user or not resource:
         return "Deny"
 
-    # Check if any rule permits the action
-    for rule in rule_mgr.rules:
-        if rule.evaluate(user, resource, action):
-            return "Permit"
+    # Only the resource side of the rules the user can still be permitted by is checked, the
+    # subject conditions and the user side of the constraints were decided once for this user
+    return residual_cache.policy_for(user, user_mgr, rule_mgr).decide(resource, action)
+
+def evaluate_many(requests, user_mgr, res_mgr, rule_mgr, evaluation=None, cache=None):
+    """
+    Evaluate a batch of requests in the form "<user>,<resource>,<action>".
+    Repeated (user, resource, action) triples are only evaluated once per batch, and decisions
+    are kept in an LRU cache across batches until the policy managers are reloaded.
+
+    Args:
+        requests (iterable): request strings
+        user_mgr (UserManager): holds user data from abac
+        res_mgr (ResourceManager): holds resources from abac
+        rule_mgr (RuleManager): holds rules from abac
+        evaluation (PolicyEvaluation): optional, answer from an already evaluated policy
+        cache (DecisionCache): cache to use, the module level decision_cache by default
+
+    Returns:
+        list: 'Permit' or 'Deny' for every request, in order
+    """
+    evaluate = cached_decider(user_mgr, res_mgr, rule_mgr, evaluation, cache)
+
+    batch = {}
+    decisions = []
+    for request in requests:
+        key = tuple(request.strip().split(','))
+        decision = batch.get(key)
+        if decision is None:
+            decision = evaluate(key)
+            batch[key] = decision
+        decisions.append(decision)
+
+    return decisions
+
+def cached_decider(user_mgr, res_mgr, rule_mgr, evaluation=None, cache=None):
+    """
+    Build evaluate((sub_id, res_id, action)) -> 'Permit' / 'Deny' going through the decision cache.
+
+    Args:
+        user_mgr (UserManager): holds user data from abac
+        res_mgr (ResourceManager): holds resources from abac
+        rule_mgr (RuleManager): holds rules from abac
+        evaluation (PolicyEvaluation): optional, answer from an already evaluated policy
+        cache (DecisionCache): cache to use, the module level decision_cache by default
+
+    Returns:
+        function: the decider
+    """
+    if cache is None:
+        cache = decision_cache
+    cache.check_policy(user_mgr, res_mgr, rule_mgr)
+
+    def evaluate(key):
+        decision = cache.get(key)
+        if decision is None:
+            sub_id, res_id, action = key
+            decision = decide(sub_id, res_id, action, user_mgr, res_mgr, rule_mgr, evaluation)
+            cache.put(key, decision)
+        return decision
+
+    return evaluate
+
+def get_reverse_index(user_mgr, res_mgr, rule_mgr):
+    """
+    ReverseIndex of the policy, reused while the same managers are queried.
+    """
+    global reverse_index
+    if reverse_index is None or (reverse_index.user_mgr, reverse_index.res_mgr, reverse_index.rule_mgr) != (user_mgr, res_mgr, rule_mgr):
+        reverse_index = ReverseIndex(user_mgr, res_mgr, rule_mgr)
+    return reverse_index
+
+def users_for_resource(res_id, user_mgr, res_mgr, rule_mgr, action=None):
+    """
+    Who can access a resource, answered from attribute inverted indexes (see reverse_query).
+
+    Args:
+        res_id (str): resource id
+        user_mgr (UserManager): holds user data from abac
+        res_mgr (ResourceManager): holds resources from abac
+        rule_mgr (RuleManager): holds rules from abac
+        action (str): only this action, every action when None
+
+    Returns:
+        dict: action -> sorted list of uids
+    """
+    return get_reverse_index(user_mgr, res_mgr, rule_mgr).users_for_resource(res_id, action)
+
+def resources_for_user(sub_id, user_mgr, res_mgr, rule_mgr, action=None):
+    """
+    What a user can access, answered from attribute inverted indexes (see reverse_query).
+
+    Args:
+        sub_id (str): user id
+        user_mgr (UserManager): holds user data from abac
+        res_mgr (ResourceManager): holds resources from abac
+        rule_mgr (RuleManager): holds rules from abac
+        action (str): only this action, every action when None
+
+    Returns:
+        dict: action -> sorted list of rids
+    """
+    return get_reverse_index(user_mgr, res_mgr, rule_mgr).resources_for_user(sub_id, action)
+
+def stream_requests(stream, out, user_mgr, res_mgr, rule_mgr, evaluation=None, fmt="csv", deny_only=False):
+    """
+    Streaming version of the -e mode, see stream_eval.stream_evaluate.
+
+    Args:
+        stream (file): requests, one "<user>,<resource>,<action>" per line
+        out (file): where the decisions are written (csv or jsonl)
+        user_mgr (UserManager): holds user data from abac
+        res_mgr (ResourceManager): holds resources from abac
+        rule_mgr (RuleManager): holds rules from abac
+        evaluation (PolicyEvaluation): optional, answer from an already evaluated policy
+        fmt (str): "csv" or "jsonl"
+        deny_only (bool): only write the Deny decisions
 
-    return "Deny"
+    Returns:
+        StreamStats: counters and latencies of the run
+    """
+    evaluate = cached_decider(user_mgr, res_mgr, rule_mgr, evaluation)
+    return stream_evaluate(stream, out, evaluate, fmt, deny_only)
 
-def generate_heatmap_data(user_mgr, res_mgr, rule_mgr):
+def generate_heatmap_data(user_mgr, res_mgr, rule_mgr, evaluation=None, workers=1):
     """
     Perform rule analysis and produce a heatmap  
 
@@ -71,38 +236,21 @@ def generate_heatmap_data(user_mgr, res_mgr, rule_mgr):
         user_mgr (UserManager): Manages users and their attributes.
         res_mgr (ResourceManager): Manages resources and their attributes.
         rule_mgr (RuleManager): Manages rules for authorization.
+        evaluation (PolicyEvaluation or PermissionTensor): already evaluated policy, built here if not given
+        workers (int): worker processes to build the evaluation with (see sharding)
 
     Returns:
         None
     """
+    if evaluation is None:
+        with instrumentation.phase("generate_heatmap_data.evaluate"):
+            evaluation = evaluate_policy(user_mgr, res_mgr, rule_mgr, workers)
+
+    # Count, per rule, the authorizations it covers for every attribute it references
     heatmap = {}
-    all_actions = set()
-    for rule in rule_mgr.rules:
-        all_actions.update(rule.acts)
-
-    # Prepare attribute mappings and rule coverage
-    for rule_idx, rule in enumerate(rule_mgr.rules):
-        heatmap[rule_idx] = {}
-        rule_attributes = rule.get_attributes()
-
-        # Initialize attribute count for the rule
-        for attr in rule_attributes["user"]:
-            heatmap[rule_idx][f"user.{attr}"] = 0
-        for attr in rule_attributes["resource"]:
-            heatmap[rule_idx][f"resource.{attr}"] = 0
-
-        # Evaluate rule over all users and resources
-        for uid, user in user_mgr.users.items():
-            for rid, resource in res_mgr.resources.items():
-                for action in all_actions:
-                    if rule.evaluate(user, resource, action):
-                        # Increment counts for referenced attributes
-                        for attr in rule_attributes["user"]:
-                            if attr in user.attributes:
-                                heatmap[rule_idx][f"user.{attr}"] += 1
-                        for attr in rule_attributes["resource"]:
-                            if attr in resource.attributes:
-                                heatmap[rule_idx][f"resource.{attr}"] += 1
+    with instrumentation.phase("generate_heatmap_data.count"):
+        for rule_idx in range(len(rule_mgr.rules)):
+            heatmap[rule_idx] = evaluation.attribute_counts(rule_idx)
 
     # Display analysis results
     print("Policy Coverage Analysis Heatmap:")
@@ -150,7 +298,7 @@ def visualize_heatmap(heatmap):
     plt.tight_layout()
     plt.show()
 
-def generate_bar_data(user_mgr, res_mgr, rule_mgr):
+def generate_bar_data(user_mgr, res_mgr, rule_mgr, evaluation=None, workers=1):
     """
     Perform the resources analysis and return two bar data sets:
     - Top 10 resources with the highest number of subjects granted permissions.
@@ -160,28 +308,23 @@ def generate_bar_data(user_mgr, res_mgr, rule_mgr):
         user_mgr (UserManager): Manages users and their attributes.
         res_mgr (ResourceManager): Manages resources and their attributes.
         rule_mgr (RuleManager): Manages rules for authorization.
+        evaluation (PolicyEvaluation or PermissionTensor): already evaluated policy, built here if not given
+        workers (int): worker processes to build the evaluation with (see sharding)
     
     Returns:
         tuple: Two lists of tuples (resource, access count) for the top 10 resources with the highest and least access.
     """
+    if evaluation is None:
+        with instrumentation.phase("generate_bar_data.evaluate"):
+            evaluation = evaluate_policy(user_mgr, res_mgr, rule_mgr, workers)
 
-    bar_data = {}
-    all_actions = set()
-
-    # Collect all actions from the rules
-    for rule in rule_mgr.rules:
-        all_actions.update(rule.acts)
+    # Number of (user, rule, action) grants on every resource
+    with instrumentation.phase("generate_bar_data.count"):
+        access_counts = evaluation.resource_counts()
 
-    # Prepare attribute mappings and rule coverage
+    bar_data = {}
     for rid, resource in res_mgr.resources.items():
-        resource_name = resource.get_name()
-        bar_data[resource_name] = 0
-        for uid, user in user_mgr.users.items():
-            for rule_idx, rule in enumerate(rule_mgr.rules):
-                # Evaluate if the resource is accessible
-                for action in all_actions:
-                    if rule.evaluate(user, resource, action):
-                        bar_data[resource_name] += 1
+        bar_data[resource.get_name()] = access_counts[rid]
 
     # Sort the resources by the number of subjects with access (highest to lowest)
     sorted_bar_data = dict(sorted(bar_data.items(), key=lambda item: item[1], reverse=True))
@@ -232,38 +375,157 @@ def visualize_bar(ax, data, title):
     ax.set_ylabel("Resources")
     ax.set_title(title)
 
+def parse_workers(argv):
+    """
+    Take "--workers N" out of the command line arguments.
+
+    Args:
+        argv (list): arguments, modified in place
+
+    Returns:
+        int: N, 1 when the option is not given
+    """
+    if "--workers" not in argv:
+        return 1
+    pos = argv.index("--workers")
+    if pos + 1 >= len(argv) or not argv[pos + 1].isdigit():
+        print("--workers expects a number of processes")
+        sys.exit(1)
+    workers = int(argv[pos + 1])
+    del argv[pos:pos + 2]
+    return max(1, workers)
+
+def pop_option(argv, name, default=None):
+    """
+    Take "<name> <value>" out of the command line arguments.
+
+    Returns:
+        str: the value, default when the option is not given
+    """
+    if name not in argv:
+        return default
+    pos = argv.index(name)
+    if pos + 1 >= len(argv):
+        print(f"{name} expects a value")
+        sys.exit(1)
+    value = argv[pos + 1]
+    del argv[pos:pos + 2]
+    return value
+
+def pop_flag(argv, name):
+    """
+    Take a flag out of the command line arguments.
+
+    Returns:
+        bool: True if the flag was given
+    """
+    if name not in argv:
+        return False
+    argv.remove(name)
+    return True
+
 def main():
-    if len(sys.argv) > 4 or (sys.argv[1] not in ['-e', '-a', '-b']):
+    workers = parse_workers(sys.argv)
+    out_format = pop_option(sys.argv, "--format", "csv")
+    if out_format not in FORMATS:
+        print(f"--format expects one of {', '.join(FORMATS)}")
+        sys.exit(1)
+    output_file = pop_option(sys.argv, "--output")
+    deny_only = pop_flag(sys.argv, "--deny-only")
+    # how -a / -b evaluate the whole policy, see sharding.evaluate_policy
+    engine = pop_option(sys.argv, "--engine", "python")
+    if engine not in ENGINES:
+        print(f"--engine expects one of {', '.join(ENGINES)}")
+        sys.exit(1)
+    # per rule counters / phase timings, written to the file at the end (.prom for Prometheus text, JSON otherwise)
+    stats_file = pop_option(sys.argv, "--stats")
+    if stats_file:
+        instrumentation.enable()
+
+    # reverse queries take an id and an optional action after the policy file
+    reverse_mode = len(sys.argv) > 1 and sys.argv[1] in ['-u', '-r']
+    min_args, max_args = (4, 5) if reverse_mode else (3, 4)
+    if len(sys.argv) < min_args or len(sys.argv) > max_args or (sys.argv[1] not in ['-e', '-s', '-a', '-b', '-u', '-r']):
         print("Usage: for request file evaluation python3 myabac.py -e <policy_file> <request_file>\n")
+        print("for streaming evaluation use  python3 myabac.py -s <policy_file> [<request_file> | -] [--format csv|jsonl] [--deny-only] [--output <file>]")
         print("for policy file analysis use  python3 myabac.py -a <policy_file> ")
         print("for resources analysis use  python3 myabac.py -b <policy_file> ")
+        print("for the users that can access a resource use  python3 myabac.py -u <policy_file> <resource_id> [<action>]")
+        print("for the resources a user can access use  python3 myabac.py -r <policy_file> <user_id> [<action>]")
+        print("add --workers N to parse and evaluate the policy with N processes")
+        print("add --engine tensor to evaluate the policy for -a / -b with NumPy masks instead of rule by rule")
+        print("add --stats <file> to record per rule counters and timings (.prom for Prometheus text, JSON otherwise)")
         sys.exit(1)
 
     policy_file = sys.argv[2]
 
     # Parse the policy file
-    user_mgr, res_mgr, rule_mgr = parse_abac_file(policy_file)
+    user_mgr, res_mgr, rule_mgr = parse_abac_file(policy_file, workers=workers)
+
+    # One shared evaluation of the policy for the analyses, they look at every (user, resource) pair.
+    # Requests (-e / -s) are decided one by one (see decide), a request file or a stream only
+    # touches a few pairs and doesn't pay for evaluating the whole policy up front
+    evaluation = None
+    if sys.argv[1] in ['-a', '-b']:
+        with instrumentation.phase("evaluate_policy"):
+            evaluation = evaluate_policy(user_mgr, res_mgr, rule_mgr, workers, engine)
 
     if sys.argv[1] == "-e":
         request_file = sys.argv[3]
     # Process requests
         with open(request_file, 'r', encoding="UTF-8") as f:
+            requests = []
             for line in f:
                 line = line.strip()
                 if not line or line.startswith('#'):
                     continue
-
-                decision = process_request(line, user_mgr, res_mgr, rule_mgr)
-                print(f"{line}: {decision}")
+                requests.append(line)
+
+        decisions = evaluate_many(requests, user_mgr, res_mgr, rule_mgr, evaluation)
+        for line, decision in zip(requests, decisions):
+            print(f"{line}: {decision}")
+
+    if sys.argv[1] == "-s":
+        # requests from stdin when no file (or "-") is given, stats go to stderr
+        request_file = sys.argv[3] if len(sys.argv) > 3 else "-"
+        stream = sys.stdin if request_file == "-" else open(request_file, 'r', encoding="UTF-8")
+        out = sys.stdout if output_file is None else open(output_file, 'w', encoding="UTF-8")
+        try:
+            stats = stream_requests(stream, out, user_mgr, res_mgr, rule_mgr, evaluation, out_format, deny_only)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+            if out is not sys.stdout:
+                out.close()
+
+        for line in stats.summary():
+            print(line, file=sys.stderr)
 
     if sys.argv[1]=="-a":
-        heatmap = generate_heatmap_data(user_mgr, res_mgr, rule_mgr)
+        heatmap = generate_heatmap_data(user_mgr, res_mgr, rule_mgr, evaluation)
         visualize_heatmap(heatmap)
  
 
     if sys.argv[1]=="-b":
-        top10, least10 = generate_bar_data(user_mgr, res_mgr, rule_mgr)
+        top10, least10 = generate_bar_data(user_mgr, res_mgr, rule_mgr, evaluation)
         plot_bar_data(top10, least10)
 
+    if reverse_mode:
+        # one "<uid>, <rid>, <action>" line per permission, like the ACL files
+        entity_id = sys.argv[3]
+        action = sys.argv[4] if len(sys.argv) > 4 else None
+        with instrumentation.phase("reverse_query"):
+            if sys.argv[1] == "-u":
+                granted = users_for_resource(entity_id, user_mgr, res_mgr, rule_mgr, action)
+                lines = [f"{uid}, {entity_id}, {act}" for act, uids in granted.items() for uid in uids]
+            else:
+                granted = resources_for_user(entity_id, user_mgr, res_mgr, rule_mgr, action)
+                lines = [f"{entity_id}, {rid}, {act}" for act, rids in granted.items() for rid in rids]
+        for line in sorted(lines):
+            print(line)
+
+    if stats_file:
+        instrumentation.export(stats_file)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
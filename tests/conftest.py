@@ -0,0 +1,74 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "llm-research"))
+
+from policy_parser import parse_policy
+
+# bundled organizations, every one has attribute data and ground truth rules
+ORGS = ["edocument", "healthcare", "project-management", "university", "workforce"]
+
+
+def write_policy(org, dest):
+    """
+    Attribute data + ground truth rules of an organization in one .abac file, like gt_acl_generator does.
+    """
+    path = os.path.join(dest, f"{org}.abac")
+    with open(path, "w", encoding="utf-8") as out:
+        for source in (os.path.join(ROOT, "DATASETS-for-LLM", org, f"{org}-attribute-data.txt"),
+                       os.path.join(ROOT, "ground-truth-ABAC-rules", f"{org}-abac-rules.txt")):
+            with open(source, "r", encoding="utf-8") as f:
+                out.write(f.read())
+            out.write("\n")
+    return path
+
+
+def policy_actions(rule_mgr):
+    actions = set()
+    for rule in rule_mgr.rules:
+        actions.update(rule.acts)
+    return sorted(actions)
+
+
+def baseline_permissions(user_mgr, res_mgr, rule_mgr):
+    """
+    Every (uid, rid, action) some rule permits, from Rule.evaluate on every triple.
+    """
+    permissions = set()
+    for uid, user in user_mgr.users.items():
+        for rid, resource in res_mgr.resources.items():
+            for rule in rule_mgr.rules:
+                for action in rule.acts:
+                    if rule.evaluate(user, resource, action):
+                        permissions.add((uid, rid, action))
+    return permissions
+
+
+@pytest.fixture(scope="session")
+def policy_dir(tmp_path_factory):
+    return str(tmp_path_factory.mktemp("policies"))
+
+
+@pytest.fixture(scope="session", params=ORGS)
+def org(request):
+    return request.param
+
+
+@pytest.fixture(scope="session")
+def policy_file(org, policy_dir):
+    return write_policy(org, policy_dir)
+
+
+@pytest.fixture(scope="session")
+def policy(policy_file):
+    user_mgr, res_mgr, rule_mgr = parse_policy(policy_file)
+    rule_mgr.build_index()
+    return user_mgr, res_mgr, rule_mgr
+
+
+@pytest.fixture(scope="session")
+def baseline(policy):
+    return baseline_permissions(*policy)
@@ -0,0 +1,97 @@
+import gzip
+import os
+
+import pytest
+
+import acl_writer
+from acl_tools import ACL, generate_acl
+from acl_writer import ACLWriter, write_sorted_acl
+from conftest import policy_actions
+from policy_eval import PolicyEvaluation
+
+
+def read(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        return f.read()
+
+
+def expected_file(baseline, tmp_path):
+    path = str(tmp_path / "expected.acl")
+    ACL.from_permissions(baseline).write(path)
+    return read(path)
+
+
+def test_single_run(policy, baseline, tmp_path):
+    out = str(tmp_path / "out.acl")
+    assert write_sorted_acl(iter(baseline), out, *policy) == len(baseline)
+    assert read(out) == expected_file(baseline, tmp_path)
+
+
+@pytest.fixture
+def small_runs(monkeypatch):
+    # runs as small as memory_limit says, merged 3 at a time
+    monkeypatch.setattr(acl_writer, "MIN_RUN_CODES", 1)
+    monkeypatch.setattr(acl_writer, "MAX_MERGE_RUNS", 3)
+
+
+@pytest.mark.parametrize("name", ["out.acl", "out.acl.gz"])
+def test_multi_run_spill(small_runs, policy, baseline, tmp_path, name):
+    user_mgr, res_mgr, rule_mgr = policy
+    out = str(tmp_path / name)
+    run_dir = tmp_path / "runs"
+    run_dir.mkdir()
+
+    # every permission twice, in reverse order the second time, about 20 runs
+    permissions = sorted(baseline)
+    memory_limit = 8 * (len(permissions) // 10 + 1)
+    with ACLWriter(out, user_mgr.users, res_mgr.resources, policy_actions(rule_mgr), memory_limit,
+                   tmp_dir=str(run_dir)) as writer:
+        writer.add_many(permissions)
+        writer.add_many(reversed(permissions))
+
+    assert writer.count == len(baseline)
+    assert writer.run_number > acl_writer.MAX_MERGE_RUNS
+    assert read(out) == expected_file(baseline, tmp_path)
+    # the run files are gone
+    assert os.listdir(run_dir) == []
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_generate_acl_streams(small_runs, monkeypatch, policy, baseline, tmp_path, workers):
+    # without an evaluation nothing may collect the whole ACL, only the writer's buffer holds permissions
+    def no_evaluation(*args, **kwargs):
+        raise AssertionError("generate_acl built a PolicyEvaluation")
+    monkeypatch.setattr(PolicyEvaluation, "__init__", no_evaluation)
+    spills = []
+    spill = ACLWriter.spill
+    monkeypatch.setattr(ACLWriter, "spill", lambda writer: spills.append(len(writer.buffer)) or spill(writer))
+
+    out = str(tmp_path / "out.acl")
+    memory_limit = 8 * (len(baseline) // 10 + 1)
+    assert generate_acl(*policy, out, workers=workers, memory_limit=memory_limit) == len(baseline)
+    assert read(out) == expected_file(baseline, tmp_path)
+    assert len(spills) > 1
+    assert max(spills) <= memory_limit // 8
+
+
+def test_error_discards_runs(small_runs, policy, baseline, tmp_path):
+    user_mgr, res_mgr, rule_mgr = policy
+    run_dir = tmp_path / "runs"
+    run_dir.mkdir()
+    with pytest.raises(KeyError):
+        with ACLWriter(str(tmp_path / "out.acl"), user_mgr.users, res_mgr.resources, policy_actions(rule_mgr),
+                       memory_limit=8 * (len(baseline) // 10 + 1), tmp_dir=str(run_dir)) as writer:
+            writer.add_many(sorted(baseline))
+            writer.add("no-such-user", next(iter(res_mgr.resources)), policy_actions(rule_mgr)[0])
+    assert os.listdir(run_dir) == []
+
+
+def test_line_order(tmp_path):
+    # ids sorting before "," in plain string order
+    permissions = {("a", "r", "read"), ("a+", "r", "read"), ("a", "r+", "read"), ("a", "r", "write")}
+    out = str(tmp_path / "out.acl")
+    with ACLWriter(out, ["a", "a+"], ["r", "r+"], ["read", "write"]) as writer:
+        writer.add_many(permissions)
+    assert read(out) == expected_file(permissions, tmp_path)
+    assert read(out).splitlines() == ["a, r, read", "a, r, write", "a, r+, read", "a+, r, read"]
@@ -0,0 +1,60 @@
+import random
+
+import pytest
+
+from acl_tools import ACL, compare_acl
+from bitmap_acl import ACLIndex, BitmapACL, compare_acl_bitmaps
+
+
+def acl_lines(permissions):
+    return {f"{uid}, {rid}, {action}" for uid, rid, action in permissions}
+
+
+def llm_acl(gt_lines, seed=0):
+    """
+    An ACL like an LLM policy gives: some ground truth lines missing, some extra ones (also with
+    ids the ground truth doesn't have) and lines compare_acl only matches as plain strings.
+    """
+    rnd = random.Random(seed)
+    lines = sorted(gt_lines)
+    kept = {line for line in lines if rnd.random() < 0.8}
+    extra = set()
+    canonical = [line for line in lines if line.count(", ") == 2]
+    for line in rnd.sample(canonical, min(10, len(canonical))):
+        uid, rid, action = line.split(", ")
+        extra.add(f"{uid}, {rid}, {action}X")
+        extra.add(f"{uid}-new, {rid}, {action}")
+        extra.add(f"{uid}, {rid}-new, {action}")
+    odd = {"", "u1,r1,read", "u1, r1", "u1,  r1, read", "u1, r1, read, write"}
+    return kept | extra | odd
+
+
+@pytest.mark.parametrize("layout", ["dense", "sparse"])
+def test_compare_matches_compare_acl(baseline, layout):
+    gt_lines = acl_lines(baseline) | {"u1,r1,read"}
+    other = llm_acl(gt_lines)
+
+    report, match, counts = compare_acl(ACL(gt_lines), ACL(other))
+    index = ACLIndex.from_lines(gt_lines)
+    index.add_lines(other)
+    comparison = BitmapACL.from_lines(gt_lines, index, layout).compare(BitmapACL.from_lines(other, index, layout))
+    assert comparison.counts() == counts
+    assert comparison.report_lines() == report
+    assert compare_acl_bitmaps(gt_lines, other, layout)[:2] == (match, counts)
+
+    assert compare_acl_bitmaps(gt_lines, set(gt_lines), layout) == (
+        True, compare_acl(ACL(gt_lines), ACL(gt_lines))[2], {"jaccard": 1.0, "precision": 1.0, "recall": 1.0})
+
+
+def test_files(baseline, tmp_path):
+    gt_file, llm_file = str(tmp_path / "gt.acl"), str(tmp_path / "llm.acl")
+    ACL(acl_lines(baseline)).write(gt_file)
+    ACL(llm_acl(acl_lines(baseline), seed=1)).write(llm_file)
+    assert compare_acl_bitmaps(gt_file, llm_file)[:2] == compare_acl(gt_file, llm_file)[1:]
+
+
+@pytest.mark.parametrize("layout", ["dense", "sparse"])
+def test_from_policy(policy, baseline, layout):
+    acl = BitmapACL.from_policy(*policy, layout=layout)
+    assert len(acl) == len(baseline)
+    assert sorted(acl.lines()) == sorted(acl_lines(baseline))
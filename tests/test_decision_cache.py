@@ -0,0 +1,91 @@
+import random
+
+import pytest
+
+from conftest import policy_actions, write_policy
+from decision_cache import DecisionCache
+from myabac import decide, evaluate_many, parse_abac_file
+from sharding import evaluate_policy
+
+
+def random_requests(user_mgr, res_mgr, rule_mgr, count, seed=0):
+    # requests over the ids of the policy, with repeats and a few unknown ids
+    rnd = random.Random(seed)
+    uids = sorted(user_mgr.users) + ["no-such-user"]
+    rids = sorted(res_mgr.resources) + ["no-such-resource"]
+    actions = policy_actions(rule_mgr) + ["no-such-action"]
+    return [f"{rnd.choice(uids)},{rnd.choice(rids)},{rnd.choice(actions)}" for _ in range(count)]
+
+
+@pytest.fixture
+def healthcare(tmp_path):
+    return parse_abac_file(write_policy("healthcare", str(tmp_path)), snapshot=False)
+
+
+@pytest.mark.parametrize("evaluated", [False, True])
+def test_batch_matches_decide(policy, evaluated):
+    evaluation = evaluate_policy(*policy) if evaluated else None
+    requests = random_requests(*policy, count=2000)
+    expected = [decide(*request.split(","), *policy) for request in requests]
+
+    cache = DecisionCache()
+    assert evaluate_many(requests, *policy, evaluation=evaluation, cache=cache) == expected
+    # the second batch is answered from the cache
+    misses = cache.misses
+    assert evaluate_many(requests, *policy, evaluation=evaluation, cache=cache) == expected
+    assert cache.misses == misses
+    assert cache.hits == len(set(requests))
+
+
+def test_lru_eviction_order():
+    cache = DecisionCache(maxsize=3)
+    for key in "abc":
+        cache.put(key, "Permit")
+    assert cache.get("a") == "Permit"
+    cache.put("d", "Deny")
+    # b was the least recently used
+    assert list(cache.entries) == ["c", "a", "d"]
+    assert cache.get("b") is None
+    cache.put("c", "Deny")
+    cache.put("e", "Permit")
+    assert list(cache.entries) == ["d", "c", "e"]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def stale_entry(cache, request):
+    # a cached decision that is wrong, only served while the cache is not invalidated
+    key = tuple(request.split(","))
+    wrong = "Deny" if cache.entries[key] == "Permit" else "Permit"
+    cache.entries[key] = wrong
+    return wrong
+
+
+@pytest.mark.parametrize("manager", [0, 1, 2])
+def test_version_change_invalidates(healthcare, manager):
+    requests = random_requests(*healthcare, count=200)
+    cache = DecisionCache()
+    expected = evaluate_many(requests, *healthcare, cache=cache)
+    wrong = stale_entry(cache, requests[0])
+    assert evaluate_many(requests[:1], *healthcare, cache=cache) == [wrong]
+
+    healthcare[manager].version += 1
+    assert evaluate_many(requests, *healthcare, cache=cache) == expected
+    # every triple was decided again (repeats in a batch never reach the cache)
+    assert (cache.hits, cache.misses) == (0, len(set(requests)))
+
+
+def test_other_managers_invalidate(healthcare, tmp_path):
+    requests = random_requests(*healthcare, count=200)
+    cache = DecisionCache()
+    expected = evaluate_many(requests, *healthcare, cache=cache)
+    wrong = stale_entry(cache, requests[0])
+
+    # the same policy loaded again: other managers with the same versions
+    (tmp_path / "reload").mkdir()
+    reloaded = parse_abac_file(write_policy("healthcare", str(tmp_path / "reload")), snapshot=False)
+    assert [mgr.version for mgr in reloaded] == [mgr.version for mgr in healthcare]
+    assert evaluate_many(requests, *reloaded, cache=cache) == expected
+
+    # and back, the cache follows the managers it is used with
+    assert cache.entries[tuple(requests[0].split(","))] != wrong
+    assert evaluate_many(requests, *healthcare, cache=cache) == expected
@@ -0,0 +1,101 @@
+import os
+
+import pytest
+
+from conftest import ROOT, policy_actions
+from acl_tools import file_to_set
+from myabac import decide, resources_for_user, users_for_resource
+from residual_policy import ResidualCache
+from rule_cache import RulePermissionCache
+from sharding import evaluate_policy
+
+
+def test_baseline_matches_ground_truth_acl(org, baseline):
+    gt_file = os.path.join(ROOT, "ground-truth-ACL", f"{org}-gt-ACL.txt")
+    if not os.path.exists(gt_file):
+        pytest.skip(f"no ground truth ACL for {org}")
+    assert {f"{uid}, {rid}, {action}" for uid, rid, action in baseline} == file_to_set(gt_file) - {""}
+
+
+@pytest.mark.parametrize("engine, workers", [("python", 1), ("python", 2), ("tensor", 1)])
+def test_engine_permissions(policy, baseline, engine, workers):
+    evaluation = evaluate_policy(*policy, workers=workers, engine=engine)
+    assert set(evaluation.permissions()) == baseline
+
+
+@pytest.mark.parametrize("engine", ["python", "tensor"])
+def test_engine_decide(policy, baseline, engine):
+    user_mgr, res_mgr, rule_mgr = policy
+    evaluation = evaluate_policy(*policy, engine=engine)
+    for uid in user_mgr.users:
+        for rid in res_mgr.resources:
+            for action in policy_actions(rule_mgr):
+                expected = "Permit" if (uid, rid, action) in baseline else "Deny"
+                assert evaluation.decide(uid, rid, action) == expected, (uid, rid, action)
+
+
+def test_unknown_engine(policy):
+    with pytest.raises(ValueError):
+        evaluate_policy(*policy, engine="gpu")
+
+
+def test_residual_decide(policy, baseline):
+    user_mgr, res_mgr, rule_mgr = policy
+    for uid in user_mgr.users:
+        for rid in res_mgr.resources:
+            for action in policy_actions(rule_mgr):
+                expected = "Permit" if (uid, rid, action) in baseline else "Deny"
+                assert decide(uid, rid, action, *policy) == expected, (uid, rid, action)
+    assert decide("no-such-user", next(iter(res_mgr.resources)), "read", *policy) == "Deny"
+
+
+def test_residual_cache_eviction(policy):
+    user_mgr, res_mgr, rule_mgr = policy
+    cache = ResidualCache(maxsize=2)
+    users = list(user_mgr.users.values())[:3]
+    for user in users:
+        cache.policy_for(user, user_mgr, rule_mgr)
+    cache.policy_for(users[-1], user_mgr, rule_mgr)
+    assert (cache.misses, cache.hits, cache.evictions) == (3, 1, 1)
+    assert len(cache.entries) == 2
+
+    # reloading the rules drops the residual policies
+    rule_mgr.version += 1
+    try:
+        cache.policy_for(users[-1], user_mgr, rule_mgr)
+        assert (cache.misses, cache.hits) == (1, 0)
+    finally:
+        rule_mgr.version -= 1
+
+
+def test_reverse_queries(policy, baseline):
+    user_mgr, res_mgr, rule_mgr = policy
+    by_resource, by_user = {}, {}
+    for uid, rid, action in baseline:
+        by_resource.setdefault(rid, {}).setdefault(action, []).append(uid)
+        by_user.setdefault(uid, {}).setdefault(action, []).append(rid)
+
+    for rid in res_mgr.resources:
+        expected = {action: sorted(uids) for action, uids in by_resource.get(rid, {}).items()}
+        assert users_for_resource(rid, *policy) == expected, rid
+    for uid in user_mgr.users:
+        expected = {action: sorted(rids) for action, rids in by_user.get(uid, {}).items()}
+        assert resources_for_user(uid, *policy) == expected, uid
+        for action in policy_actions(rule_mgr):
+            assert resources_for_user(uid, *policy, action=action) == {
+                key: value for key, value in expected.items() if key == action}
+
+
+def test_rule_cache(policy, baseline):
+    cache = RulePermissionCache()
+    assert cache.permissions(*policy, data_key="data") == baseline
+    assert cache.permissions(*policy, data_key="data") == baseline
+    assert cache.hits == len(policy[2].rules)
+
+    # other attribute data, nothing is reused
+    misses = cache.misses
+    cache.permissions(*policy, data_key="other data")
+    assert cache.misses == 2 * misses
+
+    with pytest.raises(ValueError):
+        cache.permissions(*policy, data_key=None)
@@ -0,0 +1,174 @@
+import json
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+import instrumentation
+from conftest import ROOT, policy_actions, write_policy
+from myabac import decide, parse_abac_file
+from rule import compile_condition, compile_constraint
+from test_decision_cache import random_requests
+
+REASON = re.compile(r"^(action|unknown|(sub_cond|res_cond|cons)\[\d+\])$")
+SAMPLE = re.compile(r'^([a-z_]+)(\{(.*)\})? (\S+)$')
+
+
+@pytest.fixture
+def instrumented():
+    instrumentation.enable()
+    try:
+        yield instrumentation.stats
+    finally:
+        instrumentation.disable()
+        instrumentation.stats.reset()
+
+
+def decide_sample(policy, count=3000):
+    # requests over the policy's ids, each decided once
+    decisions = {}
+    for request in random_requests(*policy, count=count):
+        key = tuple(request.split(","))
+        if key not in decisions:
+            decisions[key] = decide(*key, *policy)
+    return decisions
+
+
+def test_counters(instrumented, policy, baseline):
+    decisions = decide_sample(policy)
+    permitted = {key for key, decision in decisions.items() if decision == "Permit"}
+    assert permitted == baseline & set(decisions)
+
+    stats = instrumented
+    assert stats.requests == len(decisions)
+    assert stats.permits == len(permitted)
+    # requests of unknown users or resources never reach the rule index
+    known = sum(uid in policy[0].users and rid in policy[1].resources for uid, rid, _action in decisions)
+    assert stats.policy_rules == known * len(policy[2].rules)
+    assert 0 < stats.candidates <= stats.policy_rules
+
+    rules = stats.rules.values()
+    # the first permitting rule stops the evaluation, every request permits through one rule
+    assert sum(rule_stats.permits for rule_stats in rules) == stats.permits
+    for rule_stats in rules:
+        assert sum(rule_stats.rejections.values()) == rule_stats.evaluations - rule_stats.permits
+        assert all(REASON.match(reason) for reason in rule_stats.rejections)
+        assert rule_stats.seconds >= 0
+
+    requests = stats.to_json()["requests"]
+    assert requests["candidate_rules"] == stats.candidates
+    assert requests["candidate_ratio"] == pytest.approx(stats.candidates / stats.policy_rules)
+
+
+def test_rejection_reasons(tmp_path):
+    user_mgr, res_mgr, rule_mgr = parse_abac_file(write_policy("healthcare", str(tmp_path)), snapshot=False)
+    actions = policy_actions(rule_mgr)
+    for rule in rule_mgr.rules:
+        rule_stats = instrumentation.RuleStats(rule)
+        # Rule.evaluate order: action, subject conditions, resource conditions, constraints
+        parts = ([("sub_cond", compile_condition(*cond), "user") for cond in rule.sub_cond]
+                 + [("res_cond", compile_condition(*cond), "resource") for cond in rule.res_cond]
+                 + [("cons", compile_constraint(*cons), "both") for cons in rule.cons])
+        for user in user_mgr.users.values():
+            for resource in res_mgr.resources.values():
+                for action in actions:
+                    if rule.evaluate(user, resource, action):
+                        continue
+                    reason = rule_stats.rejection_reason(user, resource, action)
+                    if action not in rule.acts:
+                        assert reason == "action"
+                        continue
+                    results = [check(user.attributes) if side == "user" else check(resource.attributes)
+                               if side == "resource" else check(user.attributes, resource.attributes)
+                               for _name, check, side in parts]
+                    first = results.index(False)
+                    name = parts[first][0]
+                    assert reason == f"{name}[{first - [part[0] for part in parts].index(name)}]"
+
+
+def test_phases(instrumented, tmp_path):
+    policy_file = write_policy("healthcare", str(tmp_path))
+    parse_abac_file(policy_file)
+    parse_abac_file(policy_file)
+    phases = instrumented.phases
+    assert phases["parse_abac_file.parse"][0] == 1
+    assert phases["parse_abac_file.snapshot_load"][0] == 2
+    assert phases["parse_abac_file.build_index"][0] == 2
+    assert all(seconds >= 0 for _calls, seconds in phases.values())
+
+
+def test_disabled_records_nothing(policy):
+    instrumentation.stats.reset()
+    decide_sample(policy, count=300)
+    with instrumentation.phase("anything"):
+        pass
+    assert instrumentation.stats.requests == 0
+    assert instrumentation.stats.phases == {}
+
+
+def parse_prometheus(text):
+    """
+    Returns:
+        dict: (name, labels) -> value, every sample of the exposition
+    """
+    samples = {}
+    described = set()
+    for line in text.splitlines():
+        if line.startswith("# HELP "):
+            described.add(line.split()[2])
+            continue
+        if line.startswith("# TYPE "):
+            assert line.split()[2] in described and line.split()[3] == "counter"
+            continue
+        match = SAMPLE.match(line)
+        assert match, line
+        name, _, labels, value = match.groups()
+        assert name in described
+        labels = tuple(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', labels or ""))
+        samples[name, labels] = float(value)
+    return samples
+
+
+def test_export_formats(instrumented, policy, tmp_path):
+    decide_sample(policy)
+    stats = instrumented
+
+    instrumentation.export(str(tmp_path / "stats.json"))
+    instrumentation.export(str(tmp_path / "stats.txt"))
+    with open(tmp_path / "stats.json", encoding="utf-8") as f:
+        exported = json.load(f)
+    assert exported == json.loads(json.dumps(stats.to_json()))
+    # only .prom files are Prometheus text
+    with open(tmp_path / "stats.txt", encoding="utf-8") as f:
+        assert json.load(f) == exported
+
+    instrumentation.export(str(tmp_path / "stats.prom"))
+    with open(tmp_path / "stats.prom", encoding="utf-8") as f:
+        samples = parse_prometheus(f.read())
+    assert samples["abac_requests_total", (("decision", "Permit"),)] == stats.permits
+    assert samples["abac_requests_total", (("decision", "Deny"),)] == stats.requests - stats.permits
+    assert samples["abac_candidate_rules_total", ()] == stats.candidates
+    assert samples["abac_policy_rules_total", ()] == stats.policy_rules
+    evaluations = sum(value for (name, _labels), value in samples.items() if name == "abac_rule_evaluations_total")
+    assert evaluations == sum(rule_stats.evaluations for rule_stats in stats.rules.values())
+    rejections = sum(value for (name, _labels), value in samples.items() if name == "abac_rule_rejections_total")
+    assert rejections == sum(sum(rule_stats.rejections.values()) for rule_stats in stats.rules.values())
+
+
+@pytest.mark.parametrize("name", ["stats.prom", "stats.json"])
+def test_cli_stats(tmp_path, name):
+    policy_file = write_policy("healthcare", str(tmp_path))
+    request_file = tmp_path / "requests.txt"
+    request_file.write_text("doc1,carPat2HR,read\nnobody,carPat2HR,read\n", encoding="utf-8")
+    stats_file = tmp_path / name
+    subprocess.run([sys.executable, os.path.join(ROOT, "llm-research", "myabac.py"), "-e", policy_file,
+                    str(request_file), "--stats", str(stats_file)], capture_output=True, check=True)
+
+    text = stats_file.read_text(encoding="utf-8")
+    if name.endswith(".prom"):
+        assert sum(value for (metric, _labels), value in parse_prometheus(text).items()
+                   if metric == "abac_requests_total") == 2
+    else:
+        assert json.loads(text)["requests"]["total"] == 2
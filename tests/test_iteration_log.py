@@ -0,0 +1,100 @@
+import os
+import random
+
+import pytest
+
+import iteration_log
+from helper_functions import prepend_file, prepend_text_to_file
+from iteration_log import IterationLog, divider_text
+from test_sessions import rules_text, run_session, workspace  # noqa: F401 (fixture)
+
+
+def iteration_texts(count, seed=0):
+    rnd = random.Random(seed)
+    words = ["rule(role [ {doctor}; ; read)", "userAttrib(u1, role=nurse)", "é ü", "", "\n", "x" * 40]
+    return ["\n".join(rnd.choice(words) for _ in range(rnd.randrange(6))) for _ in range(count)]
+
+
+def prepended_layout(tmp_path, texts):
+    # what write_to_logs used to build: every iteration's file, then its divider, put in front
+    cache_file = str(tmp_path / "old.cache")
+    open(cache_file, "w", encoding="utf-8").close()
+    src_file = str(tmp_path / "session.txt")
+    for num, text in enumerate(texts):
+        with open(src_file, "w", encoding="utf-8") as f:
+            f.write(text)
+        prepend_file(cache_file, src_file)
+        prepend_text_to_file(cache_file, divider_text(num))
+    with open(cache_file, encoding="utf-8") as f:
+        return f.read()
+
+
+def logged(tmp_path, texts):
+    log = IterationLog(str(tmp_path / "new.cache"))
+    src_file = str(tmp_path / "session.txt")
+    for num, text in enumerate(texts):
+        with open(src_file, "w", encoding="utf-8") as f:
+            f.write(text)
+        log.append_file(num, src_file)
+    return log
+
+
+def render(log):
+    with open(log.render(), encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_render_matches_prepend_layout(tmp_path, seed):
+    texts = iteration_texts(12, seed)
+    log = logged(tmp_path, texts)
+    assert render(log) == prepended_layout(tmp_path, texts)
+    for num, text in enumerate(texts):
+        assert log.read(num) == text
+    assert log.read(len(texts)) is None
+
+
+def test_segment_rollover(tmp_path, monkeypatch):
+    monkeypatch.setattr(iteration_log, "SEGMENT_BYTES", 100)
+    texts = ["x" * 40 + str(num) for num in range(10)]
+    log = logged(tmp_path, texts)
+
+    # a new segment once the current one holds SEGMENT_BYTES
+    segments = [segment for _num, segment, _offset, _length in log.entries()]
+    assert segments == [0, 0, 0, 1, 1, 1, 2, 2, 2, 3]
+    assert all(os.path.getsize(log.segment_file(segment)) <= 100 + 42 for segment in set(segments))
+    assert render(log) == prepended_layout(tmp_path, texts)
+    assert [log.read(num) for num in range(10)] == texts
+
+    log.reset()
+    assert log.entries() == []
+    assert [name for name in os.listdir(tmp_path) if name.startswith("new.cache")] == ["new.cache"]
+
+
+def test_empty_log(tmp_path):
+    log = IterationLog(str(tmp_path / "new.cache"))
+    assert render(log) == ""
+
+
+@pytest.mark.parametrize("error", [RuntimeError, KeyboardInterrupt])
+def test_render_after_crash(workspace, error):
+    calls = []
+
+    def api_call(prompt):
+        calls.append(prompt)
+        if len(calls) == 3:
+            raise error("session stopped")
+        return rules_text(drop_last=len(calls))
+
+    with pytest.raises(error):
+        run_session(workspace, api_call, max_num_it=5)
+
+    # the two finished iterations are in the .cache files, newest first
+    with open(workspace.llm_response_cache, encoding="utf-8") as f:
+        assert f.read() == divider_text(1) + rules_text(drop_last=2) + divider_text(0) + rules_text(drop_last=1)
+    with open(workspace.generated_rules_file, encoding="utf-8") as f:
+        assert f.read().startswith(divider_text(1))
+    with open(workspace.abac_cache, encoding="utf-8") as f:
+        assert f.read().count("ITERATION : ") == 2
+    # and still in the logs
+    assert len(IterationLog(workspace.abac_cache).entries()) == 2
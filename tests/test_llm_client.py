@@ -0,0 +1,124 @@
+import asyncio
+import types
+
+import pytest
+
+from api_functions import llm_client
+from api_functions.llm_client import GeminiClient
+from api_functions.stub_server import start_stub_server
+
+ANSWER = "rule(; ; read)"
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    # retry delays are recorded instead of waited for (only in llm_client, the stub server still sleeps)
+    delays = []
+    monkeypatch.setattr(llm_client, "time", types.SimpleNamespace(sleep=delays.append))
+    return delays
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(**kwargs):
+        server, url = start_stub_server(response=kwargs.pop("response", ANSWER), **kwargs)
+        servers.append(server)
+        return server.state, url
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def client(url, **kwargs):
+    return GeminiClient("test-key", url=url, **kwargs)
+
+
+def test_answer(stub, sleeps):
+    state, url = stub(response=lambda prompt: prompt.upper())
+    gemini = client(url)
+    assert gemini.generate("some prompt") == "SOME PROMPT"
+    assert state.requests == 1
+    assert sleeps == []
+    gemini.close()
+
+
+@pytest.mark.parametrize("status", [429, 500, 502, 503, 504])
+def test_retries_then_answers(stub, sleeps, status):
+    state, url = stub(fail_first=3, fail_status=status)
+    gemini = client(url, backoff=1.0, max_backoff=60.0)
+    assert gemini.generate("prompt") == ANSWER
+    assert state.requests == 4
+    # exponential backoff with jitter: attempt n waits between half and all of backoff * 2**n
+    assert len(sleeps) == 3
+    for attempt, delay in enumerate(sleeps):
+        assert 0.5 * 2 ** attempt <= delay <= 2 ** attempt
+
+
+def test_backoff_capped(stub, sleeps):
+    state, url = stub(fail_first=6)
+    gemini = client(url, max_retries=6, backoff=1.0, max_backoff=4.0)
+    assert gemini.generate("prompt") == ANSWER
+    assert state.requests == 7
+    assert max(sleeps) <= 4.0
+
+
+@pytest.mark.parametrize("retry_after, expected", [("2", 2.0), ("600", 30.0)])
+def test_retry_after(stub, sleeps, retry_after, expected):
+    state, url = stub(fail_first=1, fail_status=429, retry_after=retry_after)
+    gemini = client(url, max_backoff=30.0)
+    assert gemini.generate("prompt") == ANSWER
+    assert state.requests == 2
+    # the server's delay is used, never more than max_backoff
+    assert sleeps == [expected]
+
+
+def test_gives_up_after_max_retries(stub, sleeps):
+    state, url = stub(fail_first=100, fail_status=503)
+    gemini = client(url, max_retries=2)
+    assert gemini.generate("prompt") is None
+    assert state.requests == 3
+    assert len(sleeps) == 2
+
+
+def test_client_errors_not_retried(stub, sleeps):
+    state, url = stub(fail_first=100, fail_status=400)
+    assert client(url).generate("prompt") is None
+    assert state.requests == 1
+    assert sleeps == []
+
+
+def test_timeout_retried_then_none(stub, sleeps):
+    state, url = stub(delay=0.5)
+    gemini = client(url, timeout=(1.0, 0.05), max_retries=2)
+    assert gemini.generate("prompt") is None
+    assert state.requests == 3
+    assert len(sleeps) == 2
+
+
+def test_connection_error_retried_then_none(sleeps):
+    # nothing listens on the port of a stopped server
+    server, url = start_stub_server()
+    server.shutdown()
+    server.server_close()
+    gemini = client(url, max_retries=1)
+    assert gemini.generate("prompt") is None
+    assert len(sleeps) == 1
+
+
+def test_async(stub, sleeps):
+    state, url = stub(fail_first=1, response=lambda prompt: f"answer to {prompt}")
+    gemini = client(url)
+
+    async def ask():
+        return await asyncio.gather(gemini.apost(gemini.request_body("a")), gemini.agenerate("b"),
+                                    gemini.agenerate("c"))
+
+    payload, second, third = asyncio.run(ask())
+    assert gemini.response_text(payload) == "answer to a"
+    assert (second, third) == ("answer to b", "answer to c")
+    # one failed attempt, retried by whichever call got it
+    assert state.requests == 4
+    assert len(sleeps) == 1
@@ -0,0 +1,72 @@
+import pytest
+
+import policy_parser
+from conftest import write_policy
+from policy_parser import PolicySyntaxError, chunk_offsets, parse_policy
+from test_snapshot import dump
+
+
+@pytest.fixture
+def parallel(monkeypatch):
+    # small files are parsed in chunks too, and in many chunks so lines of every kind are cut
+    monkeypatch.setattr(policy_parser, "PARALLEL_MIN_BYTES", 0)
+    monkeypatch.setattr(policy_parser, "CHUNKS_PER_WORKER", 16)
+
+
+def test_parallel_parse_matches_sequential(parallel, org, policy_file):
+    assert dump(parse_policy(policy_file, workers=2)) == dump(parse_policy(policy_file))
+
+
+def test_chunk_offsets_start_at_lines(policy_file):
+    with open(policy_file, "rb") as f:
+        data = f.read()
+    for num_chunks in (1, 2, 7, 64, len(data)):
+        chunks = chunk_offsets(policy_file, num_chunks)
+        assert chunks[0][0] == 0 and chunks[-1][1] == len(data)
+        for (_, end), (start, _) in zip(chunks, chunks[1:]):
+            assert end == start
+            assert data[start - 1:start] == b"\n"
+
+
+def test_crlf_and_missing_last_newline(parallel, tmp_path):
+    lines = open(write_policy("healthcare", str(tmp_path)), encoding="utf-8").read().splitlines()
+    unix = tmp_path / "unix.abac"
+    unix.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    dos = tmp_path / "dos.abac"
+    dos.write_bytes("\r\n".join(lines).encode("utf-8"))
+
+    expected = dump(parse_policy(str(unix)))
+    assert dump(parse_policy(str(dos))) == expected
+    assert dump(parse_policy(str(dos), workers=2)) == expected
+
+
+def broken_policy(tmp_path, bad_line, after):
+    """
+    Healthcare policy with bad_line inserted after the first `after` lines.
+
+    Returns:
+        str, int: the file and the line number of bad_line
+    """
+    lines = open(write_policy("healthcare", str(tmp_path)), encoding="utf-8").read().splitlines()
+    after = min(after, len(lines))
+    path = tmp_path / "broken.abac"
+    path.write_text("\n".join(lines[:after] + [bad_line] + lines[after:]) + "\n", encoding="utf-8")
+    return str(path), after + 1
+
+
+@pytest.mark.parametrize("bad_line, column", [
+    ("  userAttrib(bad, position staff)", 19),
+    ("resourceAttrib(bad, type={hr", 29),
+    ("resourceAttrib(bad, type={hr)", 21),
+    ("userAttrib bad", 11),
+    ("\trule(position [ {doctor}; read)", 32),
+])
+@pytest.mark.parametrize("after", [0, 40, 10 ** 6])
+def test_error_position(parallel, tmp_path, bad_line, column, after):
+    path, line = broken_policy(tmp_path, bad_line, after)
+
+    for workers in (1, 2):
+        with pytest.raises(PolicySyntaxError) as info:
+            parse_policy(path, workers=workers)
+        error = info.value
+        assert (error.file_name, error.line, error.column, error.text) == (path, line, column, bad_line)
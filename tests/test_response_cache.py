@@ -0,0 +1,137 @@
+import os
+
+from api_functions.response_cache import ResponseCache, response_key
+from session_workspace import SessionWorkspace
+from test_sessions import rules_text, run_session, workspace  # noqa: F401 (fixture)
+
+
+class FakeAPI:
+    """
+    api_call counting its calls, answers with answer(prompt).
+    """
+
+    def __init__(self, answer=lambda prompt: f"answer to {prompt}"):
+        self.answer = answer
+        self.prompts = []
+
+    def __call__(self, prompt):
+        self.prompts.append(prompt)
+        return self.answer(prompt)
+
+
+def no_api(prompt):
+    raise AssertionError("the API was called in replay mode")
+
+
+def test_same_request_and_model_hit(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache"))
+    api = FakeAPI()
+    call = cache.wrap(api, "model-a")
+    assert call("prompt") == "answer to prompt"
+    assert call("prompt") == "answer to prompt"
+    assert api.prompts == ["prompt"]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # entries are on disk, a new cache on the same folder answers too
+    again = ResponseCache(str(tmp_path / "cache")).wrap(no_api, "model-a")
+    assert again("prompt") == "answer to prompt"
+
+
+def test_other_model_params_or_prompt_miss(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache"))
+    api = FakeAPI()
+    cache.wrap(api, "model-a")("prompt")
+    cache.wrap(api, "model-b")("prompt")
+    cache.wrap(api, "model-a", {"candidate": 1})("prompt")
+    cache.wrap(api, "model-a")("other prompt")
+    assert len(api.prompts) == 4
+    assert cache.hits == 0
+    assert len({response_key("prompt", "model-a"), response_key("prompt", "model-b"),
+                response_key("prompt", "model-a", {"candidate": 1})}) == 3
+
+
+def test_failed_calls_not_cached(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache"))
+    answers = iter([None, "late answer"])
+    api = FakeAPI(lambda prompt: next(answers))
+    call = cache.wrap(api, "model-a")
+    assert call("prompt") is None
+    assert call("prompt") == "late answer"
+    assert call("prompt") == "late answer"
+    assert len(api.prompts) == 2
+
+
+def test_replay_never_calls_api(tmp_path):
+    ResponseCache(str(tmp_path / "cache")).wrap(FakeAPI(), "model-a")("cached prompt")
+
+    replay = ResponseCache(str(tmp_path / "cache"), replay_only=True)
+    call = replay.wrap(no_api, "model-a")
+    assert call("cached prompt") == "answer to cached prompt"
+    assert call("new prompt") is None
+    assert replay.wrap(no_api, "model-b")("cached prompt") is None
+
+
+def test_eviction_keeps_recent_entries(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache"), max_bytes=10 ** 6)
+    for num in range(3):
+        cache.put(f"prompt {num}", "model-a", None, "x" * 100)
+    paths = [cache.entry_path(response_key(f"prompt {num}", "model-a")) for num in range(3)]
+    # prompt 0 is used last, prompt 1 is the least recently used
+    for age, path in zip((10, 30, 20), paths):
+        os.utime(path, (1000 - age, 1000 - age))
+    cache.get("prompt 0", "model-a")
+
+    cache.max_bytes = cache.total_bytes
+    cache.put("prompt 3", "model-a", None, "x" * 100)
+    assert cache.get("prompt 1", "model-a") is None
+    assert cache.get("prompt 0", "model-a") is not None
+    assert cache.get("prompt 3", "model-a") is not None
+    assert cache.total_bytes <= cache.max_bytes
+
+
+def session_files(workspace):
+    names = [workspace.abac_file, workspace.comparison_file, workspace.llm_response_file]
+    return [open(name, encoding="utf-8").read() for name in names]
+
+
+def test_session_replay(workspace, tmp_path):
+    api = FakeAPI(lambda prompt: rules_text(drop_last=1))
+    cache = ResponseCache(str(tmp_path / "cache"))
+    run_session(workspace, api, max_num_it=3, response_cache=cache)
+    # a request answered once is taken from the cache, the API only sees new ones
+    assert len(set(api.prompts)) == len(api.prompts)
+    assert (cache.misses, cache.hits) == (len(api.prompts), 3 - len(api.prompts))
+    recorded = session_files(workspace)
+
+    # the same session again, every prompt is answered from the cache
+    replay_workspace = SessionWorkspace(str(tmp_path / "replay"))
+    replay_workspace.create()
+    replay = ResponseCache(str(tmp_path / "cache"), replay_only=True)
+    run_session(replay_workspace, no_api, max_num_it=3, response_cache=replay)
+    assert (replay.hits, replay.misses) == (3, 0)
+    assert session_files(replay_workspace) == recorded
+
+
+def test_replay_other_model(workspace, tmp_path):
+    run_session(workspace, FakeAPI(lambda prompt: rules_text()), max_num_it=1,
+                response_cache=ResponseCache(str(tmp_path / "cache")))
+
+    replay = ResponseCache(str(tmp_path / "cache"), replay_only=True)
+    run_session(workspace, no_api, max_num_it=3, response_cache=replay, model="other-model")
+    assert (replay.hits, replay.misses) == (0, 1)
+
+
+def test_import_session(workspace, tmp_path):
+    api = FakeAPI(lambda prompt: rules_text(drop_last=1))
+    run_session(workspace, api, max_num_it=2)
+    assert len(api.prompts) == 2
+
+    # the .cache files of the session, as they are saved in the tracebook
+    cache = ResponseCache(str(tmp_path / "cache"), replay_only=True)
+    assert cache.import_tracebook(workspace.root, "test-model") == 2
+
+    replay_workspace = SessionWorkspace(str(tmp_path / "replay"))
+    replay_workspace.create()
+    run_session(replay_workspace, no_api, max_num_it=2, response_cache=cache)
+    assert cache.misses == 0
+    assert session_files(replay_workspace) == session_files(workspace)
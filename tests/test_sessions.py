@@ -0,0 +1,106 @@
+import os
+import threading
+import time
+
+import pytest
+
+from acl_tools import ACL
+from conftest import ROOT
+from helper_functions import best_candidate, iterate_api_requests
+from session_workspace import SessionWorkspace
+
+ORG = "healthcare"
+GT_ACL_FILE = f"ground-truth-ACL/{ORG}-gt-ACL.txt"
+ATTRIBUTE_DATA_FILE = f"DATASETS-for-LLM/{ORG}/{ORG}-attribute-data.txt"
+DESCRIPTION_FILE = f"DATASETS-for-LLM/{ORG}/{ORG}-attribute-data-description.txt"
+
+
+def rules_text(drop_last=0):
+    # ground truth rules of the organization, an LLM answer that is drop_last rules short
+    with open(os.path.join(ROOT, "ground-truth-ABAC-rules", f"{ORG}-abac-rules.txt"), encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    rule_lines = [pos for pos, line in enumerate(lines) if line.startswith("rule")]
+    for pos in rule_lines[len(rule_lines) - drop_last:]:
+        lines[pos] = ""
+    return "\n".join(lines) + "\n"
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    # the prompts and data files are found relative to the repository root, like llm_main runs
+    monkeypatch.chdir(ROOT)
+    workspace = SessionWorkspace(str(tmp_path / "session"))
+    workspace.create()
+    return workspace
+
+
+def run_session(workspace, api_call, max_num_it, candidates=1, response_cache=None, model="test-model"):
+    return iterate_api_requests(GT_ACL_FILE, ATTRIBUTE_DATA_FILE, DESCRIPTION_FILE, api_call, max_num_it, workspace,
+                                response_cache, model, candidates)
+
+
+def test_candidate_threads_kept_across_iterations(workspace):
+    threads = []
+
+    def api_call(request):
+        threads.append(threading.current_thread().name)
+        return rules_text(drop_last=1)
+
+    run_session(workspace, api_call, max_num_it=4, candidates=2)
+    assert len(threads) == 8
+    # the same two threads (and their HTTP sessions) answer every iteration
+    assert len(set(threads)) <= 2
+
+
+def candidate_run(workspace, answers, delays=None):
+    """
+    best_candidate with one fake api call per answer (None: no answer), candidate pos answering after delays[pos].
+    """
+    def candidate(pos):
+        def api_call(request):
+            time.sleep(delays[pos] if delays else 0)
+            return answers[pos]
+        return api_call
+
+    gt_acl = ACL.from_file(GT_ACL_FILE)
+    return best_candidate([candidate(pos) for pos in range(len(answers))], "request", workspace, ATTRIBUTE_DATA_FILE,
+                          gt_acl)
+
+
+def kept_response(workspace):
+    with open(workspace.llm_response_file, encoding="utf-8") as f:
+        return f.read()
+
+
+def leftover_candidates(workspace):
+    return [name for name in os.listdir(workspace.root) if name.startswith("candidate-")]
+
+
+def test_best_candidate_fewest_different(workspace):
+    answers = [rules_text(drop_last=2), rules_text(), rules_text(drop_last=1)]
+    assert candidate_run(workspace, answers) is True
+    assert kept_response(workspace) == answers[1]
+    with open(workspace.abac_file, encoding="utf-8") as f:
+        assert f.read().endswith(answers[1])
+    with open(workspace.comparison_file, encoding="utf-8") as f:
+        assert f.read().splitlines()[-1] == "Total different lines: 0"
+    assert leftover_candidates(workspace) == []
+
+
+def test_best_candidate_tie_goes_to_lower_position(workspace):
+    # same rules, the later candidates answer first
+    answers = [rules_text(drop_last=1), "# same rules\n" + rules_text(drop_last=1), rules_text(drop_last=3)]
+    assert candidate_run(workspace, answers, delays=[0.2, 0.0, 0.0]) is False
+    assert kept_response(workspace) == answers[0]
+    assert leftover_candidates(workspace) == []
+
+
+def test_best_candidate_skips_missing_answers(workspace):
+    answers = [None, rules_text(drop_last=2), None]
+    assert candidate_run(workspace, answers) is False
+    assert kept_response(workspace) == answers[1]
+    assert leftover_candidates(workspace) == []
+
+    assert candidate_run(workspace, [None, None]) is None
+    # nothing was written for an iteration without answers
+    assert kept_response(workspace) == answers[1]
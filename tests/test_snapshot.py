@@ -0,0 +1,83 @@
+import os
+import random
+
+import pytest
+
+from conftest import write_policy
+from myabac import parse_abac_file
+from snapshot import SnapshotError, file_hash, load_snapshot, snapshot_path, write_snapshot
+
+
+def dump(managers):
+    # plain values of the managers, rules compared by their conditions
+    user_mgr, res_mgr, rule_mgr = managers
+    return (
+        {uid: dict(user.attributes) for uid, user in user_mgr.users.items()},
+        {rid: dict(resource.attributes) for rid, resource in res_mgr.resources.items()},
+        [repr((rule.sub_cond, rule.res_cond, sorted(rule.acts), rule.cons)) for rule in rule_mgr.rules],
+    )
+
+
+@pytest.fixture
+def policy_copy(tmp_path):
+    return write_policy("university", str(tmp_path))
+
+
+def test_round_trip(policy_copy):
+    parsed = parse_abac_file(policy_copy, snapshot=False)
+    snap_file = snapshot_path(policy_copy)
+    write_snapshot(snap_file, *parsed, file_hash(policy_copy))
+
+    assert dump(load_snapshot(snap_file, file_hash(policy_copy))) == dump(parsed)
+    # made from another policy
+    assert load_snapshot(snap_file, b"\1" * 32) is None
+    # no temporary file is left next to the snapshot
+    assert sorted(os.listdir(os.path.dirname(policy_copy))) == sorted(
+        [os.path.basename(policy_copy), os.path.basename(snap_file)])
+
+
+def test_parse_abac_file_uses_snapshot(policy_copy):
+    expected = dump(parse_abac_file(policy_copy, snapshot=False))
+    parse_abac_file(policy_copy)
+    assert os.path.exists(snapshot_path(policy_copy))
+    assert dump(parse_abac_file(policy_copy)) == expected
+
+
+def corrupt_variants(snap, count=150):
+    rnd = random.Random(0)
+    variants = [b"", snap[:4], snap[:60], snap[:len(snap) // 2], snap[:-1]]
+    for _ in range(count):
+        data = bytearray(snap)
+        pos = rnd.randrange(len(data))
+        data[pos] ^= 1 << rnd.randrange(8)
+        variants.append(bytes(data))
+    return variants
+
+
+def test_corrupt_snapshot_raises(policy_copy):
+    parse_abac_file(policy_copy)
+    snap_file = snapshot_path(policy_copy)
+    with open(snap_file, "rb") as f:
+        snap = f.read()
+
+    for data in corrupt_variants(snap):
+        with open(snap_file, "wb") as f:
+            f.write(data)
+        with pytest.raises(SnapshotError):
+            load_snapshot(snap_file)
+
+
+def test_corrupt_snapshot_falls_back(policy_copy):
+    expected = dump(parse_abac_file(policy_copy, snapshot=False))
+    parse_abac_file(policy_copy)
+    snap_file = snapshot_path(policy_copy)
+    with open(snap_file, "rb") as f:
+        snap = f.read()
+
+    for data in corrupt_variants(snap, count=30):
+        with open(snap_file, "wb") as f:
+            f.write(data)
+        assert dump(parse_abac_file(policy_copy)) == expected
+        # the policy was parsed again and a good snapshot written in place of the corrupt one
+        with open(snap_file, "rb") as f:
+            assert f.read() == snap
@@ -0,0 +1,150 @@
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+
+import pytest
+
+from conftest import ROOT, write_policy
+from myabac import parse_abac_file, process_request, stream_requests
+from stream_eval import SUB_BUCKETS, LatencyHistogram, stream_evaluate
+from test_decision_cache import random_requests
+
+# lines stream_evaluate skips: malformed ones are counted, blank lines and comments are not
+MALFORMED = ["only,two", "one,too,many,fields", "no commas"]
+SKIPPED = ["", "   ", "# comment"]
+
+
+def request_lines(policy, count=1500, seed=0):
+    rnd = random.Random(seed)
+    lines = random_requests(*policy, count=count, seed=seed)
+    for extra in MALFORMED + SKIPPED:
+        lines.insert(rnd.randrange(len(lines) + 1), extra)
+    # indentation and line ends are stripped, like -e does
+    return [f"  {line}\r" if rnd.random() < 0.1 else line for line in lines]
+
+
+def expected_decisions(policy, lines, deny_only=False):
+    result = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#") or len(line.split(",")) != 3:
+            continue
+        decision = process_request(line, *policy)
+        if deny_only and decision != "Deny":
+            continue
+        result.append(line.split(",") + [decision])
+    return result
+
+
+def run(policy, lines, fmt, deny_only=False):
+    out = io.StringIO()
+    stream = io.StringIO("\n".join(lines) + "\n")
+    stats = stream_requests(stream, out, *policy, fmt=fmt, deny_only=deny_only)
+    return stats, out.getvalue().splitlines()
+
+
+@pytest.mark.parametrize("deny_only", [False, True])
+@pytest.mark.parametrize("chunk_size", [1, 100, 1 << 20])
+def test_csv(policy, deny_only, chunk_size):
+    lines = request_lines(policy)
+    expected = expected_decisions(policy, lines, deny_only)
+
+    out = io.StringIO()
+    stats = stream_evaluate(io.StringIO("\n".join(lines) + "\n"), out,
+                            lambda key: process_request(",".join(key), *policy), "csv", deny_only, chunk_size)
+    written = out.getvalue().splitlines()
+    assert written[0] == "user,resource,action,decision"
+    assert [line.split(",") for line in written[1:]] == expected
+
+    assert stats.malformed == len(MALFORMED)
+    assert stats.requests == len(lines) - len(MALFORMED) - len(SKIPPED)
+    assert stats.denies == sum(decision == "Deny" for *_, decision in expected_decisions(policy, lines))
+    assert stats.latencies.count == stats.requests
+
+
+@pytest.mark.parametrize("deny_only", [False, True])
+def test_jsonl(policy, deny_only):
+    lines = request_lines(policy, seed=1)
+    stats, written = run(policy, lines, "jsonl", deny_only)
+    records = [json.loads(line) for line in written]
+    assert [[record["user"], record["resource"], record["action"], record["decision"]] for record in records] == \
+        expected_decisions(policy, lines, deny_only)
+    assert stats.malformed == len(MALFORMED)
+
+
+def test_csv_through_decision_cache(policy):
+    lines = request_lines(policy, seed=2)
+    _stats, written = run(policy, lines, "csv")
+    assert [line.split(",") for line in written[1:]] == expected_decisions(policy, lines)
+
+
+@pytest.mark.parametrize("fmt", ["csv", "jsonl"])
+def test_cli(tmp_path, fmt):
+    policy_file = write_policy("healthcare", str(tmp_path))
+    policy = parse_abac_file(policy_file, snapshot=False)
+    lines = request_lines(policy, count=300, seed=3)
+    request_file = tmp_path / "requests.txt"
+    request_file.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    out_file = tmp_path / f"decisions.{fmt}"
+
+    result = subprocess.run([sys.executable, os.path.join(ROOT, "llm-research", "myabac.py"), "-s", policy_file,
+                             str(request_file), "--format", fmt, "--deny-only", "--output", str(out_file)],
+                            capture_output=True, text=True, check=True)
+    written = out_file.read_text(encoding="utf-8").splitlines()
+    if fmt == "csv":
+        decisions = [line.split(",") for line in written[1:]]
+    else:
+        decisions = [list(json.loads(line).values()) for line in written]
+    assert decisions == expected_decisions(policy, lines, deny_only=True)
+    assert f"malformed lines skipped: {len(MALFORMED)}" in result.stderr
+
+
+def test_unknown_format(policy):
+    with pytest.raises(ValueError):
+        stream_requests(io.StringIO("a,b,c\n"), io.StringIO(), *policy, fmt="xml")
+
+
+def nearest_rank(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def test_histogram_small_values_exact():
+    histogram = LatencyHistogram()
+    values = list(range(2 * SUB_BUCKETS)) * 3
+    for value in values:
+        histogram.record(value)
+    for pct in (0, 10, 50, 90, 99, 100):
+        assert histogram.percentile(pct) == nearest_rank(values, pct)
+    assert histogram.max == 2 * SUB_BUCKETS - 1
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_histogram_percentiles(seed):
+    rnd = random.Random(seed)
+    # latencies from 100 ns to a few ms, like the decisions of a stream
+    values = [int(rnd.lognormvariate(9, 1.5)) for _ in range(20000)]
+    histogram = LatencyHistogram()
+    for value in values:
+        histogram.record(value)
+
+    assert histogram.count == len(values)
+    assert histogram.max == max(values)
+    for pct in (1, 25, 50, 90, 99, 99.9, 100):
+        exact = nearest_rank(values, pct)
+        assert abs(histogram.percentile(pct) - exact) <= exact / SUB_BUCKETS, pct
+    # buckets grow with the log of the largest value, not with the number of requests
+    assert len(histogram.counts) < 64 * SUB_BUCKETS
+
+
+def test_histogram_buckets():
+    previous = -1
+    for value in range(1 << 16):
+        index = LatencyHistogram.bucket(value)
+        assert index >= previous
+        previous = index
+        assert abs(LatencyHistogram.bucket_value(index) - value) <= value / SUB_BUCKETS
+    assert LatencyHistogram().percentile(50) == 0